@@ -0,0 +1,126 @@
+"""
+distance totals over any range of dates without rescanning the rows
+
+an ActivityIndex holds the dates of the activities sorted, with a running
+sum of the distance alongside (overall, and for each label such as the shoe
+or the bike), so the total between two dates is two binary searches and a
+subtraction:
+    index = ActivityIndex(log.index, log["Distance miles"], labels=shoe)
+    index.total("2024-03-04", "2024-03-10")
+    index.totals("2024-03-04", "2024-03-10")  # {shoe: miles}
+    index.periods(yesterday)  # week, month, year to date, last 7/28/365 days
+    index.daily("2024-03-04", "2024-03-10")  # each day's distance
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# the rolling windows periods() reports, in days
+ROLLING = (7, 28, 365)
+# a difference of two running sums carries their rounding error (a month of
+# 369.3000000000011), far below any distance the sheets record; the totals
+# are rounded to this many places to drop it
+PLACES = 6
+
+
+def day(when) -> np.datetime64:
+    """
+    a date, datetime or "%Y-%m-%d" string as a numpy day
+    """
+    return np.datetime64(pd.Timestamp(when).date(), "D")
+
+
+class ActivityIndex:
+    """
+    :param dates - the date of each activity, undated (NaT) ones are ignored
+    :param distance - the distance of each, anything not a number counts 0
+    :param labels - optional label of each (eg the shoe), None for unlabelled,
+    which only count in the overall totals
+    """
+
+    def __init__(self, dates, distance, labels=None):
+        dates = pd.to_datetime(pd.Series(np.asarray(dates)), errors="coerce")
+        distance = pd.to_numeric(
+            pd.Series(np.asarray(distance, dtype=object)), errors="coerce"
+        ).fillna(0)
+        dated = dates.notna().values
+        order = np.argsort(dates.values[dated], kind="stable")
+        self.dates = dates.values[dated][order].astype("datetime64[D]")
+        miles = distance.values[dated][order].astype(float)
+        self.cumulative = np.concatenate(([0.0], np.cumsum(miles)))
+
+        if labels is None:
+            codes = np.full(len(miles), -1)
+            self.labels = []
+        else:
+            (codes, uniques) = pd.factorize(pd.Series(np.asarray(labels, dtype=object)))
+            codes = codes[dated][order]
+            self.labels = list(uniques)
+        # a running sum per label, a row each
+        self.by_label = np.zeros((len(self.labels), len(miles) + 1))
+        for k in range(len(self.labels)):
+            np.cumsum(np.where(codes == k, miles, 0.0), out=self.by_label[k, 1:])
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _span(self, start, end):
+        """
+        the positions of the first activity on or after start, and the first
+        after end
+        """
+        return (
+            np.searchsorted(self.dates, day(start), side="left"),
+            np.searchsorted(self.dates, day(end), side="right"),
+        )
+
+    def total(self, start, end, label=None) -> float:
+        """
+        the distance from start to end inclusive, for one label or all
+        """
+        (i, j) = self._span(start, end)
+        if label is None:
+            return round(float(self.cumulative[j] - self.cumulative[i]), PLACES)
+        if label not in self.labels:
+            return 0.0
+        k = self.labels.index(label)
+        return round(float(self.by_label[k, j] - self.by_label[k, i]), PLACES)
+
+    def totals(self, start, end) -> dict:
+        """
+        {label: distance} from start to end inclusive
+        """
+        (i, j) = self._span(start, end)
+        sums = self.by_label[:, j] - self.by_label[:, i]
+        return {label: round(float(s), PLACES) for label, s in zip(self.labels, sums)}
+
+    def daily(self, start, end, label=None) -> np.ndarray:
+        """
+        the distance on each day from start to end inclusive
+        """
+        days = np.arange(day(start), day(end) + np.timedelta64(2, "D"), dtype="datetime64[D]")
+        positions = np.searchsorted(self.dates, days, side="left")
+        if label is None:
+            cumulative = self.cumulative
+        elif label in self.labels:
+            cumulative = self.by_label[self.labels.index(label)]
+        else:
+            return np.zeros(len(days) - 1)
+        return np.round(np.diff(cumulative[positions]), PLACES)
+
+    def periods(self, when, label=None) -> dict:
+        """
+        the totals the report shows, as at the date `when`: its week (Monday
+        to Sunday), its month and year so far, and the rolling windows
+        """
+        when = pd.Timestamp(when).date()
+        monday = when - datetime.timedelta(days=when.weekday())
+        spans = {
+            "week": (monday, monday + datetime.timedelta(days=6)),
+            "month": (when.replace(day=1), when),
+            "year to date": (when.replace(month=1, day=1), when),
+        }
+        for days in ROLLING:
+            spans[f"{days} days"] = (when - datetime.timedelta(days=days - 1), when)
+        return {name: self.total(s, e, label) for name, (s, e) in spans.items()}
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+time and measure peak memory of extracting the almanac and BoE rates from
+saved copies of the pages, with the old whole-page BeautifulSoup parse
+("before") and the streaming web_sources parse ("after")
+
+    ./benchmarks/bench_html.py           # benchmark against the fixtures
+    ./benchmarks/bench_html.py --fetch   # save the live pages and use those
+
+fixtures/ holds small made up copies of the two pages (the almanac table
+in a tbody, as the live page has it), so the script runs out of the box;
+the pages --fetch saves go in fixtures/live/, and are used instead when
+they are there
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(HERE))
+import web_sources
+
+FIXTURES = os.path.join(HERE, "fixtures")
+LIVE = os.path.join(FIXTURES, "live")
+PAGES = {
+    "almanac": "http://southamptonweather.co.uk",
+    "boe": "https://www.bankofengland.co.uk/boeapps/database/Rates.asp?into=GBP",
+}
+
+
+def before_almanac(content):
+    """
+    the almanac extraction as it was, on a BeautifulSoup tree of the page
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, features="lxml")
+    for s in soup.find_all("td", "data1"):
+        if s.string and re.match("Moonrise", s.string):
+            rows = s.parent.parent.find_all("tr")
+            sun = "".join(
+                rows[i].contents[1].string + " " + rows[i].contents[3].string + "\n"
+                for i in (0, 1)
+            )
+            sun += "".join("\n" + t for t in rows[5].stripped_strings)
+            moon = rows[2].contents[1].string + " " + rows[2].contents[3].string
+    for s in soup.find_all("img", src=re.compile("moon", flags=re.IGNORECASE)):
+        moon += " " + s["alt"]
+    return sun + "\n" + moon
+
+
+def after_almanac(content):
+    (sun, moon, phase) = web_sources.parse_almanac(chunked(content))
+    return sun + "\n" + moon + " " + phase
+
+
+def before_boe(content):
+    """
+    the rates table as it was read, on a BeautifulSoup tree of the page
+    """
+    from bs4 import BeautifulSoup
+
+    c = BeautifulSoup(content, features="lxml")
+    return [
+        ([td.text for td in row.find_all("td")], row.text)
+        for row in c.find("table").find_all("tr")
+    ]
+
+
+def after_boe(content):
+    return web_sources.rate_rows(chunked(content))
+
+
+def chunked(content):
+    for i in range(0, len(content), web_sources.CHUNK):
+        yield content[i : i + web_sources.CHUNK]
+
+
+def measure(func, content, repeat):
+    """
+    best wall time of repeat calls, and the peak memory of one
+    (the extraction prints as it goes, keep that out of the results)
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _measure(func, content, repeat)
+
+
+def _measure(func, content, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(content)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def fetch():
+    import requests
+
+    os.makedirs(LIVE, exist_ok=True)
+    for name, url in PAGES.items():
+        r = requests.get(url, headers={"user-agent": "Whatever!"}, timeout=30)
+        with open(os.path.join(LIVE, name + ".html"), "wb") as f:
+            f.write(r.content)
+        print(f"saved {name}: {len(r.content)} bytes")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg_parser.add_argument("--fetch", action="store_true", help="save the live pages")
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    args = arg_parser.parse_args()
+    if args.fetch:
+        fetch()
+
+    results = {}
+    for name, (before, after) in {
+        "almanac": (before_almanac, after_almanac),
+        "boe": (before_boe, after_boe),
+    }.items():
+        path = os.path.join(LIVE, name + ".html")
+        if not os.path.exists(path):
+            path = os.path.join(FIXTURES, name + ".html")
+        if not os.path.exists(path):
+            print(f"no fixture {path}, run with --fetch to save the live page", file=sys.stderr)
+            continue
+        with open(path, "rb") as f:
+            content = f.read()
+        results[name] = {
+            "fixture": os.path.relpath(path, HERE),
+            "bytes": len(content),
+            "before": measure(before, content, args.repeat),
+            "after": measure(after, content, args.repeat),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
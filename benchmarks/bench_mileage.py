@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+offline benchmark of the running and bike mileage pipelines on synthetic
+logs, from one year up to decades of runs, reported as JSON
+
+    ./benchmarks/bench_mileage.py                    # default sizes
+    ./benchmarks/bench_mileage.py --years 1 10 30 --runs-per-year 365
+    ./benchmarks/bench_mileage.py --output bench.jsonl   # append, to track
+
+each step is timed on the same generated data:
+    shoe_manager    ShoeManager construction on the Shoes sheet
+    assign_names    ShoeTracker.assign_names applied per row (capped rows)
+    assign_all      ShoeTracker.assign_all over the whole log
+    mile_years_load ShoeMileYears.load of the year hashes
+    mile_years_save ShoeMileYears.save, queued on a WriteBuffer
+    run_mileage     the runMileage aggregation of the last year sheet
+    bike_mileage    the bikeMileage aggregation of the bike sheets
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(HERE))
+import pandas as pd
+import mileage
+import shoe_sheet
+import write_buffer
+
+ROUTES = [
+    "Upton park", "Holes Bay", "Hamworthy, Baiter", "Sandbanks", "town loop",
+    "canal, river", "Lytchett hills", "parkrun", "forest tracks", "track",
+]
+REMARKS = [
+    "", "", "", "easy", "tempo", "intervals 6x800", "long slow", "xc race",
+    "muddy xc", "recovery, legs tired", "hills", "club run",
+]
+BIKES = ["2014 Giant Talon 29er", "2017 Charge Grater", "2021 Giant Escape"]
+
+
+def shoes_sheet(first_year, years, rng):
+    """
+    a Shoes sheet with a few Road and XC shoes bought each year
+    """
+    rows = []
+    for y in range(first_year - 1, first_year + years):
+        for n, kind in enumerate(("Road", "Road", "XC")):
+            start = datetime.date(y, 1 + 4 * n, rng.randint(1, 28))
+            name = f"{y}{kind}-{rng.choice(['Pegasus', 'Ghost', 'Mudclaw', 'Talon'])}{n}"
+            hashes = "".join(
+                f"{yy}: {rng.uniform(0, 400):.1f}\n" for yy in range(y, first_year + years)
+            )
+            rows.append([start.strftime("%d/%m/%Y"), kind, name, "", "", "0", hashes or "{}\n"])
+    # object columns, as the sheet's mixed cells come back
+    return pd.DataFrame(
+        rows, columns=["Start Date", "Type", "Name", "Cost", "Retired", "YTD", "Years"],
+        dtype=object,
+    )
+
+
+def year_sheet(year, runs, shoes, rng):
+    """
+    a year of the running log; a run is sometimes named for its shoe
+    """
+    days = sorted(rng.sample(range(365), min(runs, 365))) if runs <= 365 else sorted(
+        rng.randrange(365) for _ in range(runs)
+    )
+    names = list(shoes["Name"])
+    rows = []
+    for d in days:
+        km = round(rng.choice([5, 5, 8, 10, 10.5, 12, 16, 21.2, 42.3]) * rng.uniform(0.95, 1.05), 2)
+        remark = rng.choice(REMARKS)
+        if rng.random() < 0.05:
+            remark += " " + rng.choice(names).split("-")[-1]
+        pace = rng.uniform(6.5, 10.5)
+        rows.append([
+            (datetime.date(year, 1, 1) + datetime.timedelta(days=d)).strftime("%d/%m/%Y"),
+            rng.choice(ROUTES), f"{km / 1.609 * pace:.0f}", km / 1.609, km, remark,
+            f"{int(pace)}:{int(pace % 1 * 60):02d}", "", "", "",
+        ])
+    # the skeleton row, formulas not yet filled in
+    rows.append(["", "", "", "#DIV/0!", "", "", "#DIV/0!", "", "", ""])
+    return pd.DataFrame(rows, columns=[
+        "Date", "Route", "Time", "Distance miles", "km", "Remarks", "Pace",
+        "Pace km", "Weather", "Notes",
+    ], dtype=object)
+
+
+def bike_sheets(year, rides, rng):
+    sheets = {}
+    for b in BIKES:
+        rows = []
+        total = 0
+        for d in sorted(rng.randrange(365) for _ in range(rides)):
+            miles = round(rng.uniform(5, 40), 1)
+            total += miles
+            rows.append([(datetime.date(year, 1, 1) + datetime.timedelta(days=d)).strftime("%d/%m/%Y"), miles, total, ""])
+        rows.append(["", "", "", ""])
+        frame = pd.DataFrame(rows, columns=["Date", "Miles", "Total", "Notes"], dtype=object)
+        if b == BIKES[0]:
+            # the Talon's sheet has no row of titles
+            frame.columns = range(4)
+        frame.name = b
+        sheets[b] = frame
+    return sheets
+
+
+def timed(results, step, size, func, *args):
+    """
+    time func(*args), keeping its prints out of the report
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        value = func(*args)
+        elapsed = time.perf_counter() - t0
+    results.append(dict(size, step=step, seconds=round(elapsed, 6)))
+    return value
+
+
+def bench(years, runs_per_year, apply_cap, seed):
+    rng = random.Random(seed)
+    last_year = 2026
+    first_year = last_year - years + 1
+    shoes_raw = shoes_sheet(first_year, years, rng)
+    log = {str(y): year_sheet(y, runs_per_year, shoes_raw, rng) for y in range(first_year, last_year + 1)}
+    rows = sum(len(f) for f in log.values())
+    size = {"years": years, "rows": rows, "shoes": len(shoes_raw)}
+    results = []
+
+    shoes = timed(results, "shoe_manager", size, shoe_sheet.ShoeManager, shoes_raw.copy())
+    runner = shoe_sheet.ShoeTracker(shoes, year=last_year)
+
+    whole = pd.concat(
+        [mileage.clean_run_sheet(f.copy()) for f in log.values()]
+    ).dropna(subset=["Remarks"])
+    whole = whole[whole.index.notna()]
+    some = whole.iloc[:apply_cap]
+    timed(results, "assign_names", dict(size, rows=len(some)), some.apply, runner.assign_names, "columns")
+    timed(results, "assign_all", dict(size, rows=len(whole)), runner.assign_all, whole)
+
+    writer = write_buffer.WriteBuffer(None)
+    shoes_w = shoe_sheet.ShoeManager(shoes_raw.copy(), writer=writer)
+    adder = shoe_sheet.ShoeMileYears(shoes_w, "Years")
+    timed(results, "mile_years_load", size, adder.load)
+    timed(results, "mile_years_save", size, adder.save)
+
+    def run_mileage():
+        gdfs = mileage.clean_run_sheet(log[str(last_year)].copy())
+        checkpoint = mileage.RunCheckpoint(None, str(last_year), mileage.shoes_hash(shoes))
+        (totals, index) = mileage.run_totals(gdfs, runner, checkpoint)
+        weekly = index.totals(f"{last_year}-03-02", f"{last_year}-03-08")
+        for k in weekly.keys():
+            if weekly[k] > 0:
+                adder.total(k, last_year, totals.shoe_totals[k])
+        adder.push_updates()
+        return totals
+
+    totals = timed(results, "run_mileage", dict(size, rows=len(log[str(last_year)])), run_mileage)
+
+    def pace_book():
+        book = mileage.PaceBook(None)
+        for year, frame in log.items():
+            if year != str(last_year):
+                book.add_year(year, mileage.clean_run_sheet(frame.copy()))
+        return [book.standings(totals, name) for name in mileage.DISTANCE_CLASSES]
+
+    timed(results, "pace_book", dict(size, rows=rows - len(log[str(last_year)])), pace_book)
+
+    bikes = bike_sheets(last_year, runs_per_year, rng)
+
+    def bike_mileage():
+        ledger = mileage.bike_ledger(bikes, mileage.bike_config(bikes, path=None))
+        mileage.bike_index(ledger)
+        return mileage.bike_totals(ledger, str(last_year), (f"{last_year}-03-02", f"{last_year}-03-08"))
+
+    timed(results, "bike_mileage", dict(size, rows=sum(len(b) for b in bikes.values())), bike_mileage)
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg_parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 10, 30])
+    arg_parser.add_argument("--runs-per-year", type=int, nargs="+", default=[365, 3334],
+                            help="3334 a year for 30 years is 100k rows")
+    arg_parser.add_argument("--apply-cap", type=int, default=5000,
+                            help="most rows to time the per row assign_names on")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--output", help="append the report to this JSONL file")
+    args = arg_parser.parse_args()
+
+    report = {
+        "when": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "results": [],
+    }
+    for years in args.years:
+        for runs in args.runs_per_year:
+            report["results"] += bench(years, runs, args.apply_cap, args.seed)
+
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(report) + "\n")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
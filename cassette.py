@@ -0,0 +1,167 @@
+"""
+record and replay of a run's network traffic, so that the report can be
+rebuilt (and profiled) with no network at all
+
+web requests go through a CassetteAdapter mounted on the shared session:
+recording saves each response's status, headers and body to the cassette
+directory, replaying serves them back and refuses anything not recorded.
+Drive lookups (file ids and modifiedTimes) are kept in drive.json, the
+sheets themselves are snapshots in the cassette's own SheetCache
+"""
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMiss(requests.ConnectionError):
+    """
+    a replayed run asked for something which wasn't recorded
+    """
+
+
+def request_key(request) -> str:
+    """
+    file name for a request: a hash of its method, url and body
+    """
+    h = hashlib.sha1(f"{request.method} {request.url}".encode())
+    if request.body:
+        h.update(request.body if isinstance(request.body, bytes) else request.body.encode())
+    return h.hexdigest()
+
+
+class CassetteAdapter(HTTPAdapter):
+    """
+    transport adapter which records responses to, or replays them from,
+    the cassette directory
+    """
+
+    def __init__(self, mode, directory, **kwargs):
+        assert mode in (RECORD, REPLAY)
+        super().__init__(**kwargs)
+        self.mode = mode
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, request):
+        return os.path.join(self.directory, request_key(request) + ".json")
+
+    def send(self, request, **kwargs):
+        if self.mode == REPLAY:
+            return self.replay(request)
+        response = super().send(request, **kwargs)
+        # read the body now, iter_content serves it from memory afterwards
+        body = response.content
+        with open(self._path(request), "w") as f:
+            json.dump(
+                {
+                    "method": request.method,
+                    "url": request.url,
+                    "status": response.status_code,
+                    "reason": response.reason,
+                    "headers": dict(response.headers),
+                    "body": base64.b64encode(body).decode("ascii"),
+                },
+                f,
+                indent=1,
+            )
+        logger.info(f"recorded {request.method} {request.url}")
+        return response
+
+    def replay(self, request):
+        try:
+            with open(self._path(request)) as f:
+                recorded = json.load(f)
+        except OSError:
+            raise CassetteMiss(f"no recording of {request.method} {request.url}")
+        body = base64.b64decode(recorded["body"])
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.reason = recorded["reason"]
+        response.headers = CaseInsensitiveDict(recorded["headers"])
+        # the body was stored decoded, it mustn't be decompressed again
+        response.headers.pop("Content-Encoding", None)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.raw = io.BytesIO(body)
+        response._content = body
+        response._content_consumed = True
+        response.connection = self
+        return response
+
+
+class DriveLog:
+    """
+    the drive file ids found by search, and their first modifiedTime, as
+    seen by a recorded run
+    """
+
+    def __init__(self, mode, directory):
+        self.mode = mode
+        self.path = os.path.join(directory, "drive.json")
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.log = json.load(f)
+        except (OSError, ValueError):
+            self.log = {"files": {}, "modified": {}}
+
+    def _save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.log, f, indent=1)
+
+    def file(self, search_string, gdoc=None):
+        """
+        record the file found for a search, or replay it as a ReplayFile
+        """
+        with self.lock:
+            if self.mode == RECORD:
+                self.log["files"][search_string] = gdoc.id
+                self._save()
+                return gdoc
+            if search_string not in self.log["files"]:
+                raise CassetteMiss(f"no recording of drive search {search_string!r}")
+            return ReplayFile(self.log["files"][search_string])
+
+    def modified(self, file_id, modified=None):
+        """
+        the first modifiedTime seen for a file, ie before the run's own writes,
+        which is the one its snapshot was taken at
+        """
+        with self.lock:
+            if self.mode == RECORD:
+                self.log["modified"].setdefault(file_id, modified)
+                self._save()
+                return modified
+            if file_id not in self.log["modified"]:
+                raise CassetteMiss(f"no recording of modifiedTime for {file_id}")
+            return self.log["modified"][file_id]
+
+
+class ReplayFile:
+    """
+    stands in for a gdriveFile during a replay: its sheets come from the
+    cassette's snapshots, and writes go nowhere
+    """
+
+    def __init__(self, file_id):
+        self.id = file_id
+
+    def toDataFrame(self, **kwargs):
+        raise CassetteMiss(f"no snapshot of {self.id} recorded with {kwargs}")
+
+    def addData(self, *args, **kwargs):
+        logger.info(f"replay, not writing {args} to {self.id}")
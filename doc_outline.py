@@ -0,0 +1,118 @@
+"""
+where the dated sections of the daily google doc are, kept up to date as
+the doc is edited rather than parsed again
+
+a DateOutline is built once from the doc's parsed outline: the start of
+every title, in document order, and the dated titles ("Update for Wed 27
+May 2020") sorted by date, each date parsed once. Finding the sections
+older than a date is then a binary search, and after an edit the
+positions after it are shifted in place:
+    outline = DateOutline.from_doc(doc)
+    ranges = outline.older(now - datetime.timedelta(hours=72))
+    ... send the edits ...
+    for (start, end) in ranges:
+        outline.deleted(start, end)
+"""
+import bisect
+import datetime
+
+DATE_FORMAT = "%a %d %b %Y"  # %a = Wed, %d = 27, %b = May, %Y = 2020
+
+
+def length(text):
+    """
+    the length of text as the Docs API counts it, in UTF-16 code units
+    """
+    return len(text.encode("utf-16-le")) // 2
+
+
+class DateOutline:
+    """
+    :param starts - the start of each title of the doc
+    :param dated - (date, start) of each dated title
+    :param extent - the end of the doc's body
+    """
+
+    def __init__(self, starts, dated, extent):
+        self.starts = sorted(starts)
+        self.dated = sorted(dated)
+        self.extent = extent
+
+    @classmethod
+    def from_doc(cls, doc, date_format=DATE_FORMAT):
+        """
+        the outline of a gdocHelper doc, from the outline it parsed: one
+        pass over the titles, findFirstDate carrying on from the last found
+        """
+        headings = doc.outline.headings
+        dated = []
+        index = -1
+        while True:
+            try:
+                (dateStr, index) = doc.outline.findFirstDate(after=index)
+            except Exception:
+                break  # no more dates
+            if index >= len(headings):
+                break
+            try:
+                date = datetime.datetime.strptime(dateStr, date_format)
+            except ValueError:
+                continue
+            dated.append((date, headings[index].startPos))
+        return cls([h.startPos for h in headings], dated, doc.docExtent)
+
+    def first(self):
+        """
+        the start of the first dated title in the doc, None if there isn't one
+        """
+        return min((start for (_, start) in self.dated), default=None)
+
+    def section(self, start):
+        """
+        the [start, end) of the section a title starts: up to the next
+        title, or the end of the doc less its final newline, which the Docs
+        API won't delete
+        """
+        i = bisect.bisect_right(self.starts, start)
+        return (start, self.starts[i] if i < len(self.starts) else self.extent - 1)
+
+    def between(self, start=None, end=None):
+        """
+        the [start, end) of every dated section from the date start up to
+        (not including) end, last in the doc first, so that deleting them in
+        turn leaves the rest in place
+        """
+        i = 0 if start is None else bisect.bisect_left(self.dated, (start,))
+        j = len(self.dated) if end is None else bisect.bisect_left(self.dated, (end,))
+        return sorted((self.section(s) for (_, s) in self.dated[i:j]), reverse=True)
+
+    def older(self, when):
+        """
+        the sections dated before when, as between()
+        """
+        return self.between(end=when)
+
+    def deleted(self, start, end):
+        """
+        the doc's [start, end) has been deleted: drop the titles in it and
+        move the ones after it back
+        """
+        gone = end - start
+        self.starts = [s if s < start else s - gone for s in self.starts if not start <= s < end]
+        self.dated = [
+            (d, s if s < start else s - gone) for (d, s) in self.dated if not start <= s < end
+        ]
+        self.extent -= gone
+
+    def inserted(self, at, size, title=None, date=None):
+        """
+        size units have been inserted at the position at, with a title
+        starting at the position title (dated date) among them
+        """
+        self.starts = [s if s < at else s + size for s in self.starts]
+        self.dated = [(d, s if s < at else s + size) for (d, s) in self.dated]
+        self.extent += size
+        if title is not None:
+            bisect.insort(self.starts, title)
+            if date is not None:
+                bisect.insort(self.dated, (date, title))
@@ -0,0 +1,128 @@
+"""
+a Keep login which carries on from the last run's
+
+a password login and a sync of the whole account are the slowest step of
+the update on the Pi. A KeepSession keeps the master token the first login
+gave, and the client's state (gkeepapi dump/restore) after each sync, so
+the next run resumes with the token and only syncs what changed since. The
+id of the label the report note is found by is kept too, and the note is
+only written (and synced) when its text has changed
+    session = KeepSession(gkeepapi.Keep())
+    session.login(user, password)
+    notes = session.notes("AppUniq")
+    session.publish(notes[0], title, text)
+"""
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+KEEP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "keep")
+
+
+def _write(path, obj, mode=0o600):
+    """
+    write json atomically, readable only by us as it holds the token
+    """
+    tmp = path + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class KeepSession:
+    """
+    :param keep - a gkeepapi.Keep
+    :param directory - where the token, state and label ids are kept
+    """
+
+    def __init__(self, keep, directory=KEEP_DIR):
+        self.keep = keep
+        self.directory = directory
+        self.token_path = os.path.join(directory, "token.json")
+        self.state_path = os.path.join(directory, "state.json")
+        self.labels_path = os.path.join(directory, "labels.json")
+        self.labels = _read(self.labels_path) or {}
+
+    def login(self, user, password):
+        """
+        resume with the stored token and state if there are any, else (or if
+        the token has been revoked) log in with the password; nothing is
+        synced yet
+        """
+        state = _read(self.state_path)
+        token = _read(self.token_path)
+        if token and token.get("user") == user:
+            try:
+                self._resume(user, token["master_token"], state)
+                logger.info("keep resumed with the stored token")
+                return
+            except Exception as err:
+                logger.info(f"keep token refused ({err}), logging in again")
+        self.keep.login(user, password, state=state, sync=False)
+        os.makedirs(self.directory, exist_ok=True)
+        _write(self.token_path, {"user": user, "master_token": self.keep.getMasterToken()})
+
+    def _resume(self, user, master_token, state):
+        # resume was renamed authenticate in later gkeepapi
+        authenticate = getattr(self.keep, "authenticate", None) or self.keep.resume
+        try:
+            authenticate(user, master_token, state=state, sync=False)
+        except Exception:
+            if state is None:
+                raise
+            logger.info("keep state not restored, starting from nothing")
+            authenticate(user, master_token, state=None, sync=False)
+
+    def sync(self):
+        """
+        sync the changes since the state was saved, and save the new state
+        """
+        self.keep.sync()
+        os.makedirs(self.directory, exist_ok=True)
+        _write(self.state_path, self.keep.dump())
+
+    def label(self, name):
+        """
+        the label called name, by its remembered id
+        """
+        label = None
+        if name in self.labels:
+            label = self.keep.getLabel(self.labels[name])
+        if label is None:
+            label = self.keep.findLabel(name)
+            if label is not None:
+                self.labels[name] = label.id
+                os.makedirs(self.directory, exist_ok=True)
+                _write(self.labels_path, self.labels)
+        return label
+
+    def notes(self, label_name):
+        """
+        the notes with the label, after syncing
+        """
+        self.sync()
+        return list(self.keep.find(labels=[self.label(label_name)]))
+
+    def publish(self, note, title, text):
+        """
+        write the note, and sync it, only if its text has changed. Returns
+        whether it was written
+        """
+        if note.text == text:
+            logger.info("keep note unchanged, not written")
+            return False
+        note.title = title
+        note.text = text
+        self.sync()
+        return True
@@ -0,0 +1,85 @@
+"""
+memory-lean versions of the sheets, for the Raspberry Pi
+
+toDataFrame hands every cell back as a python object; in lean mode the
+columns which hold only numbers become float32 and the columns with a few
+repeated labels (shoe Type, Route) become categoricals, which is usually a
+fraction of the memory. A MemoryReport keeps the before and after sizes so
+the saving can be printed.
+
+The frames are slimmed once they are loaded, so this is what the sections
+hold while they work, not the peak: a snapshot miss still has toDataFrame
+build every sheet of the workbook as objects first
+"""
+import numpy as np
+import pandas as pd
+
+
+def frame_bytes(frame) -> int:
+    """
+    the memory a DataFrame (or Series) holds, its python objects included
+    """
+    usage = frame.memory_usage(deep=True, index=True)
+    return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+
+
+def blank(values: pd.Series) -> pd.Series:
+    """
+    the cells which are empty, ie NaN or whitespace
+    """
+    return values.isna() | values.astype(str).str.strip().eq("")
+
+
+def slim(frame: pd.DataFrame, categorical=(), numeric=True) -> pd.DataFrame:
+    """
+    shrink a sheet in place (and return it): the named columns become
+    categoricals and, if numeric, every other column whose non blank cells
+    are all numbers becomes float32, blanks going to NaN
+    """
+    for col in frame.columns:
+        values = frame[col]
+        if col in categorical:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                frame[col] = values.astype("category")
+        elif not numeric:
+            continue
+        elif pd.api.types.is_float_dtype(values.dtype) or pd.api.types.is_integer_dtype(
+            values.dtype
+        ):
+            frame[col] = values.astype(np.float32)
+        elif values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            numbers = pd.to_numeric(values, errors="coerce")
+            filled = ~blank(values)
+            if filled.any() and numbers[filled].notna().all():
+                frame[col] = numbers.astype(np.float32)
+    return frame
+
+
+class MemoryReport:
+    """
+    the size of each frame before and after slimming
+    """
+
+    def __init__(self, title):
+        self.title = title
+        self.sizes = {}  # name -> (before, after)
+
+    def slim(self, name, frame, categorical=(), numeric=True):
+        """
+        slim the frame, recording its size before and after
+        """
+        before = frame_bytes(frame)
+        slim(frame, categorical=categorical, numeric=numeric)
+        self.sizes[name] = (before, frame_bytes(frame))
+        return frame
+
+    def text(self):
+        before = sum(b for b, _ in self.sizes.values())
+        after = sum(a for _, a in self.sizes.values())
+        lines = [
+            f"{self.title} lean frames: {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB, "
+            f"saved {(before - after) / 1e6:.2f} MB after loading"
+        ]
+        for name, (b, a) in self.sizes.items():
+            lines.append(f"  {name}: {b / 1e3:.0f} kB -> {a / 1e3:.0f} kB")
+        return "\n".join(lines)
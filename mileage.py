@@ -0,0 +1,444 @@
+"""
+the sums behind the running and bike sections of the daily update, kept
+apart from fetching the sheets so that they can be run (and timed) offline
+
+a RunCheckpoint holds the totals (and the shoe of each row) for the rows
+of a year's sheet already counted, so each run only folds in the rows added
+since; the totals for any range of dates then come from an ActivityIndex.
+The paces of earlier years are kept sorted in a PaceBook, so a run's rank
+among all the runs of its distance class is a binary search per year
+"""
+import argparse
+import bisect
+import collections
+import copy
+import json
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import run_metrics
+import sheet_schema
+import shoe_sheet
+from activity_index import ActivityIndex
+
+logger = logging.getLogger(__name__)
+
+DISTANCE = "Distance miles"
+BIKE_DISTANCE = "Miles"
+BIKE = "Bike"
+# which sheets of the bike workbook are bikes, see bike_config
+BIKES_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bikes.json")
+BIKE_SHEET = re.compile(r"\d{4} .+")
+BikeSheet = collections.namedtuple("BikeSheet", "name title_row")
+PACE = "Pace"
+PACE_SECONDS = "Pace seconds"  # added by clean_run_sheet, see sheet_schema.RUN_LOG
+# a run of at least this many km counts towards the class
+DISTANCE_CLASSES = {"5k": 5, "10k": 10, "Half Marathon": 21.1, "Marathon": 42.2}
+YEAR_SHEET = re.compile(r"\d{4}")
+
+
+def distance_classes(text) -> dict:
+    """
+    parse distance classes given as "name=km,name=km", eg "10k=10,parkrun=5"
+    """
+    classes = {}
+    for item in filter(None, (i.strip() for i in text.split(","))):
+        (name, _, km) = item.partition("=")
+        classes[name.strip()] = float(km)
+    return classes
+
+
+def distance_class_list(text) -> dict:
+    """
+    argparse type for --distance-classes: "name=km,name=km"
+    """
+    try:
+        classes = distance_classes(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected name=km,name=km not {text!r}")
+    if not classes:
+        raise argparse.ArgumentTypeError("no distance classes given")
+    return classes
+
+
+def rounded_pace(pace):
+    """
+    a pace as python seconds to 0.1s, so a float32 (lean) pace ties with the
+    same pace held as a float64; None for no pace
+    """
+    return None if pd.isna(pace) else round(float(pace), 1)
+
+
+def format_pace(seconds) -> str:
+    """
+    seconds as m:ss
+    """
+    (minutes, secs) = divmod(int(round(seconds)), 60)
+    return f"{minutes}:{secs:02d}"
+
+
+def clean_run_sheet(gdfs: pd.DataFrame, rejected=None) -> pd.DataFrame:
+    """
+    date index the sheet for a year of the running log, make the distance
+    columns numeric (blanks 0) and add the pace in seconds
+    :param rejected - a list to add the cells which didn't convert to
+    """
+    cells = sheet_schema.RUN_LOG.apply(gdfs)
+    if rejected is not None:
+        rejected.extend(cells)
+    return gdfs
+
+
+def row_hashes(gdfs: pd.DataFrame) -> list:
+    """
+    one hash per row of the sheet, to spot an edit to a row already counted
+    """
+    return pd.util.hash_pandas_object(gdfs.astype(str), index=True).tolist()
+
+
+def shoes_hash(shoes) -> int:
+    """
+    a hash of the columns of the Shoes sheet which decide the shoe for a run;
+    if they change every run has to be assigned again
+    """
+    cols = shoes.backing_sheet[["Start Date", "Type", "Name"]].astype(str)
+    return int(pd.util.hash_pandas_object(cols, index=True).sum())
+
+
+# what a RunCheckpoint saves, besides the year and shoes it is for
+CHECKPOINT_STATE = (
+    "rows", "last_date", "hashes", "labels", "total", "shoe_totals",
+    "distance_classes", "classes",
+)
+# bumped when what the checkpoint holds changes, to ignore older ones
+CHECKPOINT_VERSION = 4
+
+
+class RunCheckpoint:
+    """
+    totals for the first `rows` rows of one year's sheet
+    :param path - where the checkpoint is saved, None for one kept in memory
+    :param year - the year of the sheet
+    :param shoes - hash of the Shoes sheet the rows were assigned with
+    :param distance_classes - {name: km} of the classes to rank
+    """
+
+    def __init__(self, path, year, shoes, distance_classes=DISTANCE_CLASSES):
+        self.path = path
+        self.year = year
+        self.shoes = shoes
+        self.distance_classes = dict(distance_classes)
+        self.reset()
+
+    def reset(self):
+        """
+        forget everything counted so far
+        """
+        self.rows = 0
+        self.last_date = None
+        self.hashes = []
+        self.labels = []  # the shoe of each row
+        self.total = 0.0
+        self.shoe_totals = {}
+        self.classes = {
+            name: {"count": 0, "paces": [], "latest": None}
+            for name in self.distance_classes
+        }
+
+    @classmethod
+    def load(cls, path, year, shoes, distance_classes=DISTANCE_CLASSES):
+        """
+        the saved checkpoint, or an empty one if there isn't a usable one
+        """
+        checkpoint = cls(path, year, shoes, distance_classes)
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return checkpoint
+        if state["year"] != year or state["shoes"] != shoes:
+            logger.info(f"checkpoint {path} is for other shoes or year, ignoring")
+            return checkpoint
+        if state.get("version") != CHECKPOINT_VERSION:
+            logger.info(f"checkpoint {path} is an older version, ignoring")
+            return checkpoint
+        if state["distance_classes"] != checkpoint.distance_classes:
+            logger.info(f"checkpoint {path} has other distance classes, ignoring")
+            return checkpoint
+        for k in CHECKPOINT_STATE:
+            setattr(checkpoint, k, state[k])
+        return checkpoint
+
+    def save(self):
+        state = {k: getattr(self, k) for k in ("year", "shoes") + CHECKPOINT_STATE}
+        state["version"] = CHECKPOINT_VERSION
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, default=lambda o: o.item())
+        os.replace(tmp, self.path)
+
+    def fold(self, rows: pd.DataFrame, shoe: pd.Series, hashes: list):
+        """
+        add the rows (labelled with their shoe) to the totals
+        """
+        if len(rows) == 0:
+            return
+        self.rows += len(rows)
+        self.hashes.extend(hashes)
+        self.labels.extend(None if pd.isna(s) else str(s) for s in shoe)
+        self.last_date = str(rows.index[-1])
+        self.total += float(rows[DISTANCE].sum())
+        for k, v in rows[DISTANCE].groupby(shoe.values, observed=True).sum().items():
+            self.shoe_totals[k] = self.shoe_totals.get(k, 0.0) + float(v)
+        for name, paces in class_paces(rows, self.distance_classes).items():
+            cls = self.classes[name]
+            for pace in paces:
+                cls["count"] += 1
+                cls["latest"] = rounded_pace(pace)
+                if cls["latest"] is not None:
+                    bisect.insort(cls["paces"], cls["latest"])
+
+
+def class_paces(gdfs, distance_classes) -> dict:
+    """
+    {class name: pace seconds of each run in the class}, in sheet order
+    """
+    km = pd.to_numeric(gdfs["km"], errors="coerce").values
+    paces = gdfs[PACE_SECONDS].values
+    return {name: paces[km >= least] for name, least in distance_classes.items()}
+
+
+class PaceBook:
+    """
+    the sorted paces of each distance class for every earlier year, so that
+    ranking a run against all the years is a binary search in each
+    :param path - where the book is saved
+    :param distance_classes - {name: km}, a book for other classes is ignored
+    by load(), unless it is given None to take the book's own
+    """
+
+    def __init__(self, path, distance_classes=DISTANCE_CLASSES):
+        self.path = path
+        self.distance_classes = dict(distance_classes)
+        self.years = {}  # year -> {class name: sorted paces}
+        self.rows = {}  # year -> the sheet's last row when its paces were taken
+
+    @classmethod
+    def load(cls, path, distance_classes=DISTANCE_CLASSES):
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if distance_classes is None:
+            distance_classes = state["distance_classes"] if state else DISTANCE_CLASSES
+        book = cls(path, distance_classes)
+        if state and state["distance_classes"] == book.distance_classes:
+            book.years = state["years"]
+            book.rows = state["rows"]
+        return book
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {"distance_classes": self.distance_classes, "years": self.years,
+                 "rows": self.rows},
+                f,
+            )
+        os.replace(tmp, self.path)
+
+    def missing(self, last_row, before):
+        """
+        the year sheets of a workbook, given its {sheet: last row}, which are
+        earlier than the year `before` and not in the book, or have grown or
+        shrunk since they were added
+        """
+        return sorted(
+            name for name, rows in last_row.items()
+            if YEAR_SHEET.fullmatch(name) and name < before and self.rows.get(name) != rows
+        )
+
+    def add_year(self, year, gdfs, rows=None):
+        """
+        (re)record the paces of a cleaned year sheet, and its last row
+        """
+        self.years[year] = {
+            name: sorted(p for p in map(rounded_pace, paces) if p is not None)
+            for name, paces in class_paces(gdfs, self.distance_classes).items()
+        }
+        self.rows[year] = rows
+
+    def standings(self, checkpoint: RunCheckpoint, name):
+        """
+        for a distance class: (runs this year, rank of the latest run among
+        every year's, runs with a pace in every year, fastest pace ever).
+        Rank 1 is the fastest and ties share the higher rank, like
+        rank(method="max"); the rank is None if the latest run had no pace
+        """
+        cls = checkpoint.classes[name]
+        sorted_paces = [cls["paces"]] + [
+            year[name] for y, year in self.years.items() if y != checkpoint.year
+        ]
+        every = sum(len(p) for p in sorted_paces)
+        best = min((p[0] for p in sorted_paces if p), default=None)
+        if cls["count"] == 0 or cls["latest"] is None:
+            return (cls["count"], None, every, best)
+        rank = sum(bisect.bisect_right(p, cls["latest"]) for p in sorted_paces)
+        return (cls["count"], rank, every, best)
+
+
+def run_totals(gdfs, shoe_runner, checkpoint: RunCheckpoint, earlier=None):
+    """
+    fold the rows of a cleaned year sheet not already in the checkpoint into
+    it, and return the totals for the year with an index of its runs
+    :param earlier - optionally the cleaned sheet of the year before, which
+    goes in the index (without shoes) so rolling totals can reach back
+    returns (totals, index) where totals is a RunCheckpoint including every
+    row and index an ActivityIndex of the distances labelled by shoe
+    """
+    run_metrics.add("rows", len(gdfs))
+    hashes = row_hashes(gdfs)
+    dated = np.asarray(gdfs.index.notna())
+    # the checkpoint only ever covers the leading dated rows, the skeleton
+    # row at the bottom (and anything after it) is counted afresh each run
+    settled = len(dated) if dated.all() else int(np.argmin(dated))
+
+    done = checkpoint.rows
+    if done > settled or checkpoint.hashes != hashes[:done]:
+        logger.info("running log edited before the checkpoint, recounting the year")
+        checkpoint.reset()
+        done = 0
+
+    # only the rows after the checkpoint need their shoe working out
+    shoe = pd.Series(checkpoint.labels[:done] + [None] * (len(gdfs) - done), dtype=object)
+    shoe.iloc[done:] = shoe_runner.assign_all(gdfs.iloc[done:]).values
+    # a handful of names over the whole year
+    shoe = shoe.astype("category")
+
+    checkpoint.fold(
+        gdfs.iloc[done:settled], shoe.iloc[done:settled], hashes[done:settled]
+    )
+    totals = copy.deepcopy(checkpoint)
+    totals.fold(gdfs.iloc[settled:], shoe.iloc[settled:], hashes[settled:])
+
+    if earlier is None:
+        index = ActivityIndex(gdfs.index, gdfs[DISTANCE], shoe)
+    else:
+        index = ActivityIndex(
+            np.concatenate((earlier.index.values, gdfs.index.values)),
+            np.concatenate((earlier[DISTANCE].values, gdfs[DISTANCE].values)),
+            np.concatenate(([None] * len(earlier), np.asarray(shoe, dtype=object))),
+        )
+    return (totals, index)
+
+
+def year_shoe_totals(
+    year: str, gdfs: pd.DataFrame, shoes_sheet: pd.DataFrame, distance_classes=DISTANCE_CLASSES
+):
+    """
+    the miles run in each shoe in one year sheet of the running log, with the
+    shoes assigned as the daily update would. A module level function so
+    that a process pool can run a year per worker
+    :param shoes_sheet - the Shoes sheet as loaded
+    :param distance_classes - {name: km} of the PaceBook entry
+    returns (year, {shoe name: miles}, rows, the year's PaceBook entry)
+    """
+    clean_run_sheet(gdfs)
+    shoes = shoe_sheet.ShoeManager(shoes_sheet)
+    shoe = shoe_sheet.ShoeTracker(shoes, year=int(year)).assign_all(gdfs)
+    totals = pd.to_numeric(gdfs[DISTANCE], errors="coerce").groupby(shoe.values).sum()
+    book = PaceBook(None, distance_classes)
+    book.add_year(year, gdfs)
+    return (year, {k: float(v) for k, v in totals.items()}, len(gdfs), book.years[year])
+
+
+def bike_config(gdf, path=BIKES_CONFIG) -> list:
+    """
+    the bikes to count, as BikeSheets: those in the config file if there is
+    one, else every sheet of the workbook named for a bike ("2017 Charge
+    Grater"). The config is {sheet name: {"title_row": false}, ...} in the
+    order the report shows them; without title_row a sheet has a row of
+    titles if its columns include Miles
+    :param gdf - {sheet name: frame} of the bike workbook
+    :param path - the config file, None to use the sheet names
+    """
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            config = json.load(f)
+    else:
+        config = {name: {} for name in gdf if BIKE_SHEET.fullmatch(name)}
+    bikes = []
+    for name, spec in config.items():
+        if name not in gdf:
+            logger.warning(f"no sheet for the bike {name}")
+            continue
+        title_row = spec.get("title_row", BIKE_DISTANCE in gdf[name].columns)
+        bikes.append(BikeSheet(name, title_row))
+    return bikes
+
+
+def bike_ledger(gdf, bikes, rejected=None) -> pd.DataFrame:
+    """
+    every ride on the bikes, as rows of (Date, Bike, Miles), in one concat
+    :param gdf - {sheet name: frame} of the bike workbook
+    :param bikes - BikeSheets from bike_config, a sheet without a row of
+    titles is given those of the first which has one
+    :param rejected - a list to add the cells which didn't convert to
+    """
+    titles = next((gdf[b.name].columns for b in bikes if b.title_row), None)
+    rides = []
+    for bike in bikes:
+        frame = gdf[bike.name]
+        logger.debug("%s\n%s", bike.name, frame.head())
+        if not bike.title_row:
+            frame.columns = titles
+        cells = sheet_schema.BIKE_LOG.apply(
+            frame, bike.name, first_row=2 if bike.title_row else 1
+        )
+        if rejected is not None:
+            rejected.extend(cells)
+        rides.append(pd.DataFrame({
+            "Date": frame.index.values, BIKE: bike.name, BIKE_DISTANCE: frame[BIKE_DISTANCE].values
+        }))
+    if not rides:
+        rides.append(pd.DataFrame({
+            "Date": pd.Series(dtype="datetime64[ns]"), BIKE: [], BIKE_DISTANCE: []
+        }))
+    ledger = pd.concat(rides, ignore_index=True)
+    # the bikes in config order, so every bike has a total even without a ride
+    ledger[BIKE] = pd.Categorical(ledger[BIKE], categories=[b.name for b in bikes])
+    return ledger
+
+
+def bike_index(ledger: pd.DataFrame) -> ActivityIndex:
+    """
+    every ride on the bikes, labelled with the bike
+    """
+    return ActivityIndex(ledger["Date"], ledger[BIKE_DISTANCE], ledger[BIKE])
+
+
+def bike_totals(ledger: pd.DataFrame, year, week):
+    """
+    the year's and the week's miles for each bike, as
+    {"Miles<bike>": year, "weekMiles<bike>": week, ...}
+    :param week - (start, end) inclusive dates as "%Y-%m-%d" strings
+    """
+    dates = ledger["Date"]
+    miles = ledger[BIKE_DISTANCE].astype(float)
+    spans = pd.DataFrame({
+        "year": miles.where(dates.dt.year == int(year), 0.0),
+        "week": miles.where(dates.between(week[0], week[1]), 0.0),
+    })
+    sums = spans.groupby(ledger[BIKE], observed=False).sum()
+    totals = {}
+    for bike, row in sums.iterrows():
+        totals[BIKE_DISTANCE + bike] = float(row["year"])
+        totals["week" + BIKE_DISTANCE + bike] = float(row["week"])
+    return totals
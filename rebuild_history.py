@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""
+rebuild every shoe's miles for every year of the running log and check them
+against the year hashes stored in the Shoes sheet
+
+the daily update only rewrites the current year's entry for the shoes worn
+that week, so an edit to an old year's sheet (or to the Shoes sheet) leaves
+the stored history wrong. This assigns the shoes for each year sheet in a
+process pool, a year per worker, diffs the totals with the stored hashes
+and, with --write, sends the corrections (and the YTDs of the shoes
+affected) in one batch. The sorted paces of each year's distance classes,
+which the daily update ranks runs against, are refreshed as well
+
+    rebuild_history.py [--write] [--workers N] [--from-year YYYY] [--tolerance 0.05]
+        [--distance-classes "5k=5,10k=10"]
+
+the paces are taken for the distance classes the pace book already holds
+(the daily update's --distance-classes), unless others are given
+"""
+import argparse
+import concurrent.futures
+import logging
+import os
+import sys
+
+import mileage
+import shoe_sheet
+import sheet_cache
+import transport
+import write_buffer
+
+logger = logging.getLogger(__name__)
+
+YEARS_COLUMN = 6  # where the Shoes sheet holds each shoe's year hashes
+
+
+def rebuild(year_sheets, shoes_raw, workers=None, distance_classes=mileage.DISTANCE_CLASSES):
+    """
+    the shoe totals and class paces for every year sheet, worked out a year
+    per process
+    returns ({year: {shoe name: miles}}, {year: {class: sorted paces}},
+    {year: error text})
+    """
+    totals = {}
+    paces = {}
+    failed = {}
+    if workers == 1:
+        # in process, handy under a debugger
+        for year, gdfs in year_sheets.items():
+            try:
+                (_, totals[year], _, paces[year]) = mileage.year_shoe_totals(
+                    year, gdfs, shoes_raw.copy(), distance_classes
+                )
+            except Exception as err:
+                failed[year] = repr(err)
+        return (totals, paces, failed)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(mileage.year_shoe_totals, year, gdfs, shoes_raw, distance_classes): year
+            for year, gdfs in year_sheets.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            year = futures[future]
+            try:
+                (_, totals[year], rows, paces[year]) = future.result()
+                logger.info(f"{year}: {rows} rows")
+            except Exception as err:
+                failed[year] = repr(err)
+    return (totals, paces, failed)
+
+
+def differences(adder, totals, tolerance=0.05, from_year=None):
+    """
+    the (row, year, stored, rebuilt) of each shoe and year whose stored miles
+    are more than tolerance out, or missing when the shoe was run in that year.
+    Years before from_year (default, the first year stored) aren't checked
+    """
+    shoes = adder.shoe_manager
+    if from_year is None:
+        from_year = adder.first_year or 0
+    diffs = []
+    for year, by_name in sorted(totals.items()):
+        if int(year) < from_year:
+            continue
+        for row in range(len(adder.miles)):
+            rebuilt = by_name.get(shoes.idx_to_name(row), 0.0)
+            stored = adder.stored(row, int(year))
+            if stored is None and rebuilt == 0:
+                continue
+            if stored is None or abs(stored - rebuilt) > tolerance:
+                diffs.append((row, int(year), stored, rebuilt))
+    return diffs
+
+
+def correct(adder, diffs):
+    """
+    put the rebuilt miles in the hashes, and make the YTD of each shoe
+    corrected the sum of all its years again
+    """
+    sheet = adder.shoe_manager.backing_sheet
+    ytdIndex = sheet.columns.get_loc("YTD")
+    for (row, year, _, rebuilt) in diffs:
+        adder.set_year(row, year, rebuilt)
+    for row in sorted({row for (row, _, _, _) in diffs}):
+        sheet.iloc[row, ytdIndex] = float(adder.miles[row].sum())
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Rebuild the shoe mileage history and check the Shoes sheet"
+    )
+    arg_parser.add_argument("-d", "--debug", action="store_true", help="turn on debugging")
+    arg_parser.add_argument(
+        "--write", action="store_true", help="write the corrections back to the sheet"
+    )
+    arg_parser.add_argument(
+        "--workers", type=int, default=None, help="processes to use (default: one per cpu)"
+    )
+    arg_parser.add_argument(
+        "--from-year",
+        type=int,
+        default=None,
+        help="first year to check (default: the first year the sheet holds)",
+    )
+    arg_parser.add_argument(
+        "--tolerance", type=float, default=0.05, help="miles a stored year may be out by"
+    )
+    arg_parser.add_argument(
+        "--distance-classes",
+        type=mileage.distance_class_list,
+        default=None,
+        metavar="LIST",
+        help="the pace book's distance classes, eg 5k=5,10k=10 (default: those it holds)",
+    )
+    args = arg_parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.ERROR)
+
+    cache = sheet_cache.SheetCache()
+    with transport.google():
+        gdoc = transport.find_drive_file("name contains 'running log'")
+        modified = transport.modified_time(gdoc)
+        # the same columns as the daily update, so they share the snapshot
+        snapshot = cache.frames(
+            gdoc, gdoc.id, modified, usecols=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+        )
+    gdf = snapshot.frames
+    year_sheets = {name: gdf[name] for name in gdf if mileage.YEAR_SHEET.fullmatch(name)}
+    print(f"rebuilding {len(year_sheets)} years: {', '.join(sorted(year_sheets))}")
+
+    # the classes the daily update keeps the book in, unless told otherwise
+    book = mileage.PaceBook.load(
+        os.path.join(cache.directory, "pace-book.json"), args.distance_classes
+    )
+    (totals, paces, failed) = rebuild(
+        year_sheets, gdf[shoe_sheet.SHEET].copy(), args.workers, book.distance_classes
+    )
+    for year, err in sorted(failed.items()):
+        print(f"{year}: couldn't rebuild, {err}")
+
+    # the current year's paces are the daily update's checkpoint, not the book's
+    current = max(year_sheets, default=None)
+    for year in paces:
+        if year != current:
+            book.years[year] = paces[year]
+            book.rows[year] = snapshot.last_row[year]
+    book.save()
+
+    writer = write_buffer.WriteBuffer(gdoc)
+    shoes = shoe_sheet.ShoeManager(gdf[shoe_sheet.SHEET], handle=gdoc, writer=writer)
+    adder = shoe_sheet.ShoeMileYears(shoes, YEARS_COLUMN)
+    adder.load()
+
+    diffs = differences(adder, totals, args.tolerance, args.from_year)
+    for (row, year, stored, rebuilt) in diffs:
+        was = "missing" if stored is None else f"{stored:.1f}"
+        print(f"{shoes.idx_to_name(row)} {year}: stored {was} rebuilt {rebuilt:.1f}")
+    print(f"{len(diffs)} shoe years differ")
+
+    if diffs and args.write:
+        correct(adder, diffs)
+        adder.push_updates()
+        with transport.google():
+            writer.flush()
+        print("corrections written")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+when each section of the report is next due in the long running (daemon)
+mode of update_note, and the ways to ask for a refresh now
+
+the almanac and the week only change with the day, the exchange rates a
+few times a day and the mileage whenever a sheet is edited; a mileage
+refresh is cheap when nothing changed (one modifiedTime call, then the
+cached result) so the sheets are simply polled. A refresh can be asked for
+at any time with SIGUSR1, or a line on the daemon's unix socket:
+    update_note.py --refresh almanac,fx
+"""
+import datetime
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DAILY = "daily"
+# seconds between refreshes of each section, or DAILY for once a day
+REFRESH = {
+    "almanac": DAILY,
+    "fx": 3 * 3600,
+    "bike": 10 * 60,
+    "run": 10 * 60,
+    "load": 10 * 60,
+    "week": DAILY,
+}
+
+
+def next_midnight(now):
+    day = datetime.date.fromtimestamp(now) + datetime.timedelta(days=1)
+    return time.mktime(day.timetuple())
+
+
+class Scheduler:
+    """
+    :param refresh - {section: seconds or DAILY}
+    """
+
+    def __init__(self, refresh):
+        self.refresh = dict(refresh)
+        self.last = {}  # section -> when it was last refreshed
+
+    def _next(self, name):
+        """
+        when a section is next due, 0 if it has never run
+        """
+        if name not in self.last:
+            return 0
+        every = self.refresh[name]
+        if every == DAILY:
+            return next_midnight(self.last[name])
+        return self.last[name] + every
+
+    def due(self, now):
+        """
+        the sections due a refresh at now
+        """
+        return {name for name in self.refresh if self._next(name) <= now}
+
+    def done(self, names, now):
+        for name in names:
+            if name in self.refresh:
+                self.last[name] = now
+
+    def wait(self, now):
+        """
+        seconds until the next section is due
+        """
+        return max(min((self._next(n) for n in self.refresh), default=3600) - now, 0)
+
+
+class Trigger:
+    """
+    collects requests for an immediate refresh, from a signal or the socket
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.requested = set()
+        # set by the signal handler, which mustn't take self.lock: the signal
+        # may arrive while the main thread holds it in wait()
+        self.signalled = False
+        self.server = None
+        self.path = None
+
+    def request(self, names=("all",)):
+        """
+        ask for the sections to be refreshed now, "all" for every one
+        """
+        with self.lock:
+            self.requested.update(names)
+        self.event.set()
+
+    def wait(self, timeout):
+        """
+        wait up to timeout seconds for a request, returns the sections asked
+        for (maybe "all"), empty if none was
+        """
+        self.event.wait(timeout)
+        with self.lock:
+            self.event.clear()
+            (names, self.requested) = (self.requested, set())
+            if self.signalled:
+                self.signalled = False
+                names.add("all")
+        return names
+
+    def listen_signal(self, signum=signal.SIGUSR1):
+        """
+        refresh everything on the signal; call from the main thread
+        """
+        signal.signal(signum, self._signal)
+
+    def _signal(self, *_):
+        # only flag it and wake the waiter, which does the bookkeeping
+        self.signalled = True
+        self.event.set()
+
+    def serve(self, path):
+        """
+        accept "refresh [section,...]" lines on a unix socket at path
+        """
+        if os.path.exists(path):
+            os.unlink(path)  # left by a daemon which didn't exit cleanly
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        os.chmod(path, 0o600)
+        self.server.listen(4)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                (conn, _) = self.server.accept()
+            except OSError:
+                return  # closed
+            with conn:
+                words = conn.makefile().readline().split()
+                if words[:1] == ["refresh"]:
+                    names = [n for n in "".join(words[1:]).split(",") if n]
+                    self.request(names or ("all",))
+                    conn.sendall(b"ok\n")
+                else:
+                    conn.sendall(b"unknown command\n")
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            os.unlink(self.path)
+            self.server = None
+
+
+def send(path, names=()):
+    """
+    ask the daemon listening at path to refresh the sections (all if none),
+    returns its reply
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(path)
+        conn.sendall(f"refresh {','.join(names)}\n".encode())
+        return conn.makefile().readline().strip()
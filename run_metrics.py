@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""
+timing and resource metrics for each section of a run, and each major step
+within one, appended to a JSONL file so that runs can be compared over time
+
+    with run_metrics.measure("run"):
+        with run_metrics.measure("assign_all"):
+            ...
+            run_metrics.add("rows", len(log))
+
+a measurement records its wall time, the bytes fetched over http, the rows
+processed, the google API calls made and the peak RSS of the process when
+it finished. Counters go to every measurement open in the current thread,
+so a section's totals include its steps'. Nothing is recorded unless a
+Run has been started, so library code can call add() and measure() freely.
+
+run as a script to summarise the metrics file:
+    run_metrics.py [--file metrics.jsonl] [--runs 10]
+"""
+import argparse
+import contextlib
+import datetime
+import functools
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not on windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "cache", "metrics.jsonl"
+)
+COUNTERS = ("bytes", "rows", "api_calls")
+
+_run = None
+_local = threading.local()
+
+
+def peak_rss_mb():
+    """
+    the high water mark of the process's resident memory, in MB
+    """
+    if resource is None:
+        return None
+    # kilobytes on linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class Run:
+    """
+    the measurements of one run of the update
+    """
+
+    def __init__(self):
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.records = []
+        self.lock = threading.Lock()
+
+    def save(self, path=METRICS_FILE):
+        """
+        append the records to the metrics file; a section still running
+        (because it timed out) is saved with the time so far and finished false
+        """
+        now = time.monotonic()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock, open(path, "a") as f:
+            for record in self.records:
+                record = dict(record)
+                start = record.pop("_start")
+                if not record["finished"]:
+                    record["wall"] = round(now - start, 3)
+                f.write(json.dumps(record) + "\n")
+
+
+def start():
+    """
+    begin recording a run, returns the Run
+    """
+    global _run
+    _run = Run()
+    return _run
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextlib.contextmanager
+def measure(name):
+    """
+    record a section, or a step within the measurement already open
+    """
+    if _run is None:
+        yield None
+        return
+    stack = _stack()
+    record = {
+        "run": _run.started,
+        "section": stack[0]["section"] if stack else name,
+        "step": name if stack else None,
+        "wall": None,
+        **{c: 0 for c in COUNTERS},
+        "peak_rss_mb": None,
+        "finished": False,
+        "ok": False,
+        "_start": time.monotonic(),
+    }
+    with _run.lock:
+        _run.records.append(record)
+    stack.append(record)
+    try:
+        yield record
+        record["ok"] = True
+    finally:
+        stack.pop()
+        record["wall"] = round(time.monotonic() - record["_start"], 3)
+        record["peak_rss_mb"] = peak_rss_mb()
+        record["finished"] = True
+        logger.info(
+            f"{record['section']}/{record['step'] or '-'} {record['wall']}s "
+            + " ".join(f"{c}={record[c]}" for c in COUNTERS)
+        )
+
+
+def add(counter, n=1):
+    """
+    add n to a counter of every measurement open in this thread
+    """
+    for record in getattr(_local, "stack", ()):
+        record[counter] += n
+
+
+def measured(name):
+    """
+    decorator measuring each call of a function, eg
+        @run_metrics.measured("assign_all")
+    """
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def count_response(response, *args, **kwargs):
+    """
+    requests response hook: count the body's bytes as they are read, to the
+    measurements open in the thread which made the request
+    """
+    stack = list(getattr(_local, "stack", ()))
+    if not stack:
+        return response
+    if isinstance(response._content, bytes):
+        # already read, eg replayed from a cassette
+        for record in stack:
+            record["bytes"] += len(response._content)
+        return response
+    read = response.raw.read
+
+    def counted_read(*args, **kwargs):
+        data = read(*args, **kwargs)
+        for record in stack:
+            record["bytes"] += len(data)
+        return data
+
+    response.raw.read = counted_read
+    return response
+
+
+def load(path=METRICS_FILE):
+    records = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    return records
+
+
+def summarise(records, runs=10):
+    """
+    a table of each section (and step) over the last `runs` runs: how often
+    it failed, the median and latest wall time, the latest against the median
+    of the runs before, and the median counters
+    """
+    recent = sorted({r["run"] for r in records})[-runs:]
+    groups = {}
+    for r in records:
+        if r["run"] in recent:
+            groups.setdefault((r["section"], r["step"] or ""), []).append(r)
+
+    lines = [
+        f"{len(recent)} runs from {recent[0]} to {recent[-1]}" if recent else "no runs",
+        f"{'section':<10} {'step':<16} {'runs':>4} {'fail':>4} {'median s':>9} "
+        f"{'last s':>8} {'trend':>7} {'bytes':>9} {'rows':>7} {'api':>5} {'rss MB':>7}",
+    ]
+    for (section, step), rs in sorted(groups.items()):
+        walls = [r["wall"] for r in rs if r["wall"] is not None]
+        before = walls[:-1]
+        trend = (
+            f"{(walls[-1] / statistics.median(before) - 1) * 100:+.0f}%"
+            if before and statistics.median(before) > 0
+            else "-"
+        )
+        rss = [r["peak_rss_mb"] for r in rs if r["peak_rss_mb"] is not None]
+        lines.append(
+            f"{section:<10} {step:<16} {len(rs):>4} "
+            f"{sum(not r['ok'] for r in rs):>4} "
+            f"{statistics.median(walls):>9.2f} {walls[-1]:>8.2f} {trend:>7} "
+            f"{statistics.median(r['bytes'] for r in rs):>9.0f} "
+            f"{statistics.median(r['rows'] for r in rs):>7.0f} "
+            f"{statistics.median(r['api_calls'] for r in rs):>5.0f} "
+            f"{max(rss) if rss else '-':>7}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Summarise the update's run metrics")
+    arg_parser.add_argument("--file", default=METRICS_FILE, help="the metrics JSONL file")
+    arg_parser.add_argument("--runs", type=int, default=10, help="how many recent runs")
+    args = arg_parser.parse_args(argv)
+    print(summarise(load(args.file), runs=args.runs))
+
+
+if __name__ == "__main__":
+    main()
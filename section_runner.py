@@ -0,0 +1,91 @@
+"""
+run the sections of the daily update concurrently on a thread pool
+
+each section is a function with its own deadline, and may name other sections
+it has to wait for. A section which fails or overruns its deadline is given
+its failure text instead, so one hung web page can't hold up the rest
+"""
+import concurrent.futures
+import logging
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+class Section:
+    """
+    one unit of work in the update
+    :param name - key for the section's result
+    :param func - called with a dict of the results of the sections in after=
+    :param after - names of the sections which must finish first
+    :param timeout - seconds allowed from when the section starts
+    :param failure - result to use if the section raises or times out
+    """
+
+    def __init__(self, name, func, after=(), timeout=120, failure=None):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.timeout = timeout
+        self.failure = failure
+
+    def __repr__(self):
+        return f"Section({self.name!r}, after={self.after}, timeout={self.timeout})"
+
+
+def run_sections(sections, max_workers=4):
+    """
+    run every section as soon as the ones it depends on have finished
+    returns {name: result} in the order the sections were declared
+    """
+    by_name = {s.name: s for s in sections}
+    for s in sections:
+        missing = set(s.after) - set(by_name)
+        assert not missing, f"{s.name} depends on unknown sections {missing}"
+
+    results = {}
+    waiting = list(sections)
+    running = {}  # future -> (section, deadline)
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while waiting or running:
+            for s in [s for s in waiting if set(s.after) <= set(results)]:
+                waiting.remove(s)
+                needs = {n: results[n] for n in s.after}
+                logger.debug(f"starting {s.name}")
+                running[pool.submit(s.func, needs)] = (s, time.monotonic() + s.timeout)
+
+            if not running:
+                # everything left waits on something that can never finish
+                for s in waiting:
+                    results[s.name] = s.failure
+                break
+
+            next_deadline = min(deadline for _, deadline in running.values())
+            done, _ = concurrent.futures.wait(
+                running,
+                timeout=max(next_deadline - time.monotonic(), 0),
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                s, _ = running.pop(future)
+                try:
+                    results[s.name] = future.result()
+                except Exception:
+                    print(f"section {s.name} failed")
+                    traceback.print_exc()
+                    results[s.name] = s.failure
+
+            now = time.monotonic()
+            for future, (s, deadline) in list(running.items()):
+                if deadline <= now:
+                    # the thread can't be killed, but we stop waiting for it
+                    print(f"section {s.name} timed out after {s.timeout}s")
+                    running.pop(future)
+                    future.cancel()
+                    results[s.name] = s.failure
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return {s.name: results[s.name] for s in sections}
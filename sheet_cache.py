@@ -0,0 +1,158 @@
+"""
+local snapshots of google spreadsheets, so that a workbook which hasn't
+changed since the last run is read from disk instead of downloaded
+
+each workbook is stored as one Feather file per sheet (or a pickle when
+pyarrow isn't installed), next to a meta.json holding the Drive
+modifiedTime it was taken at. The computed result of a section can be
+stored against a modifiedTime too, so an unchanged workbook skips the
+computation as well as the download
+"""
+import importlib.util
+import json
+import logging
+import os
+
+import pandas as pd
+
+import run_metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+HAVE_ARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+class Snapshot:
+    """
+    what toDataFrame gave us for a workbook, plus what we need of the gdoc
+    :param frames - {sheet name: DataFrame}
+    :param last_row - {sheet name: last row number}, as gdoc.lastRow
+    :param modified - Drive modifiedTime of the workbook
+    :param fresh - True if just downloaded, False if read from disk
+    """
+
+    def __init__(self, frames, last_row, modified, fresh):
+        self.frames = frames
+        self.last_row = last_row
+        self.modified = modified
+        self.fresh = fresh
+
+
+class SheetCache:
+    """
+    snapshot store, one directory per drive file id
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    def _dir(self, file_id):
+        return os.path.join(self.directory, file_id)
+
+    def _read_meta(self, file_id):
+        try:
+            with open(os.path.join(self._dir(file_id), "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def frames(self, gdoc, file_id, modified, usecols, sheets=None) -> Snapshot:
+        """
+        the workbook's sheets as DataFrames: from disk if the snapshot was
+        taken at `modified` with the same columns, otherwise downloaded
+        with gdoc.toDataFrame and saved for next time.
+        :param sheets - only return these sheets, skipping any the workbook
+        doesn't have (all are still saved)
+        """
+        meta = self._read_meta(file_id)
+        if meta and meta["modified"] == modified and meta["usecols"] == list(usecols):
+            logger.info(f"snapshot hit for {file_id} at {modified}")
+            wanted = meta["sheets"] if sheets is None else sheets
+            frames = {
+                s: self._load(file_id, meta["sheets"][s])
+                for s in wanted
+                if s in meta["sheets"]
+            }
+            return Snapshot(frames, meta["last_row"], modified, fresh=False)
+
+        logger.info(f"snapshot miss for {file_id}, downloading")
+        run_metrics.add("api_calls")
+        gdf = gdoc.toDataFrame(usecols=usecols)
+        last_row = dict(gdoc.lastRow)
+        self._save(file_id, gdf, last_row, modified, usecols)
+        if sheets is None:
+            frames = dict(gdf.items())
+        else:
+            frames = {s: gdf[s] for s in sheets if s in gdf}
+        return Snapshot(frames, last_row, modified, fresh=True)
+
+    def _save(self, file_id, gdf, last_row, modified, usecols):
+        path = self._dir(file_id)
+        os.makedirs(path, exist_ok=True)
+        sheets = {}
+        for i, (name, frame) in enumerate(gdf.items()):
+            sheets[name] = {"file": str(i), "name": getattr(frame, "name", name)}
+            sheets[name]["format"] = self._store(frame, os.path.join(path, str(i)))
+        meta = {
+            "modified": modified,
+            "usecols": list(usecols),
+            "last_row": last_row,
+            "sheets": sheets,
+        }
+        # write the meta last, so a half written snapshot is never trusted
+        self._write_json(os.path.join(path, "meta.json"), meta)
+
+    @staticmethod
+    def _store(frame, stem):
+        if HAVE_ARROW:
+            try:
+                frame.reset_index(drop=True).to_feather(stem + ".feather")
+                return "feather"
+            except (ValueError, TypeError) as err:
+                # eg duplicate or blank column titles
+                logger.info(f"can't store {stem} as feather ({err}), pickling")
+        frame.to_pickle(stem + ".pkl")
+        return "pickle"
+
+    def _load(self, file_id, sheet):
+        stem = os.path.join(self._dir(file_id), sheet["file"])
+        if sheet["format"] == "feather":
+            frame = pd.read_feather(stem + ".feather")
+        else:
+            frame = pd.read_pickle(stem + ".pkl")
+        frame.name = sheet["name"]  # toDataFrame names each frame after its sheet
+        return frame
+
+    def result(self, section, modified, key):
+        """
+        the result stored for section, if it was computed for the same key
+        (eg the week's dates) against the workbook at `modified`
+        """
+        try:
+            with open(os.path.join(self.directory, f"result-{section}.json")) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if stored["modified"] == modified and stored["key"] == str(key):
+            return stored["result"]
+        return None
+
+    def store_result(self, section, modified, key, result):
+        """
+        remember a section's result against the workbook's modifiedTime,
+        which should be read after any writes the section made
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._write_json(
+            os.path.join(self.directory, f"result-{section}.json"),
+            {"modified": modified, "key": str(key), "result": result},
+        )
+
+    @staticmethod
+    def _write_json(path, obj):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            # numpy scalars sneak into the results, .item() makes them python
+            json.dump(obj, f, default=lambda o: o.item())
+        os.replace(tmp, path)
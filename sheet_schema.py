@@ -0,0 +1,213 @@
+"""
+the column types of each family of sheets the update reads, and their
+conversion from the cells toDataFrame hands back
+
+a Schema names the columns of a sheet it needs and what each holds, and
+converts each in one vectorized step: numbers with to_numeric, dates with
+to_datetime against the sheet's date format (no per row inference). A cell
+which had something in it that didn't convert is rejected: it becomes the
+column's blank value and is returned, so the caller can report it
+    rejected = sheet_schema.RUN_LOG.apply(frame, "2024")
+    print(sheet_schema.describe(rejected))
+
+blank cells, and the errors of formulas not yet filled in (#DIV/0! on a
+skeleton row), are blank rather than rejected
+"""
+import collections
+import dataclasses
+import logging
+
+import numpy as np
+import pandas as pd
+
+import run_metrics
+
+logger = logging.getLogger(__name__)
+
+# how the workbooks show a date
+DATE_FORMAT = "%d/%m/%Y"
+
+DATE = "date"
+NUMBER = "number"
+DURATION = "duration"
+TEXT = "text"
+
+# row is the sheet's row number
+Rejected = collections.namedtuple("Rejected", "sheet column row value")
+
+
+def blank(values: pd.Series) -> pd.Series:
+    """
+    the cells which are empty (NaN or whitespace) or hold a formula error
+    """
+    text = values.astype(str).str.strip()
+    return values.isna().values | (text.eq("") | text.str.startswith("#")).values
+
+
+def dates(values: pd.Series, date_format=DATE_FORMAT) -> pd.Series:
+    """
+    the cells as datetimes, NaT for any which aren't a date in the format
+    """
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values
+    return pd.to_datetime(values, format=date_format, errors="coerce")
+
+
+def numbers(values: pd.Series) -> pd.Series:
+    """
+    the cells as numbers, NaN for any which aren't
+    """
+    return pd.to_numeric(values, errors="coerce")
+
+
+def seconds(values: pd.Series) -> pd.Series:
+    """
+    durations as seconds: "m:ss" or "h:mm:ss" text, a sheets duration (a
+    fraction of a day) or a number of minutes; anything else is NaN.
+    A log repeats the same few hundred paces, so each is parsed once
+    """
+    (codes, uniques) = pd.factorize(values, use_na_sentinel=False)
+    if len(uniques) < len(values):
+        parsed = seconds(pd.Series(uniques, dtype=object))
+        return pd.Series(parsed.values[codes], index=values.index)
+    text = values.astype(str).str.strip()
+    clock = text.str.extract(r"^(?:(\d+):)?(\d+):(\d+(?:\.\d*)?)$").astype(float)
+    clocked = clock[0].fillna(0) * 3600 + clock[1] * 60 + clock[2]
+    minutes = pd.to_numeric(values, errors="coerce")
+    minutes = minutes.where(minutes >= 1, minutes * 86400).where(minutes < 1, minutes * 60)
+    return clocked.where(clocked.notna(), minutes).where(lambda s: s > 0)
+
+
+CONVERTERS = {NUMBER: numbers, DURATION: seconds}
+
+
+@dataclasses.dataclass(frozen=True)
+class Column:
+    """
+    :param kind - DATE, NUMBER, DURATION (seconds) or TEXT (left as it is)
+    :param fill - what a blank or rejected cell becomes, NaN (NaT) if None
+    :param into - put the converted values in this column, leaving the
+    sheet's own as they were
+    """
+
+    name: str
+    kind: str
+    fill: object = None
+    into: str = None
+
+
+class Schema:
+    """
+    the columns a family of sheets must have, and how to convert them
+    :param index - the date column which becomes the index (and is dropped)
+    :param first_row - the sheet row of the frame's first row (2 after a title)
+    """
+
+    def __init__(self, family, columns, index=None, date_format=DATE_FORMAT, first_row=2):
+        self.family = family
+        self.columns = tuple(columns)
+        self.index = index
+        self.date_format = date_format
+        self.first_row = first_row
+
+    def missing(self, frame):
+        names = [c.name for c in self.columns] + ([self.index] if self.index else [])
+        return [name for name in names if name not in frame.columns]
+
+    def date(self, value):
+        """
+        one date in the sheets' format, or a date already as a date
+        """
+        if isinstance(value, str):
+            return pd.to_datetime(value, format=self.date_format)
+        return pd.Timestamp(value)
+
+    def convert(self, values: pd.Series, column: Column):
+        """
+        (converted values, the positions of the cells rejected)
+        """
+        if column.kind == DATE:
+            converted = dates(values, self.date_format)
+        else:
+            converted = CONVERTERS[column.kind](values)
+        failed = np.flatnonzero(converted.isna().values)
+        # only the cells which didn't convert need looking at again
+        rejected = failed[~blank(values.iloc[failed])]
+        if column.fill is not None:
+            converted = converted.fillna(column.fill)
+        return (converted, rejected)
+
+    @run_metrics.measured("schema")
+    def apply(self, frame: pd.DataFrame, sheet=None, first_row=None) -> list:
+        """
+        convert the sheet in place, returning its rejected cells
+        :param first_row - the sheet row of the frame's first row, if it isn't
+        the schema's (eg a sheet without titles)
+        """
+        missing = self.missing(frame)
+        if missing:
+            raise KeyError(f"{self.family} sheet {sheet} has no {', '.join(missing)} column")
+        sheet = sheet or getattr(frame, "name", self.family)
+        first_row = self.first_row if first_row is None else first_row
+        rejected = []
+        run_metrics.add("rows", len(frame))
+
+        def reject(name, original, positions):
+            for p in positions:
+                rejected.append(Rejected(sheet, name, int(p) + first_row, original.iloc[p]))
+
+        for column in self.columns:
+            if column.kind == TEXT:
+                continue
+            original = frame[column.name]
+            (converted, positions) = self.convert(original, column)
+            reject(column.name, original, positions)
+            frame[column.into or column.name] = converted.values
+        if self.index:
+            original = frame[self.index]
+            (frame.index, positions) = self.convert(original, Column(self.index, DATE))
+            reject(self.index, original, positions)
+            frame.drop(self.index, axis=1, inplace=True)
+        for r in rejected:
+            logger.info(f"{r.sheet} {r.column} row {r.row}: rejected {r.value!r}")
+        return rejected
+
+
+def describe(rejected) -> str:
+    """
+    a line per sheet and column with rejected cells, with the first few
+    """
+    groups = {}
+    for r in rejected:
+        groups.setdefault((r.sheet, r.column), []).append(r)
+    lines = []
+    for (sheet, column), rs in groups.items():
+        shown = ", ".join(f"row {r.row} {r.value!r}" for r in rs[:3])
+        more = f" and {len(rs) - 3} more" if len(rs) > 3 else ""
+        lines.append(f"{sheet} {column}: {len(rs)} cells rejected ({shown}{more})")
+    return "\n".join(lines)
+
+
+# a year of the running log, named for the year
+RUN_LOG = Schema(
+    "running log",
+    [
+        Column("Distance miles", NUMBER, fill=0),
+        Column("km", NUMBER, fill=0),
+        Column("Pace", DURATION, into="Pace seconds"),
+        Column("Remarks", TEXT),
+    ],
+    index="Date",
+)
+# each bike's sheet of the bike mileage workbook
+BIKE_LOG = Schema(
+    "bike mileage",
+    [Column("Miles", NUMBER, fill=0)],
+    index="Date",
+)
+# the Shoes sheet of the running log, which is written back so only the
+# dates are converted
+SHOES = Schema(
+    "shoes",
+    [Column("Start Date", DATE), Column("Type", TEXT), Column("Name", TEXT)],
+)
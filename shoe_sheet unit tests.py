@@ -154,7 +154,60 @@ class TestStuff(unittest.TestCase):
         assigned_shoe = selected_data.iloc[[3]].apply(runner.assign_names, axis='columns')
         print(list(assigned_shoe))
         self.assertEqual(assigned_shoe.iloc[0], '2024Inov8 Mudclaw')
-        
+
+    def test_06_(self):
+        '''
+        the batch assign_all must label every row the same as assign_names
+        '''
+        shoes = shoe_sheet.ShoeManager(self.sheets[TEST_SHEET], handle=self.gdoc)
+        for year in ('2023', '2024'):
+            runner = shoe_sheet.ShoeTracker(shoes, year=int(year))
+            selected_data = self.sheets[year]
+            selected_data.index = pd.to_datetime(selected_data.iloc[:, 0], dayfirst=True)
+            one_by_one = selected_data.apply(runner.assign_names, axis='columns')
+            batch = runner.assign_all(selected_data)
+            self.assertEqual(list(one_by_one), list(batch))
+
+    def test_07_(self):
+        '''
+        keyword index picks the first shoe in the sheet, and is extended by add_shoe
+        '''
+        shoes = shoe_sheet.ShoeManager(self.sheets[TEST_SHEET].copy(), fuzzy=True)
+        self.assertEqual(shoes.match_remark({'stolenkoa'}), 0)
+        self.assertEqual(shoes.match_remark({'stolenkao'}), 0)  # two letters swapped
+        self.assertIsNone(shoes.match_remark({'nosuchshoe'}))
+        idx = shoes.add_shoe('01/01/2030', 'Road', 'Zzyzx Flyer')
+        self.assertEqual(shoes.match_remark({'zzyzx'}), idx)
+
+    def test_08_(self):
+        '''
+        the year hashes survive a round trip through the compact cell encoding,
+        and the residual matches summing the hash
+        '''
+        shoes = shoe_sheet.ShoeManager(self.sheets[TEST_SHEET].copy())
+        adder = shoe_sheet.ShoeMileYears(shoes, 6, encoding='compact')
+        adder.load()
+        legacy = adder.year_hashes
+        for row, year_hash in enumerate(legacy):
+            expected = sum(v for k, v in year_hash.items() if k < 2024)
+            self.assertAlmostEqual(adder.residual(2024, row_num=row), expected)
+        shoes.backing_sheet[adder.cn] = adder.encode()
+        reloaded = shoe_sheet.ShoeMileYears(shoes, 6)
+        reloaded.load()
+        self.assertEqual(reloaded.year_hashes, legacy)
+
+    def test_09_(self):
+        '''
+        the start dates convert with the sheet's date format, and a cell which
+        isn't a date is reported rather than guessed at
+        '''
+        sheet = self.sheets[TEST_SHEET].copy()
+        sheet.iloc[1, 0] = '31/02/2024'
+        shoes = shoe_sheet.ShoeManager(sheet)
+        self.assertEqual([(r.column, r.row) for r in shoes.rejected], [('Start Date', 3)])
+        self.assertTrue(pd.isna(shoes.backing_sheet.iloc[1, 0]))
+        self.assertTrue(shoes.backing_sheet['Start Date'].iloc[2:].notna().all())
+
 def doTests():
     suite = unittest.TestLoader().loadTestsFromTestCase(TestStuff)
     unittest.TextTestRunner(verbosity=2).run(suite)
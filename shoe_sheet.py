@@ -5,9 +5,14 @@ running log spreadsheet and tracking mileage run in them
 import datetime
 import logging
 import re
+import textwrap
+import numpy as np
 import pandas as pd
 import yaml
 
+import run_metrics
+import sheet_schema
+
 logger = logging.getLogger()
 # logging.basicConfig(
 #     level=logging.INFO,  # DEBUG, INFO, CRITICAL + 1
@@ -17,6 +22,7 @@ logger = logging.getLogger()
 
 TYPE = "Type"
 STARTDATE = "Start Date"
+SHEET = "Shoes"
 
 
 class ShoeManager:
@@ -25,20 +31,131 @@ class ShoeManager:
     knows how to read and write to the sheet
     """
 
-    def __init__(self, raw_sheet: pd.DataFrame, handle=None):
+    @run_metrics.measured("shoe_manager")
+    def __init__(self, raw_sheet: pd.DataFrame, handle=None, fuzzy=False, writer=None):
+        """
+        :param fuzzy - also match remark words which are a prefix of, or one
+        typo away from, a shoe keyword
+        :param writer - a write_buffer.WriteBuffer to queue writes on, rather
+        than writing each column straight through handle
+        """
         self.backing_sheet = raw_sheet
         self.handle = handle
+        self.fuzzy = fuzzy
+        self.writer = writer
+        if writer is not None:
+            # as loaded, so unchanged cells are never written back
+            writer.know(SHEET, raw_sheet)
 
         # check that the column names we rely on are in the sheet
         assert list(raw_sheet.columns[:3]) == ["Start Date", "Type", "Name"]
 
-        self.backing_sheet["Start Date"] = pd.to_datetime(
-            self.backing_sheet["Start Date"], dayfirst=True
-        )
+        # the start dates which didn't convert, for the caller to report
+        self.rejected = sheet_schema.SHOES.apply(self.backing_sheet, SHEET)
         # these words might appear in the Remarks column of the log to indicate
         # a particular shoe was used
         self.shoe_keywords = self.backing_sheet["Name"].apply(self.findwords)
 
+        # invert shoe_keywords so that a remark costs one dict lookup per word:
+        # word -> rows of the shoes it names, kept sorted so that when several
+        # shoes match, the first in the sheet wins (as the old linear scan did)
+        self.keyword_index = {}
+        # trigram -> keywords containing it, only used for fuzzy matching
+        self.ngram_index = {}
+        for idx, words in self.shoe_keywords.items():
+            self._index_shoe(idx, words)
+
+    def _index_shoe(self, idx, words):
+        """
+        add one shoe row's keywords to the inverted indexes
+        """
+        for word in words:
+            rows = self.keyword_index.setdefault(word, [])
+            if idx not in rows:
+                rows.append(idx)
+                rows.sort()
+            for gram in self.ngrams(word):
+                self.ngram_index.setdefault(gram, set()).add(word)
+
+    def add_shoe(self, start_date, shoe_type: str, name: str, **columns):
+        """
+        append a new shoe to the backing sheet and index just its keywords
+        """
+        idx = len(self.backing_sheet)
+        row = {STARTDATE: sheet_schema.SHOES.date(start_date), TYPE: shoe_type}
+        row["Name"] = name
+        row.update(columns)
+        types = self.backing_sheet[TYPE]
+        if isinstance(types.dtype, pd.CategoricalDtype) and shoe_type not in types.cat.categories:
+            # a lean (categorical) Type column has to be told of a new type first
+            self.backing_sheet[TYPE] = types.cat.add_categories([shoe_type])
+        self.backing_sheet.loc[idx] = pd.Series(row)
+        words = self.findwords(name)
+        self.shoe_keywords.loc[idx] = words
+        self._index_shoe(idx, words)
+        return idx
+
+    def match_remark(self, remark_words):
+        """
+        return the row of the shoe named by any of the remark words, or None.
+        An exact keyword beats a fuzzy one; otherwise the lowest row wins
+        """
+        rows = [
+            self.keyword_index[w][0] for w in remark_words if w in self.keyword_index
+        ]
+        if not rows and self.fuzzy:
+            rows = [
+                self.keyword_index[k][0]
+                for w in remark_words
+                for k in self.fuzzy_keywords(w)
+            ]
+        return min(rows) if rows else None
+
+    def fuzzy_keywords(self, word):
+        """
+        keywords which start with word, or are a single edit away from it.
+        Candidates come from the trigram index so cost doesn't grow with the
+        number of shoes
+        """
+        if len(word) < 3:
+            return set()
+        candidates = set()
+        for gram in self.ngrams(word):
+            candidates |= self.ngram_index.get(gram, set())
+        return {
+            k
+            for k in candidates
+            if k.startswith(word) or (len(word) > 3 and self.one_edit(word, k))
+        }
+
+    @staticmethod
+    def ngrams(word, n=3):
+        """
+        the set of n letter substrings of word, padded so short words get one
+        """
+        padded = f"^{word}$"
+        return {padded[i : i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+    @staticmethod
+    def one_edit(a, b):
+        """
+        True if a and b differ by at most one insert, delete, substitution or
+        swap of neighbouring letters ("stolenkao" for "stolenkoa")
+        """
+        if abs(len(a) - len(b)) > 1:
+            return False
+        if len(a) > len(b):
+            a, b = b, a
+        i = 0
+        while i < len(a) and a[i] == b[i]:
+            i += 1
+        if len(a) == len(b):
+            if a[i + 1 :] == b[i + 1 :]:
+                return True
+            # or the two letters from i are the other way round
+            return a[i : i + 2] == b[i + 1 : i + 2] + b[i : i + 1] and a[i + 2 :] == b[i + 2 :]
+        return a[i:] == b[i + 1 :]
+
     def idx_to_name(self, idx):
         """
         convert an index into a shoe name
@@ -68,20 +185,22 @@ class ShoeManager:
         for the named column, find its position in the list of columns
         then write back the entire column in the DataFrame to the sheet
         """
-        if self.handle is None:
+        if self.handle is None and self.writer is None:
             print(
                 f"no gdoc handle in object," "\n pass handle= on ShoeManager creation"
             )
             raise ValueError
 
         col_pos = self.backing_sheet.columns.get_loc(colname) + 1
+        if self.writer is None:
+            run_metrics.add("api_calls")
 
-        self.handle.addData(
+        (self.handle if self.writer is None else self.writer).addData(
             col_pos,
             2,  # +1 for title row, +1 for base
             list(self.backing_sheet[colname].apply(str)),
             arrayRepresents="COLUMN",
-            sheet="Shoes",
+            sheet=SHEET,
             #sheet="Copy of Shoes",
         )
 
@@ -99,32 +218,181 @@ class ShoeManager:
 class ShoeMileYears:
     """
     know how to store and retrieve the previous years' mileage
+
+    the miles are held as a shoes x years matrix (a row per shoe, a column per
+    year from first_year on) with a running sum along the years, so the
+    residual for any shoe and year is a single lookup. In the sheet each
+    shoe's years are one cell, either the legacy YAML hash, eg
+        2022: 0.0
+        2023: 200.0
+    or the compact form 2022=0.0;2023=200.0
     """
 
-    def __init__(self, shoe_manager, colname):
+    # one year: miles entry, in either the legacy YAML or the compact form
+    ENTRY = re.compile(r"\s*(\d{4})\s*[:=]\s*([-+]?[0-9.]+(?:[eE][-+]?\d+)?)\s*")
+
+    def __init__(self, shoe_manager, colname, encoding="yaml"):
         """
         the data sits in the named column of the ShoeManager backing sheet
+        :param encoding - how save() writes the cells, "yaml" or "compact"
         """
+        assert encoding in ("yaml", "compact")
+        columns = shoe_manager.backing_sheet.columns
+        if colname not in columns:
+            # a position: the column's name, so save() writes back to the
+            # same column load() read
+            colname = columns[colname]
         self.cn = colname
         self.shoe_manager = shoe_manager
-        self.year_hashes = [None for i in range(len(self.shoe_manager.backing_sheet))]
-
+        self.encoding = encoding
+        rows = len(self.shoe_manager.backing_sheet)
+        self.first_year = None
+        self.miles = np.zeros((rows, 0))
+        # which years a shoe's cell actually holds, so they round trip
+        self.present = np.zeros((rows, 0), dtype=bool)
+        self._prefix = None
+
+    @run_metrics.measured("mile_years_load")
     def load(self):
         """
-        pull the data out of the column
+        pull the data out of the column: the simple entries are parsed
+        directly, anything else goes through a single yaml load
         """
-        for i, row in self.shoe_manager.backing_sheet.iterrows():
-            self.year_hashes[i] = yaml.full_load(row[self.cn])
+        sheet = self.shoe_manager.backing_sheet
+        cells = sheet[self.cn]
+        run_metrics.add("rows", len(cells))
+        hashes = {}
+        awkward = {}
+        for i, cell in enumerate(cells.fillna("").astype(str)):
+            parsed = self.parse_cell(cell)
+            if parsed is None:
+                awkward[i] = cell
+            else:
+                hashes[i] = parsed
+        if awkward:
+            # one document with a key per awkward row, rather than a load per row
+            bulk = "\n".join(
+                f"{i}:\n" + textwrap.indent(cell, "  ") for i, cell in awkward.items()
+            )
+            hashes.update(yaml.full_load(bulk))
+        self._from_hashes([hashes.get(i) or {} for i in range(len(cells))])
+
+    @classmethod
+    def parse_cell(cls, cell):
+        """
+        {year: miles} from a cell of simple entries, None if it needs yaml
+        """
+        text = cell.strip()
+        if text in ("", "{}"):
+            return {}
+        year_hash = {}
+        for entry in re.split(r"[\n;]", text):
+            matchobj = cls.ENTRY.fullmatch(entry)
+            if matchobj is None:
+                return None
+            year_hash[int(matchobj.group(1))] = float(matchobj.group(2))
+        return year_hash
+
+    def _from_hashes(self, year_hashes):
+        years = [year for h in year_hashes for year in h]
+        self.first_year = min(years) if years else None
+        width = max(years) - self.first_year + 1 if years else 0
+        self.miles = np.zeros((len(year_hashes), width))
+        self.present = np.zeros((len(year_hashes), width), dtype=bool)
+        for row, year_hash in enumerate(year_hashes):
+            for year, miles in year_hash.items():
+                self.miles[row, year - self.first_year] = miles
+                self.present[row, year - self.first_year] = True
+        self._prefix = None
+
+    def _column(self, year):
+        """
+        the matrix column for year, growing the matrix to hold it
+        """
+        if self.first_year is None:
+            self.first_year = year
+        if year < self.first_year:
+            pad = self.first_year - year
+            self.miles = np.pad(self.miles, ((0, 0), (pad, 0)))
+            self.present = np.pad(self.present, ((0, 0), (pad, 0)))
+            self.first_year = year
+        col = year - self.first_year
+        if col >= self.miles.shape[1]:
+            pad = col - self.miles.shape[1] + 1
+            self.miles = np.pad(self.miles, ((0, 0), (0, pad)))
+            self.present = np.pad(self.present, ((0, 0), (0, pad)))
+        return col
+
+    @property
+    def year_hashes(self):
+        """
+        the {year: miles} hash for each shoe, as stored in the sheet
+        """
+        return [
+            {
+                self.first_year + int(col): float(self.miles[row, col])
+                for col in np.flatnonzero(self.present[row])
+            }
+            for row in range(len(self.miles))
+        ]
+
+    def encode(self):
+        """
+        the cell text for every shoe, in the chosen encoding
+        """
+        if self.encoding == "compact":
+            sep, fmt, empty = ";", "{}={!r}", ""
+        else:
+            # matches yaml.dump of the hash
+            sep, fmt, empty = "\n", "{}: {!r}", "{}\n"
+        cells = []
+        for year_hash in self.year_hashes:
+            if not year_hash:
+                cells.append(empty)
+                continue
+            text = sep.join(fmt.format(y, m) for y, m in sorted(year_hash.items()))
+            cells.append(text + "\n" if self.encoding == "yaml" else text)
+        return cells
+
+    def stored(self, row_num: int, year: int):
+        """
+        the miles held for a shoe and year, None if its cell has no entry
+        """
+        col = year - self.first_year if self.first_year is not None else -1
+        if col < 0 or col >= self.miles.shape[1] or not self.present[row_num, col]:
+            return None
+        return float(self.miles[row_num, col])
+
+    def set_year(self, row_num: int, year: int, miles: float):
+        """
+        hold the miles for a shoe and year, the YTD is left alone
+        """
+        assert row_num < len(self.miles)
+        col = self._column(year)
+        self.miles[row_num, col] = float(miles)
+        self.present[row_num, col] = True
+        self._prefix = None
 
     def save(self):
         """
         push the year_hashes back into the DataFrame
         """
-        for i, year_hash in enumerate(self.year_hashes):
-            self.shoe_manager.backing_sheet.loc[i, self.cn] = yaml.dump(year_hash)
+        self.shoe_manager.backing_sheet[self.cn] = self.encode()
 
         self.shoe_manager.write_column(self.cn)
 
+    def residuals(self, year: int) -> np.ndarray:
+        """
+        every shoe's total mileage prior to this year
+        """
+        if self.first_year is None or year <= self.first_year:
+            return np.zeros(len(self.miles))
+        if self._prefix is None:
+            # _prefix[:, j] is the sum of the years before first_year + j
+            self._prefix = np.zeros((len(self.miles), self.miles.shape[1] + 1))
+            np.cumsum(self.miles, axis=1, out=self._prefix[:, 1:])
+        return self._prefix[:, min(year - self.first_year, self.miles.shape[1])]
+
     def residual(self, year: int, **kwargs):
         """
         the residual mileage is the total mileage for the shoe == row
@@ -136,12 +404,8 @@ class ShoeMileYears:
         if "row_num" in set(kwargs.keys()):
             row_num = kwargs["row_num"]
 
-        assert row_num < len(self.year_hashes)
-        shoe_sum = 0
-        for k in sorted(self.year_hashes[row_num].keys()):
-            if k < year:
-                shoe_sum += self.year_hashes[row_num][k]
-        return shoe_sum
+        assert row_num < len(self.miles)
+        return float(self.residuals(year)[row_num])
 
     def total(self, shoename: str, year: int, yearsTotal: float) -> float:
         """
@@ -152,14 +416,14 @@ class ShoeMileYears:
         """
         assert year > 2020
         row_num = self.shoe_manager.name_to_idx(shoename)
-        assert row_num < len(self.year_hashes)
-        self.year_hashes[row_num][year] = float(yearsTotal)
+        self.set_year(row_num, year, yearsTotal)
         total = yearsTotal + self.residual(year, shoename=shoename)
         # avoid chained indexing of iloc[row_num]['YTD']
         ytdIndex = self.shoe_manager.backing_sheet.columns.get_loc('YTD')
         self.shoe_manager.backing_sheet.iloc[row_num, ytdIndex] = total
         return total
 
+    @run_metrics.measured("push_updates")
     def push_updates(self):
         """
         write the updated hashes back into the sheet,
@@ -219,7 +483,7 @@ class ShoeTracker:
             # find for each category, the row of the newest shoe at the end of last year
             rows = (
                 self.backing_sheet[self.backing_sheet[STARTDATE] <= end_of_last_year]
-                .groupby(TYPE)[STARTDATE]
+                .groupby(TYPE, observed=True)[STARTDATE]
                 .idxmax()
             )
             # now pull out useful info for that row
@@ -252,7 +516,7 @@ class ShoeTracker:
             end_of_this_year = pd.to_datetime(str(self.current_year) + "-12-31")
             rows = (
                 self.backing_sheet[self.backing_sheet["Start Date"] <= end_of_this_year]
-                .groupby("Type")["Start Date"]
+                .groupby("Type", observed=True)["Start Date"]
                 .idxmax()
             )
             info = (
@@ -316,6 +580,14 @@ class ShoeTracker:
         logger.debug(f"<== assign from base {sup=}")
         return self.base_shoe_info[sup]["Name"]
 
+    def dated_shoes(self, sup):
+        """
+        the shoes of a type (Road or XC) which have a start date; one whose
+        date was rejected (NaT) can't be placed, so isn't looked up
+        """
+        lookup_shoes = self.backing_sheet.groupby(TYPE, observed=True).get_group(sup)
+        return lookup_shoes[lookup_shoes[STARTDATE].notna()]
+
     def assign_names(self, row):
         '''
         this new assign_names method no longer has the 'old' and 'new' concept
@@ -328,10 +600,10 @@ class ShoeTracker:
         remark_words = self.shoes.findwords(row["Remarks"])
         if bool(remark_words):  # not empty set
             logger.debug(f"{remark_words=}")
-            for idx, val in self.shoes.shoe_keywords.items():
-                if bool(val.intersection(remark_words)):
-                    logger.debug(f"<== assign from remarks {idx=}")
-                    return self.shoes.backing_sheet.iloc[idx]["Name"]
+            idx = self.shoes.match_remark(remark_words)
+            if idx is not None:
+                logger.debug(f"<== assign from remarks {idx=}")
+                return self.shoes.backing_sheet.iloc[idx]["Name"]
 
         # if a Poole run, then use the old fixed shoe if it's after they went there
         route_words = self.shoes.findwords(row["Route"])
@@ -348,10 +620,82 @@ class ShoeTracker:
         else:
             sup = "Road"
 
-        lookup_shoes = self.backing_sheet.groupby('Type').get_group(sup)  # the XC|Road subset for this run
+        lookup_shoes = self.dated_shoes(sup)  # the XC|Road subset for this run
         lookup_shoes.index = lookup_shoes['Start Date']  # changer the index so we can use get_indexer
         # get_indexer looks for a collection of dates and returns a collection of rows
         # currently, because we're in an apply method, only one date is passed, so is made
         # the only element in the collection [row.name], and so one row is returned and we need
         # the [0] subscript to dereference it
         return lookup_shoes.iloc[lookup_shoes.index.get_indexer([row.name], method='ffill')[0]]['Name']  # last row
+
+    @run_metrics.measured("assign_all")
+    def assign_all(self, log: pd.DataFrame) -> pd.Series:
+        """
+        batch version of assign_names: label every row of a date indexed run log
+        in a few passes over the whole frame rather than one python call per row.
+        The result matches log.apply(self.assign_names, axis="columns") row for row
+        """
+        run_metrics.add("rows", len(log))
+        names = self.backing_sheet["Name"]
+        positions = pd.RangeIndex(len(log))
+        dates = pd.Series(pd.to_datetime(log.index), index=positions)
+        shoe = pd.Series(None, index=positions, dtype=object)
+
+        # a) remark keywords: explode the words of each remark, join them to the
+        # keyword index and take the first shoe in sheet order
+        remark_sets = log["Remarks"].apply(self.shoes.findwords).reset_index(drop=True)
+        remark_words = remark_sets.explode()
+        keywords = pd.DataFrame(
+            [(w, rows[0]) for w, rows in self.shoes.keyword_index.items()],
+            columns=["word", "shoe_row"],
+        )
+        hits = (
+            pd.DataFrame({"pos": remark_words.index, "word": remark_words.values})
+            .dropna()
+            .merge(keywords, on="word")
+            .groupby("pos")["shoe_row"]
+            .min()
+        )
+        if self.shoes.fuzzy:
+            # only the remarks without an exact keyword need the fuzzy lookup
+            rest = remark_sets.drop(hits.index).apply(self.shoes.match_remark).dropna()
+            hits = pd.concat([hits, rest.astype(int)])
+        shoe[hits.index] = names.iloc[hits.values].values
+
+        # b) Poole runs use the fixed shoe in row 3
+        poole = {"upton", "holes", "hamworthy", "baiter", "sandbanks"}
+        route_hit = log["Route"].reset_index(drop=True).apply(
+            lambda x: bool(self.shoes.findwords(x) & poole)
+        )
+        route_hit &= dates > pd.to_datetime("2021-08-02")
+        shoe[route_hit & shoe.isna()] = names.iloc[3]
+
+        # c) everything else gets the newest Road or XC shoe at the date of the run
+        is_xc = log["Remarks"].reset_index(drop=True).str.contains("xc", case=False)
+        todo = shoe.isna()
+        for sup, in_type in (("XC", is_xc), ("Road", ~is_xc)):
+            wanted = todo & in_type
+            if not wanted.any():
+                continue
+            lookup_shoes = self.dated_shoes(sup)
+            # as with get_indexer(method='ffill') a run before the first shoe of
+            # the type (or with no date) comes back as -1, ie the last row
+            shoe[wanted] = lookup_shoes["Name"].iloc[-1]
+            runs = (
+                dates[wanted & dates.notna()]
+                .rename("run_date")
+                .rename_axis("pos")
+                .reset_index()
+                .sort_values("run_date")
+            )
+            matched = pd.merge_asof(
+                runs,
+                lookup_shoes[[STARTDATE, "Name"]].sort_values(STARTDATE),
+                left_on="run_date",
+                right_on=STARTDATE,
+                direction="backward",
+            ).dropna(subset=["Name"])
+            shoe[matched["pos"].values] = matched["Name"].values
+
+        shoe.index = log.index
+        return shoe
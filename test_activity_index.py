@@ -0,0 +1,65 @@
+"""
+offline checks of ActivityIndex's totals, and of where each period starts
+and ends
+"""
+import datetime
+import unittest
+
+import pandas as pd
+
+import activity_index
+
+
+class TestRounding(unittest.TestCase):
+    def test_totals_drop_the_running_sums_noise(self):
+        dates = pd.date_range("2024-01-01", periods=120)
+        miles = [3.1, 0.7, 12.3, 4.4, 0.1] * 24
+        index = activity_index.ActivityIndex(dates, miles, labels=["Koa", "Talon"] * 60)
+        periods = index.periods("2024-04-29")
+        # without rounding, 120.50000000000011
+        self.assertEqual(periods["month"], 120.5)
+        self.assertEqual(str(periods["year to date"]), "494.4")
+        self.assertEqual(index.totals("2024-04-01", "2024-04-29"), {"Koa": 58.7, "Talon": 61.8})
+        self.assertEqual(list(index.daily("2024-04-28", "2024-04-29")), [4.4, 0.1])
+
+
+class TestPeriods(unittest.TestCase):
+    def setUp(self):
+        # a mile on each of these days, the sorting is the index's job
+        days = [
+            "2023-12-31", "2024-01-01", "2024-02-25", "2024-02-26", "2024-02-29",
+            "2024-03-01", "2024-03-03", "2024-03-04", "2023-03-05", "2023-03-04",
+        ]
+        self.index = activity_index.ActivityIndex(pd.to_datetime(days), [1.0] * len(days))
+
+    def test_week_runs_monday_to_sunday(self):
+        # Sun 3 Mar: the week began Mon 26 Feb; the Sunday before isn't in it
+        self.assertEqual(self.index.periods(datetime.date(2024, 3, 3))["week"], 4.0)
+        # Mon 4 Mar starts a new week, which includes its own day
+        self.assertEqual(self.index.periods(datetime.date(2024, 3, 4))["week"], 1.0)
+        # midweek, the whole week counts, days after `when` too
+        self.assertEqual(self.index.periods("2024-02-28")["week"], 4.0)
+
+    def test_month_and_year_start_on_the_first(self):
+        periods = self.index.periods("2024-03-01")
+        self.assertEqual(periods["month"], 1.0)  # not 29 Feb
+        self.assertEqual(periods["year to date"], 5.0)  # not 31 Dec
+        periods = self.index.periods("2024-02-29")
+        self.assertEqual(periods["month"], 3.0)
+        new_year = self.index.periods("2024-01-01")
+        self.assertEqual((new_year["month"], new_year["year to date"]), (1.0, 1.0))
+
+    def test_rolling_windows_include_when_and_days_before(self):
+        periods = self.index.periods("2024-03-03")
+        # 7 days: 26 Feb to 3 Mar
+        self.assertEqual(periods["7 days"], 4.0)
+        # 28 days: 5 Feb to 3 Mar
+        self.assertEqual(periods["28 days"], 5.0)
+        # across a leap day the 365 days to 3 Mar start on 5 Mar 2023, so
+        # 4 Mar 2023 doesn't count
+        self.assertEqual(periods["365 days"], 8.0)
+        self.assertEqual(self.index.total("2023-03-05", "2024-03-03"), 8.0)
+        self.assertEqual(self.index.total("2023-03-04", "2024-03-03"), 9.0)
+
+if __name__ == "__main__":
+    unittest.main()
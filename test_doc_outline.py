@@ -0,0 +1,286 @@
+"""
+offline checks of DateOutline, and of publishing to the daily doc against a
+model of a google doc: the outline kept up to date across publishes must
+match one built afresh from the edited doc
+"""
+import contextlib
+import datetime
+import unittest
+from unittest import mock
+
+import doc_outline
+import update_note
+
+NORMAL = "NORMAL_TEXT"
+
+
+class FakeDoc:
+    """
+    the body of a google doc as the Docs API indexes it: UTF-16 code units
+    from 1, each with the named style of the paragraph it is in, and a
+    revision which every edit moves on
+    """
+
+    def __init__(self, paragraphs):
+        self.units = []
+        self.styles = []
+        for (text, style) in paragraphs:
+            self.append(text + "\n", style)
+        self.id = "daily"
+        self.revision = 0
+
+    def append(self, text, style):
+        units = self.encode(text)
+        self.units += units
+        self.styles += [style] * len(units)
+
+    @staticmethod
+    def encode(text):
+        data = text.encode("utf-16-le")
+        return [data[i : i + 2] for i in range(0, len(data), 2)]
+
+    def text(self, start=1, end=None):
+        end = len(self.units) + 1 if end is None else end
+        return b"".join(self.units[start - 1 : end - 1]).decode("utf-16-le")
+
+    def paragraphs(self):
+        """
+        (start index, text, style) of each paragraph
+        """
+        found = []
+        start = 1
+        for i, unit in enumerate(self.units, start=1):
+            if unit == "\n".encode("utf-16-le"):
+                found.append((start, self.text(start, i), self.styles[i - 1]))
+                start = i + 1
+        return found
+
+    def batch_update(self, requests, revision=None):
+        """
+        as documents().batchUpdate, refused if the doc has moved on from a
+        required revision
+        """
+        if revision is not None and revision != self.revision:
+            raise update_note.transport.RevisionMismatch(revision)
+        self.apply(requests)
+        return self.revision
+
+    def apply(self, requests):
+        self.revision += 1
+        for request in requests:
+            if "deleteContentRange" in request:
+                r = request["deleteContentRange"]["range"]
+                assert 1 <= r["startIndex"] < r["endIndex"] <= len(self.units)
+                del self.units[r["startIndex"] - 1 : r["endIndex"] - 1]
+                del self.styles[r["startIndex"] - 1 : r["endIndex"] - 1]
+            elif "insertText" in request:
+                at = request["insertText"]["location"]["index"]
+                assert 1 <= at <= len(self.units)
+                units = self.encode(request["insertText"]["text"])
+                # new text takes the style of the paragraph it goes in
+                self.units[at - 1 : at - 1] = units
+                self.styles[at - 1 : at - 1] = [self.styles[at - 1]] * len(units)
+            elif "updateParagraphStyle" in request:
+                r = request["updateParagraphStyle"]["range"]
+                style = request["updateParagraphStyle"]["paragraphStyle"]["namedStyleType"]
+                for (start, text, _) in self.paragraphs():
+                    end = start + doc_outline.length(text) + 1
+                    if start < r["endIndex"] and r["startIndex"] < end:
+                        self.styles[start - 1 : end - 1] = [style] * (end - start)
+
+    def outline(self):
+        """
+        a DateOutline of the doc as it stands, as from_doc would make it
+        """
+        starts = []
+        dated = []
+        for (start, text, style) in self.paragraphs():
+            if style == NORMAL:
+                continue
+            starts.append(start)
+            if text.startswith("Update for "):
+                date = datetime.datetime.strptime(text[11:], doc_outline.DATE_FORMAT)
+                dated.append((date, start))
+        return doc_outline.DateOutline(starts, dated, len(self.units) + 1)
+
+    def entries(self):
+        """
+        {title: body} of the dated sections
+        """
+        found = {}
+        title = None
+        for (_, text, style) in self.paragraphs():
+            if style != NORMAL:
+                title = text if text.startswith("Update for ") else None
+                if title is not None:
+                    found[title] = ""
+            elif title is not None:
+                found[title] += text + "\n"
+        return found
+
+
+def day(d):
+    return datetime.datetime(2024, 5, d)
+
+
+def title(when):
+    return when.strftime("Update for " + doc_outline.DATE_FORMAT)
+
+
+def state(outline):
+    return (outline.starts, outline.dated, outline.extent)
+
+
+class TestDateOutline(unittest.TestCase):
+    def setUp(self):
+        # titles at 1, 10 (undated), 20, 35 and 50 in a doc ending at 70
+        self.outline = doc_outline.DateOutline(
+            [1, 10, 20, 35, 50], [(day(26), 20), (day(24), 50), (day(25), 35)], 70
+        )
+
+    def test_section_runs_to_the_next_title(self):
+        self.assertEqual(self.outline.section(20), (20, 35))
+        self.assertEqual(self.outline.section(50), (50, 69))  # not the final newline
+
+    def test_between_is_last_in_the_doc_first(self):
+        self.assertEqual(self.outline.between(), [(50, 69), (35, 50), (20, 35)])
+        self.assertEqual(self.outline.between(day(25), day(26)), [(35, 50)])
+        self.assertEqual(self.outline.older(day(26)), [(50, 69), (35, 50)])
+        self.assertEqual(self.outline.first(), 20)
+
+    def test_deletes_last_first_leave_the_rest_in_place(self):
+        for (start, end) in self.outline.older(day(26)):
+            self.outline.deleted(start, end)
+        self.assertEqual(state(self.outline), ([1, 10, 20], [(day(26), 20)], 36))
+
+    def test_deleting_a_middle_section_moves_the_later_ones(self):
+        self.outline.deleted(20, 35)
+        self.assertEqual(
+            state(self.outline), ([1, 10, 20, 35], [(day(24), 35), (day(25), 20)], 55)
+        )
+
+    def test_insert_shifts_the_titles_after_it(self):
+        self.outline.inserted(19, 12, title=20, date=day(27))
+        self.assertEqual(
+            state(self.outline),
+            (
+                [1, 10, 20, 32, 47, 62],
+                [(day(24), 62), (day(25), 47), (day(26), 32), (day(27), 20)],
+                82,
+            ),
+        )
+        self.assertEqual(self.outline.first(), 20)
+
+    def test_length_counts_utf16_units(self):
+        self.assertEqual(doc_outline.length("5k 🏃 22:10"), 11)
+        self.assertEqual(doc_outline.length("café"), 4)
+
+
+class TestPublish(unittest.TestCase):
+    """
+    publishSection against a FakeDoc, with the Docs call applied to it
+    """
+
+    def setUp(self):
+        self.now = datetime.datetime.now()
+        self.today = datetime.datetime(self.now.year, self.now.month, self.now.day)
+        paragraphs = [("Daily updates", "TITLE"), ("kept for three days", NORMAL)]
+        bodies = ((0, "an early run 🌅"), (1, "GBPEUR: 1.17"), (2, "Übung"), (5, "old"))
+        for (ago, body) in bodies:
+            when = self.today - datetime.timedelta(days=ago)
+            paragraphs += [
+                (title(when), update_note.ENTRY_HEADING),
+                (body, NORMAL),
+                ("second line ✓", NORMAL),
+            ]
+        self.doc = FakeDoc(paragraphs)
+        self.outline = self.doc.outline()
+        patches = [
+            mock.patch.object(update_note, "sink", "doc"),
+            mock.patch.object(update_note, "outGdoc", self.doc),
+            mock.patch.object(update_note, "outOutline", self.outline),
+            mock.patch.object(update_note, "outRevision", self.doc.revision),
+            mock.patch.object(update_note, "today", self.now),
+            mock.patch.object(update_note.transport, "google", contextlib.nullcontext),
+            mock.patch.object(
+                update_note.transport,
+                "docs_batch_update",
+                lambda doc, requests, revision=None: doc.batch_update(requests, revision),
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def publish(self, needs):
+        with contextlib.redirect_stdout(None):
+            update_note.publishSection(needs)
+
+    def test_outline_follows_the_edits(self):
+        self.assertEqual(state(self.outline), state(self.doc.outline()))
+        for report in (
+            {"almanac": "Sunrise 05:01 ☀\n\n", "fx": "GBPEUR: 1.17\n\n"},
+            {"fx": "GBPEUR: 1.18 — 𝔁\n\n", "week": "w/c 27\n"},
+            {"run": "5k 🏃 22:10\n10k –\n"},
+        ):
+            self.publish(report)
+            self.assertEqual(state(self.outline), state(self.doc.outline()))
+        entries = self.doc.entries()
+        # the old sections are gone, and today's replaced, not added to
+        self.assertEqual(
+            list(entries),
+            [title(self.today - datetime.timedelta(days=ago)) for ago in (0, 1, 2)],
+        )
+        self.assertEqual(entries[title(self.today)], "5k 🏃 22:10\n10k –\n")
+        self.assertEqual(self.doc.text().count(title(self.today)), 1)
+        self.assertTrue(self.doc.text().startswith("Daily updates\nkept for three days\n"))
+
+    def test_an_edited_doc_is_read_again(self):
+        self.publish({"fx": "GBPEUR: 1.17\n\n"})
+        # a hand edit above the sections leaves the kept outline wrong
+        self.doc.apply(
+            [{"insertText": {"location": {"index": 1}, "text": "a note 📝\n"}}]
+        )
+        reopened = []
+
+        def open_daily_doc(doc_id, reload=False):
+            reopened.append((doc_id, reload))
+            return (self.doc, self.doc.outline(), self.doc.revision)
+
+        with mock.patch.object(update_note, "open_daily_doc", open_daily_doc):
+            self.publish({"run": "5k 🏃 22:10\n"})
+        self.assertEqual(reopened, [("daily", True)])
+        self.assertEqual(state(update_note.outOutline), state(self.doc.outline()))
+        self.assertEqual(update_note.outRevision, self.doc.revision)
+        self.assertTrue(self.doc.text().startswith("a note 📝\nDaily updates\n"))
+        self.assertEqual(self.doc.entries()[title(self.today)], "5k 🏃 22:10\n")
+        # a doc that won't stay still is given up on after one retry
+        def never_current(doc_id, reload=False):
+            return (self.doc, self.doc.outline(), -1)
+
+        update_note.outRevision = -1
+        with mock.patch.object(update_note, "open_daily_doc", never_current):
+            with self.assertRaises(update_note.transport.RevisionMismatch):
+                self.publish({"run": "5k\n"})
+
+    def test_entry_requests_insert_a_styled_section(self):
+        self.doc = FakeDoc([("intro 🙂", NORMAL)])
+        at = len(self.doc.units)  # the final newline
+        (requests, size) = update_note.entryRequests(
+            "Update for 𝕋", "body ✓\nmore\n\n", at
+        )
+        self.doc.apply(requests)
+        self.assertEqual(size, doc_outline.length("\nUpdate for 𝕋\nbody ✓\nmore"))
+        self.assertEqual(
+            self.doc.paragraphs(),
+            [
+                (1, "intro 🙂", NORMAL),
+                (10, "Update for 𝕋", update_note.ENTRY_HEADING),
+                (24, "body ✓", NORMAL),
+                (31, "more", NORMAL),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
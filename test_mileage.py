@@ -0,0 +1,181 @@
+"""
+offline checks of mileage's PaceBook, its standings and RunCheckpoint
+"""
+import copy
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import mileage
+import shoe_sheet
+
+
+class TestPaceBookClasses(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "pace-book.json")
+        self.classes = {"5k": 5, "30k": 30}
+        book = mileage.PaceBook(self.path, self.classes)
+        book.years["2023"] = {"5k": [290.0, 301.5], "30k": [330.0]}
+        book.rows["2023"] = 200
+        book.save()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load_with_the_books_own_classes(self):
+        book = mileage.PaceBook.load(self.path, None)
+        self.assertEqual(book.distance_classes, self.classes)
+        self.assertEqual(book.years["2023"]["30k"], [330.0])
+        self.assertEqual(book.rows, {"2023": 200})
+
+    def test_other_classes_start_again(self):
+        book = mileage.PaceBook.load(self.path)
+        self.assertEqual(book.distance_classes, mileage.DISTANCE_CLASSES)
+        self.assertEqual(book.years, {})
+
+    def test_no_book_takes_the_defaults(self):
+        book = mileage.PaceBook.load(os.path.join(self.directory.name, "none.json"), None)
+        self.assertEqual(book.distance_classes, mileage.DISTANCE_CLASSES)
+
+
+RUNS = [
+    # Date, Distance miles, km, Pace, Remarks
+    ("01/03/2022", "3.1", "5", "0:07:30", ""),
+    ("05/03/2022", "6.2", "10", "0:08:00", "xc mud"),
+    ("10/03/2022", "13.1", "21.1", "0:08:30", ""),
+    ("12/03/2022", "3.2", "5.1", "0:07:20", ""),
+    ("20/03/2022", "26.3", "42.3", "0:09:00", ""),
+]
+# the skeleton row at the bottom, no date yet
+SKELETON = ("", "", "", "#DIV/0!", "")
+
+
+def run_sheet(runs=len(RUNS)):
+    """
+    a year of the running log as toDataFrame gives it: the first runs of
+    RUNS, then the skeleton row
+    """
+    sheet = pd.DataFrame(
+        RUNS[:runs] + [SKELETON], columns=["Date", "Distance miles", "km", "Pace", "Remarks"]
+    )
+    sheet["Route"] = ""
+    return sheet
+
+
+class TestStandings(unittest.TestCase):
+    def setUp(self):
+        self.book = mileage.PaceBook(None, {"5k": 5})
+        self.book.years = {"2022": {"5k": [290.0, 300.0, 300.0]}, "2023": {"5k": [300.0, 310.0]}}
+
+    def checkpoint(self, paces, latest, classes=None):
+        checkpoint = mileage.RunCheckpoint(None, "2024", 0, classes or {"5k": 5})
+        name = next(iter(checkpoint.classes))
+        checkpoint.classes[name] = {"count": len(paces), "paces": sorted(paces), "latest": latest}
+        return checkpoint
+
+    def test_ties_share_the_higher_rank(self):
+        # 300s ties three earlier runs and this year's other one: 290 is
+        # faster, so the five at 300 all rank 6th of 7
+        checkpoint = self.checkpoint([300.0, 300.0], 300.0)
+        self.assertEqual(self.book.standings(checkpoint, "5k"), (2, 6, 7, 290.0))
+        # a new best ties nothing
+        checkpoint = self.checkpoint([285.0], 285.0)
+        self.assertEqual(self.book.standings(checkpoint, "5k"), (1, 1, 6, 285.0))
+
+    def test_lean_pace_ties_the_same_pace(self):
+        # a float32 pace from a lean sheet, as fold rounds it
+        latest = mileage.rounded_pace(np.float32(300.0))
+        checkpoint = self.checkpoint([latest], latest)
+        self.assertEqual(self.book.standings(checkpoint, "5k")[1], 5)
+
+    def test_no_pace_has_no_rank(self):
+        checkpoint = self.checkpoint([], None)
+        checkpoint.classes["5k"]["count"] = 1
+        self.assertEqual(self.book.standings(checkpoint, "5k"), (1, None, 5, 290.0))
+
+    def test_a_new_class_ranks_against_every_year(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "pace-book.json")
+        self.book.path = path
+        self.book.rows = {"2022": 7, "2023": 6}
+        self.book.save()
+        classes = {"5k": 5, "parkrun": 5}
+        # the book for the old classes is started again, so every year is read
+        book = mileage.PaceBook.load(path, classes)
+        self.assertEqual(book.missing({"2022": 7, "2023": 6, "2024": 4}, "2024"), ["2022", "2023"])
+        book.add_year("2022", mileage.clean_run_sheet(run_sheet(2)))
+        book.add_year("2023", mileage.clean_run_sheet(run_sheet(4)))
+        self.assertEqual(book.years["2023"]["parkrun"], [440.0, 450.0, 480.0, 510.0])
+        checkpoint = self.checkpoint([455.0], 455.0, classes={"parkrun": 5, "5k": 5})
+        checkpoint.classes["5k"] = {"count": 0, "paces": [], "latest": None}
+        self.assertEqual(book.standings(checkpoint, "parkrun"), (1, 4, 7, 440.0))
+        self.assertEqual(book.standings(checkpoint, "5k"), (0, None, 6, 440.0))
+
+
+class TestRunCheckpoint(unittest.TestCase):
+    def setUp(self):
+        shoes = shoe_sheet.ShoeManager(
+            pd.DataFrame(
+                {
+                    "Start Date": ["01/01/2020", "01/06/2020", "01/01/2021", "01/03/2022"],
+                    "Type": ["Road", "XC", "Road", "XC"],
+                    "Name": ["Koa", "Mudclaw", "Pegasus", "Talon"],
+                }
+            )
+        )
+        self.runner = shoe_sheet.ShoeTracker(shoes, year=2022)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "run-checkpoint-2022.json")
+        self.shoes = mileage.shoes_hash(shoes)
+
+    def totals(self, sheet):
+        """
+        (totals from the saved checkpoint, totals counted from scratch), with
+        the checkpoint saved again as the daily update does
+        """
+        checkpoint = mileage.RunCheckpoint.load(self.path, "2022", self.shoes)
+        (totals, _) = mileage.run_totals(
+            mileage.clean_run_sheet(sheet()), self.runner, checkpoint
+        )
+        checkpoint.save()
+        fresh = mileage.RunCheckpoint(None, "2022", self.shoes)
+        (full, _) = mileage.run_totals(mileage.clean_run_sheet(sheet()), self.runner, fresh)
+        return (totals, full)
+
+    def assertSameTotals(self, totals, full):
+        for k in mileage.CHECKPOINT_STATE:
+            self.assertEqual(getattr(totals, k), getattr(full, k), k)
+
+    def test_new_rows_are_folded_in(self):
+        self.totals(lambda: run_sheet(3))
+        (totals, full) = self.totals(run_sheet)
+        self.assertSameTotals(totals, full)
+        self.assertEqual(totals.rows, 6)  # the skeleton row is counted afresh
+        self.assertAlmostEqual(totals.total, 51.9)
+
+    def test_edited_settled_row_recounts(self):
+        self.totals(run_sheet)
+        saved = copy.deepcopy(mileage.RunCheckpoint.load(self.path, "2022", self.shoes))
+        self.assertEqual(saved.rows, 5)
+
+        def edited():
+            sheet = run_sheet()
+            sheet.loc[1, "Distance miles"] = "7.2"  # a row the checkpoint counted
+            return sheet
+
+        (totals, full) = self.totals(edited)
+        self.assertSameTotals(totals, full)
+        self.assertAlmostEqual(totals.total, saved.total + 1.0)
+        self.assertNotEqual(
+            mileage.RunCheckpoint.load(self.path, "2022", self.shoes).hashes, saved.hashes
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+"""
+offline checks of the daemon's refresh triggers
+"""
+import os
+import signal
+import threading
+import unittest
+
+import refresh_scheduler
+
+
+class TestTrigger(unittest.TestCase):
+    def test_signal_while_the_lock_is_held(self):
+        trigger = refresh_scheduler.Trigger()
+        trigger.listen_signal(signal.SIGUSR1)
+        try:
+            with trigger.lock:  # as inside wait(); the handler must not block
+                os.kill(os.getpid(), signal.SIGUSR1)
+            self.assertEqual(trigger.wait(1), {"all"})
+            self.assertEqual(trigger.wait(0), set())
+        finally:
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+
+    def test_requests_and_signal_merge(self):
+        trigger = refresh_scheduler.Trigger()
+        trigger.request(["fx"])
+        trigger._signal()
+        self.assertEqual(trigger.wait(0), {"fx", "all"})
+
+    def test_request_from_another_thread_wakes_the_waiter(self):
+        trigger = refresh_scheduler.Trigger()
+        threading.Timer(0.05, trigger.request, (["run"],)).start()
+        self.assertEqual(trigger.wait(5), {"run"})
+
+
+if __name__ == "__main__":
+    unittest.main()
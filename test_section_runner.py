@@ -0,0 +1,121 @@
+"""
+offline checks of run_sections: a section which fails or overruns its
+timeout is given its failure text, and the rest of the update goes on
+"""
+import contextlib
+import io
+import threading
+import time
+import unittest
+from unittest import mock
+
+import update_note
+from section_runner import Section, run_sections
+
+
+def run(sections, **kw):
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return run_sections(sections, **kw)
+
+
+class TestRunSections(unittest.TestCase):
+    def setUp(self):
+        # a hung section's thread can't be killed, this lets it finish
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def hang(self, needs):
+        self.release.wait(10)
+        return "too late"
+
+    def test_failure_text_for_a_raising_section(self):
+        def broken(needs):
+            raise ValueError("no table on the page")
+
+        results = run(
+            [
+                Section("fx", broken, failure="Failure getting exchange rates\n"),
+                Section("week", lambda needs: "Week number 22\n", failure=""),
+                Section("publish", lambda needs: "".join(needs.values()), after=["fx", "week"]),
+            ]
+        )
+        self.assertEqual(
+            results,
+            {
+                "fx": "Failure getting exchange rates\n",
+                "week": "Week number 22\n",
+                "publish": "Failure getting exchange rates\nWeek number 22\n",
+            },
+        )
+
+    def test_timeout_gives_the_failure_without_waiting(self):
+        started = time.monotonic()
+        results = run(
+            [
+                Section("almanac", self.hang, timeout=0.2, failure="Failure extracting almanac"),
+                Section("bike", lambda needs: "Miles: 12.5", timeout=5, failure="Failure bike"),
+                Section("publish", lambda needs: dict(needs), after=["almanac", "bike"]),
+            ]
+        )
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(results["almanac"], "Failure extracting almanac")
+        self.assertEqual(results["bike"], "Miles: 12.5")
+        # the dependent ran, with the failure text in place of the hung section
+        self.assertEqual(
+            results["publish"], {"almanac": "Failure extracting almanac", "bike": "Miles: 12.5"}
+        )
+
+    def test_each_section_has_its_own_deadline(self):
+        def slow(needs):
+            time.sleep(0.3)
+            return "Week number 22"
+
+        results = run(
+            [
+                Section("fx", self.hang, timeout=0.1, failure="Failure fx"),
+                Section("week", slow, timeout=5, failure="Failure week"),
+            ]
+        )
+        # week outlives fx's deadline, but not its own
+        self.assertEqual(results, {"fx": "Failure fx", "week": "Week number 22"})
+
+    def test_results_in_declared_order(self):
+        def later(needs):
+            time.sleep(0.1)
+            return "b"
+
+        results = run(
+            [
+                Section("b", later),
+                Section("c", lambda needs: needs["b"] + "c", after=["b"]),
+                Section("a", lambda needs: "a"),
+            ]
+        )
+        self.assertEqual(list(results.items()), [("b", "b"), ("c", "bc"), ("a", "a")])
+
+
+class TestSectionPlan(unittest.TestCase):
+    def test_report_carries_each_sections_failure_text(self):
+        def broken(needs):
+            raise OSError("BoE unreachable")
+
+        sections = {
+            "fx": Section("fx", broken, timeout=1, failure=update_note.SECTIONS["fx"].failure),
+            "week": Section("week", lambda needs: "Week number 22\n", timeout=1),
+        }
+        published = []
+
+        def publish(needs):
+            published.append(update_note.reportText(needs))
+            return published[-1]
+
+        with mock.patch.dict(update_note.SECTIONS, sections), mock.patch.object(
+            update_note, "sink", "print"
+        ):
+            results = run(update_note.section_plan(["fx", "week"], publish))
+        self.assertEqual(results["fx"], "Failure getting exchange rates\n\n\n")
+        self.assertEqual(published, ["Failure getting exchange rates\n\n\nWeek number 22\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()
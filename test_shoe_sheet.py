@@ -0,0 +1,121 @@
+"""
+offline checks of shoe_sheet against a made up Shoes sheet and run log, for
+what "shoe_sheet unit tests.py" can't reach without the live sheet
+"""
+import collections
+import unittest
+
+import pandas as pd
+
+import shoe_sheet
+import write_buffer
+
+
+def shoes_sheet(first_date="01/01/2020"):
+    return pd.DataFrame(
+        {
+            "Start Date": [first_date, "01/06/2020", "01/01/2021", "31/02/2021", "01/03/2022"],
+            "Type": ["Road", "XC", "Road", "Road", "XC"],
+            "Name": ["Koa", "Mudclaw", "Pegasus", "Ghost", "Talon"],
+        }
+    )
+
+
+def run_log():
+    dates = pd.to_datetime(["2020-03-01", "2021-04-01", "2021-05-01", "2022-06-01"])
+    return pd.DataFrame(
+        {"Remarks": ["", "", "xc hills", "xc mud"], "Route": ["", "", "", ""]},
+        index=dates,
+    )
+
+
+class TestRejectedStartDate(unittest.TestCase):
+    def test_rejected_date_is_reported(self):
+        shoes = shoe_sheet.ShoeManager(shoes_sheet())
+        self.assertEqual([(r.column, r.row) for r in shoes.rejected], [("Start Date", 5)])
+        self.assertIs(type(shoes.rejected[0].row), int)
+
+    def test_undated_shoe_is_never_assigned(self):
+        shoes = shoe_sheet.ShoeManager(shoes_sheet())
+        runner = shoe_sheet.ShoeTracker(shoes, year=2021)
+        log = run_log()
+        one_by_one = log.apply(runner.assign_names, axis="columns")
+        batch = runner.assign_all(log)
+        self.assertEqual(list(batch), ["Koa", "Pegasus", "Mudclaw", "Talon"])
+        self.assertEqual(list(one_by_one), list(batch))
+
+    def test_matches_a_sheet_without_the_bad_row(self):
+        clean = shoes_sheet().drop(index=3).reset_index(drop=True)
+        expected = shoe_sheet.ShoeTracker(
+            shoe_sheet.ShoeManager(clean), year=2021
+        ).assign_all(run_log())
+        runner = shoe_sheet.ShoeTracker(shoe_sheet.ShoeManager(shoes_sheet()), year=2021)
+        self.assertEqual(list(runner.assign_all(run_log())), list(expected))
+
+
+class TestFuzzyMatch(unittest.TestCase):
+    def test_one_edit(self):
+        one_edit = shoe_sheet.ShoeManager.one_edit
+        for typo in ("stolenkao", "tsolenkoa", "stolenkoz", "stolenko", "stolenkoaa", "stolenkoa"):
+            self.assertTrue(one_edit(typo, "stolenkoa"), typo)
+        for typo in ("stloenkao", "sotlenkao", "stolenk", "koastolen"):
+            self.assertFalse(one_edit(typo, "stolenkoa"), typo)
+
+    def test_transposed_remark(self):
+        shoes = shoe_sheet.ShoeManager(shoes_sheet(), fuzzy=True)
+        self.assertEqual(shoes.match_remark({"pegasus"}), 2)
+        self.assertEqual(shoes.match_remark({"pegauss"}), 2)
+        self.assertIsNone(shoes.match_remark({"nosuchshoe"}))
+
+
+def hashed_sheet():
+    """
+    a Shoes sheet with its YTD and the year hashes in column 6 (G), as
+    ShoeMileYears would have written them
+    """
+    sheet = shoes_sheet().drop(index=3).reset_index(drop=True)
+    sheet["Retired"] = ""
+    sheet["Remarks"] = ""
+    sheet["YTD"] = [300.0, 40.0, 250.5, 12.0]
+    sheet["Years"] = [
+        "2020: 300.0\n", "2020: 40.0\n", "2021: 200.0\n2022: 50.5\n", "2022: 12.0\n"
+    ]
+    return sheet
+
+
+class TestMileYearsColumn(unittest.TestCase):
+    Gdoc = collections.namedtuple("Gdoc", "id")
+
+    def test_save_writes_the_column_load_read(self):
+        writer = write_buffer.WriteBuffer(self.Gdoc("running log"))
+        shoes = shoe_sheet.ShoeManager(hashed_sheet(), writer=writer)
+        adder = shoe_sheet.ShoeMileYears(shoes, 6)
+        self.assertEqual(adder.cn, "Years")
+        adder.load()
+        adder.set_year(3, 2023, 7.5)
+        adder.save()
+        self.assertEqual(list(shoes.backing_sheet.columns)[6], "Years")
+        self.assertEqual(len(shoes.backing_sheet.columns), 7)
+        reloaded = shoe_sheet.ShoeMileYears(shoes, 6)
+        reloaded.load()
+        self.assertEqual(reloaded.year_hashes, adder.year_hashes)
+        self.assertEqual(reloaded.stored(3, 2023), 7.5)
+
+    def test_unchanged_rerun_writes_nothing(self):
+        writer = write_buffer.WriteBuffer(self.Gdoc("running log"))
+        shoes = shoe_sheet.ShoeManager(hashed_sheet(), writer=writer)
+        adder = shoe_sheet.ShoeMileYears(shoes, 6)
+        adder.load()
+        adder.total("Talon", 2022, 12.0)  # the same miles as before
+        adder.push_updates()
+        self.assertEqual(writer.dirty(), {})
+        # and a change is written to column G, where the hashes are
+        adder.total("Talon", 2022, 14.0)
+        adder.push_updates()
+        self.assertEqual(
+            sorted(writer.dirty()), [(shoe_sheet.SHEET, 5, 6), (shoe_sheet.SHEET, 5, 7)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
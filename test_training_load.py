@@ -0,0 +1,93 @@
+"""
+offline checks that the training load carried forward from a saved state,
+and rewound when the log is edited, matches working it out from scratch
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import training_load
+from activity_index import ActivityIndex
+
+
+def log(days=90, seed=3):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=days, freq="D")
+    # most days a run, some two, some none
+    runs = pd.Series(rng.choice([0, 3.1, 5.0, 6.2, 13.1], size=days), index=dates)
+    doubles = pd.Series(2.0, index=dates[::9])
+    return pd.concat([runs[runs > 0], doubles]).sort_index()
+
+
+def index(runs):
+    return ActivityIndex(runs.index, runs.values)
+
+
+class TestRewind(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.runs = log()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def from_scratch(self, runs, through):
+        load = training_load.TrainingLoad(self.path("never-saved.json"))
+        load.update("run", index(runs), through)
+        return load.load("run", through)
+
+    def carried(self, edit, through="2024-03-10"):
+        """
+        the load brought up to 20 Feb and saved, then the log edited and the
+        load brought up to through from the saved state
+        """
+        load = training_load.TrainingLoad(self.path("load.json"))
+        load.update("run", index(self.runs[:"2024-02-20"]), "2024-02-20")
+        load.save()
+        edited = edit(self.runs.copy())
+        load = training_load.TrainingLoad(self.path("load.json"))
+        load.update("run", index(edited), through)
+        np.testing.assert_allclose(load.load("run", through), self.from_scratch(edited, through))
+        return load.load("run", through)
+
+    def test_new_days_only(self):
+        self.carried(lambda runs: runs)
+
+    def test_edit_a_past_day(self):
+        def edit(runs):
+            runs[pd.Timestamp("2024-02-12")] = 26.2
+            return runs
+
+        unedited = self.carried(lambda runs: runs)
+        self.assertNotAlmostEqual(self.carried(edit)[1], unedited[1])
+
+    def test_delete_and_add_past_runs(self):
+        def edit(runs):
+            runs = runs.drop(pd.Timestamp("2024-02-15"), errors="ignore")
+            return pd.concat([runs, pd.Series([8.0], index=[pd.Timestamp("2024-02-18")])])
+
+        self.carried(edit)
+
+    def test_edit_the_oldest_kept_day_recomputes(self):
+        oldest = pd.Timestamp("2024-02-20") - pd.Timedelta(days=training_load.HISTORY_DAYS - 1)
+
+        def edit(runs):
+            runs[oldest] = 30.0
+            return runs
+
+        self.carried(edit)
+
+    def test_same_day_again_changes_nothing(self):
+        load = training_load.TrainingLoad(self.path("load.json"))
+        load.update("run", index(self.runs), "2024-03-10")
+        before = load.load("run", "2024-03-10")
+        load.update("run", index(self.runs), "2024-03-10")
+        self.assertEqual(load.load("run", "2024-03-10"), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
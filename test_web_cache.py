@@ -0,0 +1,113 @@
+"""
+offline checks of when a web_cache entry stops being fresh, and of what a
+get fetches, against a made up page
+"""
+import datetime
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import web_cache
+
+
+def at(*when):
+    return time.mktime(datetime.datetime(*when).timetuple())
+
+
+class TestExpiry(unittest.TestCase):
+    def test_almanac_is_not_fresh_after_midnight(self):
+        (fresh, stale) = web_cache.SOURCES["almanac"]
+        midnight = at(2024, 5, 28)
+        self.assertEqual(web_cache.expiry(at(2024, 5, 27, 22), fresh, stale), (midnight, midnight))
+        self.assertEqual(
+            web_cache.expiry(at(2024, 5, 27, 9), fresh, stale), (at(2024, 5, 27, 12), midnight)
+        )
+
+    def test_rates_carry_over_midnight(self):
+        (fresh, stale) = web_cache.SOURCES["fx"]
+        fetched = at(2024, 5, 27, 22)
+        self.assertEqual(
+            web_cache.expiry(fetched, fresh, stale), (fetched + 6 * 3600, fetched + 4 * 86400)
+        )
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise OSError(self.status_code)
+
+    def iter_content(self, size):
+        return iter([self.body])
+
+
+class FakeSession:
+    """
+    serves the page with an ETag, and a 304 to a request which has it
+    """
+
+    def __init__(self, body=b"1.17"):
+        self.body = body
+        self.sent = []  # the headers of each request
+
+    def get(self, url, headers, timeout, stream):
+        self.sent.append(headers)
+        if headers.get("If-None-Match") == "v1":
+            return FakeResponse(304)
+        return FakeResponse(200, self.body, {"ETag": "v1"})
+
+
+class TestGet(unittest.TestCase):
+    URL = "https://example.com/rates"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = web_cache.WebCache(directory.name)
+        self.session = FakeSession()
+        patch = mock.patch.object(web_cache.transport, "http_session", lambda: self.session)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def get(self, now, **kw):
+        def parse(chunks):
+            return b"".join(chunks).decode()
+
+        with mock.patch("builtins.print"):
+            return self.cache.get("fx", self.URL, parse, now=now, **kw)
+
+    def test_fresh_entry_is_not_fetched(self):
+        fetched = time.time()
+        self.assertEqual(self.get(fetched), "1.17")
+        self.assertEqual(self.get(fetched + 3 * 3600), "1.17")
+        self.assertEqual(len(self.session.sent), 1)
+
+    def test_forced_refresh_fetches(self):
+        fetched = time.time()
+        self.get(fetched)
+        # well within the 6h the rates are fresh for, as the daemon's 3h
+        # schedule or a requested refresh would ask
+        self.assertEqual(self.get(fetched + 60, revalidate=True), "1.17")
+        self.assertEqual(len(self.session.sent), 2)
+        self.assertEqual(self.session.sent[1].get("If-None-Match"), "v1")  # a 304
+        # and a changed page is parsed and kept
+        self.session.body = b"1.18"
+        self.cache._write("fx", dict(self.cache._read("fx", self.URL), etag="v0"))
+        self.assertEqual(self.get(fetched + 120, revalidate=True), "1.18")
+        self.assertEqual(self.get(fetched + 180), "1.18")
+        self.assertEqual(len(self.session.sent), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
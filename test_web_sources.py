@@ -0,0 +1,67 @@
+"""
+offline checks of the streaming extraction in web_sources
+"""
+import contextlib
+import io
+import unittest
+
+import web_sources
+
+ALMANAC = """<html><body><table><tr><td>
+<table>{open}
+<tr><td class="data1">Sunrise</td><td>05:01</td></tr>
+<tr><td class="data1">Sunset</td><td>21:03</td></tr>
+<tr><td class="data1">Moonrise</td><td>00:42</td></tr>
+<tr><td class="data1">Moonset</td><td>09:15</td></tr>
+<tr><td class="data1">Daylight</td><td>16:02</td></tr>
+<tr><td><table><tr><td>High tide</td><td>06:12</td></tr></table></td></tr>
+{close}</table>
+<img src="moon21.gif" alt="Waning Gibbous">
+</td></tr></table></body></html>"""
+
+
+def parse(page, size=64):
+    chunks = (page[i : i + size].encode() for i in range(0, len(page), size))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return web_sources.parse_almanac(chunks)
+
+
+class TestAlmanac(unittest.TestCase):
+    def test_with_and_without_tbody(self):
+        expected = (
+            "Sunrise 05:01\nSunset 21:03\n\nHigh tide\n06:12",
+            "Moonrise 00:42",
+            "Waning Gibbous",
+        )
+        self.assertEqual(parse(ALMANAC.format(open="", close="")), expected)
+        self.assertEqual(parse(ALMANAC.format(open="<tbody>", close="</tbody>")), expected)
+
+    def test_no_almanac(self):
+        page = "<html><body><table><tr><td>x</td></tr></table></body></html>"
+        self.assertEqual(parse(page), (None, None, None))
+
+
+RATES = """<html><body><p>Spot rates 27 May 2024</p>
+<table>
+<tr><th>Currency</th><th>27 May 2024</th><th>52 week high</th><th>52 week low</th></tr>
+<tr><td>Euro</td><td>1.1742</td><td>1.1944</td><td>1.1410</td></tr>
+<tr><td>US Dollar</td><td>1.2745</td>
+<td><table><tr><td>1.3142</td></tr></table></td><td>1.2037</td></tr>
+</table>
+<table><tr><td>Japanese Yen</td><td>200.01</td></tr></table>
+</body></html>"""
+
+
+class TestRates(unittest.TestCase):
+    def test_first_table_not_the_innermost(self):
+        chunks = (RATES[i : i + 64].encode() for i in range(0, len(RATES), 64))
+        rows = web_sources.rate_rows(chunks)
+        # the outer table's rows (the nested one's row among them), where the
+        # nested table, which closes first, was taken for it
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0], ([], "Currency27 May 202452 week high52 week low"))
+        self.assertEqual(rows[1][0], ["Euro", "1.1742", "1.1944", "1.1410"])
+        self.assertEqual(rows[2][0][:3], ["US Dollar", "1.2745", "1.3142"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+offline checks of what WriteBuffer.flush sends, with the sheets calls of
+transport swapped for recorders
+"""
+import collections
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import write_buffer
+
+Gdoc = collections.namedtuple("Gdoc", "id")
+
+
+class TestFlush(unittest.TestCase):
+    def flush(self, buffer, grids):
+        calls = []
+        with mock.patch.multiple(
+            write_buffer.transport,
+            sheet_grids=lambda gdoc: calls.append("grids") or grids,
+            sheets_batch_update=lambda gdoc, requests: calls.append(("grow", requests)),
+            values_batch_update=lambda gdoc, data: calls.append(("values", data)),
+        ):
+            buffer.flush()
+        return calls
+
+    def test_grows_only_short_sheets_in_one_call(self):
+        buffer = write_buffer.WriteBuffer(Gdoc("book"))
+        buffer.addData("C", 101, [["=C100+B101"]], sheet="2017 Grater", growSheet=True)
+        buffer.addData("C", 51, [["=C50+B51"]], sheet="2021 Escape", growSheet=True)
+        buffer.addData("D", 51, [["=E51"]], sheet="2021 Escape", growSheet=True)
+        calls = self.flush(buffer, {"2017 Grater": (7, 100, 26), "2021 Escape": (9, 1000, 3)})
+        self.assertEqual(calls[0], "grids")
+        self.assertEqual(
+            calls[1],
+            (
+                "grow",
+                [
+                    {"appendDimension": {"sheetId": 7, "dimension": "ROWS", "length": 1}},
+                    {"appendDimension": {"sheetId": 9, "dimension": "COLUMNS", "length": 1}},
+                ],
+            ),
+        )
+        (kind, data) = calls[2]
+        self.assertEqual(kind, "values")
+        self.assertEqual(
+            [d["range"] for d in data],
+            ["'2017 Grater'!C101", "'2021 Escape'!C51", "'2021 Escape'!D51"],
+        )
+        self.assertEqual(len(calls), 3)
+
+    def test_no_grow_call_when_the_grid_is_big_enough(self):
+        buffer = write_buffer.WriteBuffer(Gdoc("book"))
+        buffer.addData("C", 51, [["=C50+B51"]], sheet="2021 Escape", growSheet=True)
+        calls = self.flush(buffer, {"2021 Escape": (9, 1000, 26)})
+        self.assertEqual([c if isinstance(c, str) else c[0] for c in calls], ["grids", "values"])
+
+    def test_unchanged_cells_send_nothing(self):
+        buffer = write_buffer.WriteBuffer(Gdoc("book"))
+        buffer.know("Shoes", pd.DataFrame({"a": ["x", "y"]}))
+        buffer.addData("A", 2, [["x"], ["y"]], sheet="Shoes")
+        self.assertEqual(self.flush(buffer, {}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
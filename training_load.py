@@ -0,0 +1,124 @@
+"""
+acute and chronic training load: the 7 and 42 day exponentially weighted
+averages of the daily distance, and their ratio, for each sport
+
+the averages are carried forward a day at a time from the state saved by
+the last run, so a daily update only folds in the day(s) since. The last
+few days folded are kept with their distances; if the log has since been
+edited on one of those days the state is rewound to before it, and if
+there is nothing to rewind to everything is recomputed from the start of
+the activity index. Because the averages are linear in the distance, and
+every sport starts from nothing, the combined load is just their sum
+"""
+import json
+import logging
+import os
+
+import numpy as np
+
+from activity_index import day
+
+logger = logging.getLogger(__name__)
+
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 42
+HISTORY_DAYS = 28  # days kept for spotting edits to the log
+
+
+def alpha(days):
+    """
+    the weight of each new day in an exponentially weighted average over days
+    """
+    return 2 / (days + 1)
+
+
+class TrainingLoad:
+    """
+    the load state of each sport, saved in path as
+    {sport: [[date, distance, acute, chronic], ...]} with the latest day last
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.history = json.load(f)
+        except (OSError, ValueError):
+            self.history = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.history, f)
+        os.replace(tmp, self.path)
+
+    def update(self, sport, index, through):
+        """
+        bring a sport's load up to the end of the day `through` from its
+        ActivityIndex
+        """
+        through = day(through)
+        history = self.history.get(sport, [])
+        # keep the days whose distance the log still agrees with
+        kept = 0
+        for (date, distance, _, _) in history:
+            if abs(index.total(date, date) - distance) > 1e-6:
+                logger.info(f"{sport} log edited on {date}, rewinding the training load")
+                break
+            kept += 1
+        history = history[:kept]
+
+        if history:
+            start = day(history[-1][0]) + np.timedelta64(1, "D")
+            (acute, chronic) = history[-1][2:]
+        elif len(index):
+            logger.info(f"{sport} training load computed from {index.dates[0]}")
+            start = index.dates[0]
+            (acute, chronic) = (0.0, 0.0)
+        else:
+            self.history[sport] = []
+            return
+
+        if start <= through:
+            (a, c) = (alpha(ACUTE_DAYS), alpha(CHRONIC_DAYS))
+            for offset, distance in enumerate(index.daily(start, through)):
+                acute += a * (distance - acute)
+                chronic += c * (distance - chronic)
+                date = str(start + np.timedelta64(offset, "D"))
+                history.append([date, float(distance), acute, chronic])
+        self.history[sport] = history[-HISTORY_DAYS:]
+
+    def load(self, sport, through):
+        """
+        (acute, chronic) for a sport at the end of the day `through`, None if
+        it hasn't been brought up to that day
+        """
+        history = self.history.get(sport)
+        if not history or history[-1][0] != str(day(through)):
+            return None
+        return tuple(history[-1][2:])
+
+    def report(self, sports, through):
+        """
+        a line per sport, and their combined load, for the daily report
+        """
+        out = f"Training load ({ACUTE_DAYS}/{CHRONIC_DAYS} day, miles a day):\n"
+        combined = [0.0, 0.0]
+        for sport in sports:
+            loads = self.load(sport, through)
+            if loads is None:
+                out += f" {sport}: not known\n"
+                combined = None
+                continue
+            out += self.line(sport, *loads)
+            if combined is not None:
+                combined = [combined[0] + loads[0], combined[1] + loads[1]]
+        if combined is not None and len(sports) > 1:
+            out += self.line("combined", *combined)
+        return out
+
+    @staticmethod
+    def line(name, acute, chronic):
+        ratio = f"{acute / chronic:.2f}" if chronic > 0 else "-"
+        return f" {name}: acute {acute:.1f} chronic {chronic:.1f} ratio {ratio}\n"
@@ -0,0 +1,283 @@
+"""
+one set of network clients shared by every section of a run
+
+the google access object (which holds the authenticated Drive, Sheets and
+Docs services) is built once, as is a keep-alive requests session for the
+web pages, so each run pays for auth and TLS handshakes only once.
+requests (and the cassette, which needs it) is only imported when the
+session is first wanted, so a run without web sections doesn't load it
+"""
+import contextlib
+import logging
+import sys
+import threading
+
+import run_metrics
+
+sys.path.append("../googledocs")
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# googleapiclient's http transport isn't thread safe, so sections take turns
+# with the shared services through google()
+_google_lock = threading.RLock()
+_access = None
+_session = None
+_files = {}
+# (mode, directory) when recording or replaying
+_cassette = None
+_drive_log = None
+
+
+def use_cassette(mode, directory):
+    """
+    record every web response and drive lookup of the run in directory,
+    or replay them from it without touching the network.
+    Call before anything uses the network
+    """
+    global _cassette, _drive_log
+    import cassette
+
+    _cassette = (mode, directory)
+    _drive_log = cassette.DriveLog(mode, directory)
+
+
+def replaying():
+    if _cassette is None:
+        return False
+    import cassette
+
+    return _cassette[0] == cassette.REPLAY
+
+
+def http_session() -> "requests.Session":
+    """
+    the shared web session: pooled keep-alive connections, compressed
+    responses and a couple of retries for a flaky gateway
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            retries = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504))
+            pool = dict(pool_connections=4, pool_maxsize=8, max_retries=retries)
+            if _cassette is None:
+                adapter = HTTPAdapter(**pool)
+            else:
+                import cassette
+
+                adapter = cassette.CassetteAdapter(*_cassette, **pool)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers["Accept-Encoding"] = "gzip, deflate"
+            _session.hooks["response"].append(run_metrics.count_response)
+    return _session
+
+
+def drive_access():
+    """
+    the shared, authenticated gdriveAccess
+    """
+    global _access
+    with _lock:
+        if _access is None:
+            import gdriveFile as gf
+
+            _access = gf.gdriveAccess()
+    return _access
+
+
+@contextlib.contextmanager
+def google():
+    """
+    hold the google services for a block of calls, eg
+        with transport.google():
+            gdoc = transport.find_drive_file("name contains 'running log'")
+    """
+    with _google_lock:
+        # a replay never talks to google, so doesn't log in either
+        yield None if replaying() else drive_access()
+
+
+def find_drive_file(search_string):
+    """
+    look up a drive file once per run and hand back the same gdriveFile
+    """
+    with _google_lock:
+        if search_string not in _files:
+            if replaying():
+                _files[search_string] = _drive_log.file(search_string)
+            else:
+                import gdriveFile as gf
+
+                run_metrics.add("api_calls")
+                _files[search_string] = gf.gdriveFile.findDriveFile(
+                    drive_access(), search_string
+                )
+                if _drive_log is not None:
+                    _drive_log.file(search_string, _files[search_string])
+        return _files[search_string]
+
+
+class RevisionMismatch(Exception):
+    """
+    a Docs batchUpdate was refused as the doc has changed since the
+    revision it was worked out against
+    """
+
+
+def document(doc_id, reload=False):
+    """
+    the gdriveFile for a google doc, looked up by id once per run, or again
+    if reload
+    """
+    import gdriveFile as gf
+
+    with _google_lock:
+        if reload or doc_id not in _files:
+            run_metrics.add("api_calls")
+            _files[doc_id] = gf.gdriveFile.gdfFromId(
+                doc_id, drive_access(), docType="document"
+            )
+        return _files[doc_id]
+
+
+def modified_time(gdoc):
+    """
+    the Drive modifiedTime of a file, a cheap metadata call which tells us
+    whether a cached copy of it is still good
+    """
+    if replaying():
+        return _drive_log.modified(gdoc.id)
+    run_metrics.add("api_calls")
+    with _google_lock:
+        info = (
+            drive_access()
+            .driveService.files()
+            .get(fileId=gdoc.id, fields="modifiedTime")
+            .execute()
+        )
+    if _drive_log is not None:
+        _drive_log.modified(gdoc.id, info["modifiedTime"])
+    return info["modifiedTime"]
+
+
+def values_batch_update(gdoc, data):
+    """
+    write a list of {"range": A1, "values": [[...]]} to a spreadsheet in
+    one call, formulas and all
+    """
+    if replaying():
+        logger.info(f"replay, not writing {len(data)} cells to {gdoc.id}")
+        return None
+    run_metrics.add("api_calls")
+    with _google_lock:
+        return (
+            drive_access()
+            .sheetsService.spreadsheets()
+            .values()
+            .batchUpdate(
+                spreadsheetId=gdoc.id,
+                body={"valueInputOption": "USER_ENTERED", "data": data},
+            )
+            .execute()
+        )
+
+
+def sheet_grids(gdoc):
+    """
+    {sheet title: (sheetId, rowCount, columnCount)} of a spreadsheet's
+    sheets, from one metadata call; empty when replaying
+    """
+    if replaying():
+        return {}
+    run_metrics.add("api_calls")
+    with _google_lock:
+        info = (
+            drive_access()
+            .sheetsService.spreadsheets()
+            .get(
+                spreadsheetId=gdoc.id,
+                fields="sheets.properties(sheetId,title,gridProperties(rowCount,columnCount))",
+            )
+            .execute()
+        )
+    grids = {}
+    for sheet in info.get("sheets", []):
+        props = sheet["properties"]
+        grid = props.get("gridProperties", {})
+        grids[props["title"]] = (
+            props["sheetId"], grid.get("rowCount", 0), grid.get("columnCount", 0)
+        )
+    return grids
+
+
+def sheets_batch_update(gdoc, requests):
+    """
+    apply a list of Sheets API requests (eg appendDimension) to a
+    spreadsheet in one call
+    """
+    if replaying():
+        logger.info(f"replay, not sending {len(requests)} requests to {gdoc.id}")
+        return None
+    run_metrics.add("api_calls")
+    with _google_lock:
+        return (
+            drive_access()
+            .sheetsService.spreadsheets()
+            .batchUpdate(spreadsheetId=gdoc.id, body={"requests": requests})
+            .execute()
+        )
+
+
+def doc_revision(doc_id):
+    """
+    the revisionId of a google doc as it is now, None when replaying
+    """
+    if replaying():
+        return None
+    run_metrics.add("api_calls")
+    with _google_lock:
+        info = (
+            drive_access()
+            .docsService.documents()
+            .get(documentId=doc_id, fields="revisionId")
+            .execute()
+        )
+    return info.get("revisionId")
+
+
+def docs_batch_update(doc, requests, revision=None):
+    """
+    apply a list of Docs API requests to a google doc in one call, which
+    the API applies atomically and in order. With a revision, the call is
+    refused (RevisionMismatch) if the doc has been edited since it.
+    Returns the doc's revisionId after the edit
+    """
+    if replaying():
+        logger.info(f"replay, not sending {len(requests)} requests to {doc.id}")
+        return None
+    body = {"requests": requests}
+    if revision is not None:
+        body["writeControl"] = {"requiredRevisionId": revision}
+    run_metrics.add("api_calls")
+    with _google_lock:
+        try:
+            response = (
+                drive_access()
+                .docsService.documents()
+                .batchUpdate(documentId=doc.id, body=body)
+                .execute()
+            )
+        except Exception as err:
+            # a googleapiclient HttpError, 400 naming the revision
+            status = getattr(getattr(err, "resp", None), "status", None)
+            if revision is not None and status == 400 and "revision" in str(err).lower():
+                raise RevisionMismatch(str(err)) from err
+            raise
+    return response.get("writeControl", {}).get("requiredRevisionId")
@@ -1,63 +1,60 @@
 #!/usr/bin/env python
-
-import requests
+"""
+build the daily update report and publish it to a Keep note (or the daily
+google doc)
+
+only the standard library (and the runner, metrics and transport modules,
+which use nothing else until asked) is imported up front: requests, pandas,
+lxml, the google clients and gkeepapi are imported by the sections and
+sinks which use them,
+and logins happen only when a selected section or sink needs them, so eg
+    update_note.py --sections fx --sink print
+starts quickly
+"""
 import re
-from bs4 import BeautifulSoup
-import gkeepapi
 import argparse
 import datetime
 import logging
-import numpy as np
-import pandas as pd
 import sys
-import io
-import traceback
-import gkeepSecrets
+import os
+import time
+from section_runner import Section, run_sections
+import run_metrics
+import transport
 
-printOnly = False
+sys.path.append("../googledocs")
 
-arg_parser = argparse.ArgumentParser(description="Update useful info in daily gDoc")
-# arg_parser.add_argument("filename", help="Filename to parse")
-arg_parser.add_argument("-d", "--debug", action="store_true", help="turn on debugging")
+WEB_TIMEOUT = 30  # seconds, for each web request
 
-args = arg_parser.parse_args()
+# the report is made of these sections, in this order
+REPORT = ("almanac", "fx", "bike", "run", "load", "week")
+SINKS = ("keep", "doc", "print")
+# the totals over other periods shown for bike and run, besides week and year
+PERIODS = ("month", "7 days", "28 days", "365 days")
+# the paragraph style of each day's "Update for ..." title in the daily doc
+ENTRY_HEADING = "HEADING_2"
+# where the daemon listens for refresh requests
+SOCKET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "update_note.sock")
 
 logger = logging.getLogger(__name__)
 LOGGER_LEVEL = logging.ERROR
-if args.debug:
-    LOGGER_LEVEL = logging.DEBUG
-
-keepAccess = gkeepapi.Keep()
-try:
-    keepAccess.login(gkeepSecrets.mySecrets.app_user, gkeepSecrets.mySecrets.app_pw)
-except Exception as err:
-    print(err)
-    print("gKeep login failure, using print only")
-    printOnly = True
 
-
-sys.path.append("../googledocs")
-import gdriveFile as gf
-import gdocHelper as gh
-
-access = gf.gdriveAccess()
-# keepAccess.load(access.credentials)
-# outGdoc = gf.gdriveFile.gdfFromId(gkeepSecrets.mySecrets.TESTDOCID, access, docType='document')
-if args.debug:
-    outGdoc = gf.gdriveFile.gdfFromId(
-        gkeepSecrets.mySecrets.TESTDOCID
-        , access
-        , docType="document"
-    )
-else:
-    outGdoc = gf.gdriveFile.gdfFromId(
-        gkeepSecrets.mySecrets.TODAYDOCID
-        , access
-        , docType="document"
-    )
-gh.GdocHelper.assertIsDoc(outGdoc)  # upgrade to a gdocHelper object
-                                    # also has the side-effect of parsing the
-                                    # document to create an 'outline' index
+# set up by main() for the selected sections and sink
+sheetCache = None
+lean = False
+distanceClasses = {}
+# the ActivityIndex of each sport, left by its section for the training load
+activity = {}
+keepAccess = None
+outGdoc = None
+# the DateOutline of outGdoc, and the doc's revision it is of
+outOutline = None
+outRevision = None
+# the WebCache of the scraped pages, and whether every get revalidates: the
+# daemon's schedule (or a request) says when a page is due, not its TTL
+webCache = None
+webRevalidate = False
+sink = "print"
 
 
 class ExchangeRate(object):
@@ -73,10 +70,10 @@ class ExchangeRate(object):
 
     def calcHiLo(self, c):
         stats = {}
-        rate = float(c[1].text.strip())
+        rate = float(c[1].strip())
         stats["today"] = rate
-        yearHi = float(c[2].text.strip())
-        yearLo = float(c[3].text.strip())
+        yearHi = float(c[2].strip())
+        yearLo = float(c[3].strip())
         stats["yearHi"] = yearHi
         stats["yearLo"] = yearLo
         print(f"today: {rate} hi: {yearHi} lo: {yearLo}")
@@ -87,32 +84,44 @@ class ExchangeRate(object):
         stats["sellRecommend"] = prop
         return stats
 
+    def parseRates(self, chunks):
+        """
+        the rates from the BoE page, as getRates leaves them in self.rates
+        """
+        import web_sources
+
+        rates = {}
+        for (cells, rowText) in web_sources.rate_rows(chunks):
+            if len(cells) > 0:
+                currency = cells[0].strip()
+                if currency == "Euro":
+                    rates["GBPEUR"] = self.calcHiLo(cells)
+                if currency == "US Dollar":
+                    rates["GBPUSD"] = self.calcHiLo(cells)
+            else:
+                # the thead row has lots of \r \t formatting chars,
+                # so just parse out the date of the data
+                # print(repr(rowText))
+                matchObj = ExchangeRate.dateMatch.search(rowText)
+                if matchObj:
+                    rates["date"] = matchObj.group(0)
+                    print(matchObj.group(0))
+        if "GBPEUR" not in rates or "GBPUSD" not in rates:
+            raise ValueError("no GBPEUR / GBPUSD rows in the rates table")
+        return rates
+
     def getRates(self):
         sendHeaders = {"user-agent": ExchangeRate.fakeUserAgent}
-        with requests.session() as requests_session:
-            r = requests_session.get(self.url, headers=sendHeaders)
-            print("<-Get():", r.status_code)
-            # print(r.content)
-            c = BeautifulSoup(r.content, features="lxml")
-            rateTable = c.find("table")
-            rows = rateTable.find_all("tr")
-            for row in rows:
-                # print(row)
-                cells = row.find_all("td")
-                if len(cells) > 0:
-                    currency = cells[0].text.strip()
-                    if currency == "Euro":
-                        self.rates["GBPEUR"] = self.calcHiLo(cells)
-                    if currency == "US Dollar":
-                        self.rates["GBPUSD"] = self.calcHiLo(cells)
-                else:
-                    # the thead row has lots of \r \t formatting chars,
-                    # so just parse out the date of the data
-                    # print(repr(row.text))
-                    matchObj = ExchangeRate.dateMatch.search(row.text)
-                    if matchObj:
-                        self.rates["date"] = matchObj.group(0)
-                        print(matchObj.group(0))
+        # only the first table matters, reading the page stops after it;
+        # the parsed rates are cached, so an unchanged page isn't parsed again
+        self.rates = webPages().get(
+            "fx",
+            self.url,
+            self.parseRates,
+            headers=sendHeaders,
+            timeout=WEB_TIMEOUT,
+            revalidate=webRevalidate,
+        )
         return self
 
 
@@ -145,9 +154,12 @@ def runMileage(dates):
                 pre = "new"
         return pre + sup
 
-    sys.path.append("../googledocs")
-    import gdriveFile as gf
+    import pandas as pd
+    import lean_frames
+    import mileage
+    import sheet_schema
     import shoe_sheet
+    import write_buffer
 
     # yearStr = str(datetime.datetime.now().year)
     if dates[0].year != dates[1].year:
@@ -164,69 +176,98 @@ def runMileage(dates):
 
     start = yearStr + "-01-01"  # first Jan
     end = yearStr + "-12-31"  # end Dec
+    lastYearStr = str(int(yearStr) - 1)
+    # the rolling totals run up to yesterday
+    day = yesterday.date()
 
     nameQuery = "running log"
     searchString = "name contains '{}'".format(nameQuery)
 
     # print('searching for "{}"'.format(searchString))
 
-    access = gf.gdriveAccess()
-    gdoc = gf.gdriveFile.findDriveFile(access, searchString)
+    with transport.google():
+        gdoc = transport.find_drive_file(searchString)
+
+        # gdoc.showFileInfo()
 
-    # gdoc.showFileInfo()
+        # nothing changed since the last run for this week, nothing to do
+        modified = transport.modified_time(gdoc)
+        miles = sheetCache.result("run", modified, (yearStr, dates, day, distanceClasses))
+        if miles is not None and not transport.replaying():
+            print(f"running log unchanged since {modified}")
+            return miles
 
-    gdf = gdoc.toDataFrame(usecols=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
+        snapshot = sheetCache.frames(
+            gdoc,
+            gdoc.id,
+            modified,
+            usecols=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+            sheets=[yearStr, lastYearStr, shoe_sheet.SHEET],
+        )
+    gdf = snapshot.frames
 
     gdfs = gdf[yearStr]  # only interested in the sheet named for the year
-    gdfs.index = pd.to_datetime(
-        gdfs.iloc[:, 0], dayfirst=True
-    )  # assume zeroth column has date
-    gdfs.drop("Date", axis=1, inplace=True)
-    cn = "Distance miles"
-
-    # anything in the miles column, that doesn't look like a decimal,
-    # get's turned into NaN, and then 0
-    gdfs.replace({cn: r"(?![\.0-9]+)"}, {cn: np.nan}, regex=True, inplace=True)
-    gdfs.fillna({cn: 0}, inplace=True)  # blanks / nulls etc set to 0
-    # and the 'km' column to cope with skeleton formula
-    gdfs.replace({'km': r"(?![\.0-9]+)"}, {'km': 0}, regex=True, inplace=True)
-
-    gdfs["tenk"] = gdfs["km"] >= 10
-    tenks = len(gdfs[gdfs["tenk"] == True])
-    if tenks == 0:
-        mostRecent10kRank = 0
-    else:
-        gdfs["tenkrank"] = gdfs[gdfs["tenk"] == True]["Pace"].rank(method="max")
-        # display(gdfs[gdfs['tenk'] == True])
-        mostRecent10kRank = gdfs[gdfs["tenk"] == True]["tenkrank"].tail(1).iloc[0]
-    print(gdfs.columns)
-
-    # Track half marathons (21.1 km)
-    gdfs["halfmarathon"] = gdfs["km"] >= 21.1  # Half marathon in kilometers
-    halfmarathons = len(gdfs[gdfs["halfmarathon"] == True])
-    if halfmarathons == 0:
-        mostRecentHalfMarathonRank = 0
-    else:
-        gdfs["halfmarathonrank"] = gdfs[gdfs["halfmarathon"] == True]["Pace"].rank(method="max")
-        mostRecentHalfMarathonRank = gdfs[gdfs["halfmarathon"] == True]["halfmarathonrank"].tail(1).iloc[0]
+    # the cells which don't convert to the sheet's column types
+    rejected = []
+    mileage.clean_run_sheet(gdfs, rejected)
+    cn = mileage.DISTANCE
+    # and last year's, for the rolling totals
+    lastYear = gdf.get(lastYearStr)
+    if lastYear is not None:
+        mileage.clean_run_sheet(lastYear, rejected)
+
+    # the paces of earlier years, to rank this year's runs against; a year
+    # sheet is only read (from the snapshot) when the book lacks it
+    paceBook = mileage.PaceBook.load(
+        os.path.join(sheetCache.directory, "pace-book.json"), distanceClasses
+    )
+    missing = paceBook.missing(snapshot.last_row, yearStr)
+    if missing:
+        earlier = {name: gdf[name] for name in missing if name in gdf}
+        unread = [name for name in missing if name not in gdf]
+        if unread:
+            with transport.google():
+                frames = sheetCache.frames(
+                    gdoc, gdoc.id, modified, usecols=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+                    sheets=unread,
+                ).frames
+            earlier.update({k: mileage.clean_run_sheet(f) for k, f in frames.items()})
+        for name, frame in earlier.items():
+            paceBook.add_year(name, frame, snapshot.last_row[name])
+        paceBook.save()
+    if lean:
+        report = lean_frames.MemoryReport("running log")
+        report.slim(yearStr, gdfs, categorical=["Route"])
+        if lastYear is not None:
+            report.slim(lastYearStr, lastYear, categorical=["Route"])
+        # the Shoes sheet is written back, so its numbers are left as they are
+        report.slim(
+            shoe_sheet.SHEET, gdf[shoe_sheet.SHEET],
+            categorical=[shoe_sheet.TYPE], numeric=False,
+        )
+        print(report.text())
+    logger.debug("%s", gdfs.columns)
+
+    # all the writes to the workbook are queued and sent together at the end
+    writer = write_buffer.WriteBuffer(gdoc)
 
     # Now the document is cached, look at the bottom left and decide
     # whether to add some skeleton entries
-    lr = gdoc.lastRow[yearStr]
+    lr = snapshot.last_row[yearStr]
     bottomLeftCell = gdfs.iloc[lr - 2, 0]  # -1 title, -1 0 base in df
     print("bottom left cell :", bottomLeftCell, ":")
     if bottomLeftCell == "":  # 0 date
         pass
     else:
         nr = lr + 1  # row number for new row
-        gdoc.addData(
+        writer.addData(
             "D",
             nr,
             [["=E{}/'2017'!$K$2".format(nr)]],
             sheet=yearStr,
             growSheet=True,
         )
-        gdoc.addData(
+        writer.addData(
             "G",
             nr,
             [["=C{}/D{}".format(nr, nr), "=C{}/E{}".format(nr, nr)]],
@@ -240,19 +281,25 @@ def runMileage(dates):
     # initialize a ShoeManager object, using data from `gdoc`
     # `gdoc` is locally loaded in the DataFrame gdf
     # and its "Shoes" sheet is the database
-    shoes = shoe_sheet.ShoeManager(gdf["Shoes"], handle=gdoc)
+    shoes = shoe_sheet.ShoeManager(gdf["Shoes"], handle=gdoc, writer=writer)
+    rejected += shoes.rejected
+    if rejected:
+        print(sheet_schema.describe(rejected))
 
     # create a ShoeTracker object for the current year
     # the base shoes are set up to be those in use at year start
     # the new shoes are any new in that year
     shoe_runner = shoe_sheet.ShoeTracker(shoes, year=int(yearStr))
-    gdfs["shoe"] = gdfs.apply(shoe_runner.assign_names, axis="columns")
-
-    thisWeek = gdfs[(gdfs.index >= weekSt) & (gdfs.index <= weekNd)].copy()
 
-    # .map(
-    #     shoe_runner.shoe_name_mapping
-    # )  # astype("category")
+    # only the rows added since the last run need their shoe working out
+    checkpoint = mileage.RunCheckpoint.load(
+        os.path.join(sheetCache.directory, f"run-checkpoint-{yearStr}.json"),
+        yearStr,
+        mileage.shoes_hash(shoes),
+        distanceClasses,
+    )
+    (totals, index) = mileage.run_totals(gdfs, shoe_runner, checkpoint, lastYear)
+    activity["run"] = index
 
     # create a ShoeMileYears object from the SheetManager, the
     # end of year totals for previous years are hashes stored in col 6
@@ -260,26 +307,41 @@ def runMileage(dates):
     # read in those hashes
     adder.load()
 
-    yearlyShoeSum = gdfs.groupby(["shoe"])[cn].sum()
-    weeklyShoeSum = thisWeek.groupby(["shoe"])[cn].sum()
+    weeklyShoeSum = index.totals(weekSt, weekNd)
 
     miles = {}
     # print(gdfs.iloc[:, 4])
-    print(gdfs.loc[:, cn])
-    miles[cn] = gdfs[cn].sum()
+    logger.debug("%s", gdfs[cn])
+    miles[cn] = totals.total
 
     for k in weeklyShoeSum.keys():
         if weeklyShoeSum[k] > 0:
             # as a side effect, adder updates YTD and year_hashes
-            miles[k] = adder.total(k, int(yearStr), yearlyShoeSum[k])
+            miles[k] = adder.total(k, int(yearStr), totals.shoe_totals[k])
 
     # Now write back the updates into the shoes sheet in gdrive
+    # (queued on writer, only the cells which changed are sent)
     adder.push_updates()
-
-    miles["week" + cn] = thisWeek[cn].sum()
-    miles["10k's"] = "{:} {:d}/{:d}".format(tenks, int(mostRecent10kRank), int(tenks))
-    miles["Half Marathons"] = "{:} {:d}/{:d}".format(halfmarathons, int(mostRecentHalfMarathonRank), int(halfmarathons))
+    with transport.google():
+        writer.flush()
+
+    # the week may start in the other year, only this year's sheet counts
+    miles["week" + cn] = index.total(max(weekSt, start), min(weekNd, end))
+    for period, total in index.periods(day).items():
+        if period in PERIODS:
+            miles[f"{period} {cn}"] = total
+    for name in distanceClasses:
+        (count, rank, every, best) = paceBook.standings(totals, name)
+        latest = "-" if rank is None else f"{rank}/{every}"
+        pb = "-" if best is None else mileage.format_pace(best)
+        miles[name] = f"{count} this year, latest {latest}, PB {pb}"
     print(miles)
+    checkpoint.save()
+    # our own writes move modifiedTime on, so take it again for the result
+    with transport.google():
+        sheetCache.store_result(
+            "run", transport.modified_time(gdoc), (yearStr, dates, day, distanceClasses), miles
+        )
     return miles
 
 
@@ -287,123 +349,92 @@ def bikeMileage(dates):
     """
     dates is a list containing inclusive start and end
     """
+    import pandas as pd
+    import lean_frames
+    import mileage
+    import sheet_schema
+    import write_buffer
 
-    sys.path.append("../googledocs")
-    import gdriveFile as gf
-
-    graterName = "2017 Charge Grater"
-    talonName = "2014 Giant Talon 29er"
-    sheetNames = [talonName, graterName, "2021 Giant Escape"]
-
+    day = yesterday.date()
     yearStr = str(datetime.datetime.now().year)
 
-    start = yearStr + "-01-01"  # first Jan
-    end = yearStr + "-12-31"  # end Dec
-
     nameQuery = "bike mileage"
     searchString = "name contains '{}'".format(nameQuery)
 
     # print('searching for "{}"'.format(searchString))
 
-    access = gf.gdriveAccess()
-    gdoc = gf.gdriveFile.findDriveFile(access, searchString)
-
-    # gdoc.showFileInfo()
-
-    gdf = gdoc.toDataFrame(usecols=[0, 1, 2, 4])
-
-    # I know the grater sheet has column names
-    grater = gdf[graterName]  # .iloc[:,0:5]
-
-    gdfs = {}  # selected version
-    for s in sheetNames:
-        print(s)
-        print(gdf[s].head())
-        # print(grater.columns)
-        gdf[s].columns = grater.columns
-        # print(gdf[s])
-        gdf[s].index = pd.to_datetime(
-            gdf[s].iloc[:, 0], dayfirst=True
-        )  # assume zeroth column has date
-        gdfs[s] = gdf[s][(gdf[s].index >= start) & (gdf[s].index <= end)].copy()
-        gdfs[s].name = gdf[s].name
-        gdfs[s].drop("Date", axis=1, inplace=True)
-        # catenate the frame name on the column to avoid asymmetry of merge
-        gdfs[s].rename(
-            {col: "{}{}".format(col, gdfs[s].name) for col in gdfs[s].columns},
-            axis="columns",
-            inplace=True,
-        )
-        # print(gdfs[s])
+    with transport.google():
+        gdoc = transport.find_drive_file(searchString)
+
+        # gdoc.showFileInfo()
+
+        modified = transport.modified_time(gdoc)
+        miles = sheetCache.result("bike", modified, (yearStr, dates, day))
+        if miles is not None and not transport.replaying():
+            print(f"bike mileage unchanged since {modified}")
+            return miles
+
+        snapshot = sheetCache.frames(gdoc, gdoc.id, modified, usecols=[0, 1, 2, 4])
+    gdf = snapshot.frames
+    # the bikes from bikes.json, or every sheet named for a bike
+    bikes = mileage.bike_config(gdf)
+    if lean:
+        report = lean_frames.MemoryReport("bike mileage")
+        for bike in bikes:
+            report.slim(bike.name, gdf[bike.name])
+        print(report.text())
+
+    rejected = []
+    ledger = mileage.bike_ledger(gdf, bikes, rejected)
+    if rejected:
+        print(sheet_schema.describe(rejected))
 
     # Now the document is cached, look at the bottom left and decide
     # whether to add some skeleton entries
-    for s in sheetNames:
-        lr = gdoc.lastRow[s]
-        if s != talonName:
-            # has title
-            bottomLeftCell = gdf[s].iloc[lr - 2, 0]  # -1 title, -1 0 base in df
+    writer = write_buffer.WriteBuffer(gdoc)
+    for bike in bikes:
+        s = bike.name
+        lr = snapshot.last_row[s]
+        # the dates are the index now, a blank one is NaT
+        if bike.title_row:
+            bottomLeftCell = gdf[s].index[lr - 2]  # -1 title, -1 0 base in df
         else:
-            bottomLeftCell = gdf[s].iloc[lr - 1, 0]  # -1 0 base in df
+            bottomLeftCell = gdf[s].index[lr - 1]  # -1 0 base in df
         print("bottom left cell :", bottomLeftCell, ":")
-        if bottomLeftCell == "":  # 0 date
+        if pd.isna(bottomLeftCell):  # 0 date
             pass
         else:
             nr = lr + 1  # row number for new row
-            gdoc.addData(
+            writer.addData(
                 "C", nr, [["=C{}+B{}".format(lr, nr)]], sheet=s, growSheet=True
             )
-
-    # find this year's entries from different sheets
-    thisYear = pd.DataFrame()
-    for s in gdfs.keys():
-        thisYear = thisYear.merge(
-            gdfs[s],
-            how="outer",
-            sort=True,
-            left_index=True,
-            right_index=True,
-            suffixes=["", ""],
-        )
-    print(thisYear.columns)
+    with transport.google():
+        writer.flush()
 
     weekSt = dates[0].strftime("%Y-%m-%d")
     weekNd = dates[1].strftime("%Y-%m-%d")
     print("week {}-{}".format(weekSt, weekNd))
 
-    thisWeek = thisYear[(thisYear.index >= weekSt) & (thisYear.index <= weekNd)].copy()
-
-    miles = {}
-    for cn in thisYear.columns:
-        if cn.startswith("Miles"):
-            # replace non numeric with 0
-            thisYear.replace({cn: r"(?![\.0-9]+)"}, {cn: 0}, regex=True, inplace=True)
-            miles[cn] = thisYear[cn].sum()
-            miles["week" + cn] = thisWeek[cn].sum()
+    index = mileage.bike_index(ledger)
+    activity["bike"] = index
+    miles = mileage.bike_totals(ledger, yearStr, (weekSt, weekNd))
+    for period, total in index.periods(day).items():
+        if period in PERIODS:
+            miles[f"{period} {mileage.BIKE_DISTANCE}"] = total
+    with transport.google():
+        sheetCache.store_result(
+            "bike", transport.modified_time(gdoc), (yearStr, dates, day), miles
+        )
     return miles
 
 
-def extractData(node):
+def webPages():
     """
-    node is a table,
-    iterate through the rows finding sunrise, sunset, then the
-    embedded table with tides
+    the WebCache main() set up, or one keeping nothing
     """
-    outS = ""
-    for i, row in enumerate(node.find_all("tr")):
-        if i in (0, 1):
-            print(row.contents[1].string, row.contents[3].string)
-            outS += row.contents[1].string + " "
-            outS += row.contents[3].string
-            outS += "\n"
-        if i == 2:
-            moonrise = row.contents[1].string + " " + row.contents[3].string
-        if i == 5:
-            for s in row.stripped_strings:
-                print(s)
-                outS += "\n" + s
-
-    return (outS, moonrise)
+    import web_cache
+
+    return webCache if webCache is not None else web_cache.WebCache(None)
 
 
 def getImage(r_s):
@@ -417,9 +448,14 @@ def getImage(r_s):
 
 
 def update(note, content):
+    """
+    write the report to the note, if it has changed; the title says when it
+    last changed
+    """
     now = datetime.datetime.now()
-    note.title = "Today: {}\nUpdated: {}".format(now.date(), now.strftime("%H:%M:%S"))
-    note.text = content
+    title = "Today: {}\nUpdated: {}".format(now.date(), now.strftime("%H:%M:%S"))
+    if keepAccess.publish(note, title, content):
+        run_metrics.add("api_calls")
 
 
 def usefulDate(today):
@@ -435,169 +471,539 @@ def usefulDate(today):
 
 
 def almanacData(today):
+    import web_sources
+
     URL = "http://southamptonweather.co.uk"
-    r_s = requests.session()
-    resp = r_s.get(URL)
 
-    soup = BeautifulSoup(resp.content, features="lxml")
+    def parse(chunks):
+        found = web_sources.parse_almanac(chunks)
+        if found[0] is None:
+            raise ValueError("no almanac table on the page")  # so not cached
+        return found
+
+    # from the almanac table extract sunrise / moonrise times, and the moon
+    # phase image; reading stops once both have been seen
     try:
-        # from the almanac table extract sunrise / moonrise times
-        for s in soup.find_all("td", "data1"):
-            # print(s)
-            if s.string:
-                m = re.match("Moonrise", s.string)  # a unique word in page
-                if m:
-                    (sun, moon) = extractData(s.parent.parent)  # the enclosing table
-                    # print("matched...")
+        (sun, moon, phase) = webPages().get(
+            "almanac", URL, parse, timeout=WEB_TIMEOUT, revalidate=webRevalidate
+        )
+    except Exception:
+        (sun, moon, phase) = (None, None, None)
 
-        p = sun
-    except:
+    if sun is None:
         p = "Failure extracting almanac info from web page"
+    else:
+        p = sun
 
-    try:
-        # find the moon phase image
-        for s in soup.find_all("img", src=re.compile("moon", flags=re.IGNORECASE)):
-            moon += " " + s["alt"]
-
-        p += "\n" + moon
-    except:
+    if moon is None:
         p += "Failure extracting moon phase text"
+    elif phase is None:
+        p += "\n" + moon
+    else:
+        p += "\n" + moon + " " + phase
 
     return p
 
 
-if printOnly:
-    pass
-else:
-    keepAccess.sync()
-    gnotes = keepAccess.find(labels=[keepAccess.findLabel("AppUniq")])
+def set_today():
+    """
+    the dates the sections report for; the daemon calls this before each
+    refresh, so that its dates move on with the days
+    """
+    global today, yesterday, text, mon, sun
+
+    today = datetime.datetime.now()
+    yesterday = today - datetime.timedelta(days=1)
+
+    # I run this early in the morning to web data for today, eg tide, moon
+    # but, the week I'm interested in for cycle and run distance is the one
+    # which contains yesterday
+    (text, mon, sun) = usefulDate(yesterday)
 
-today = datetime.datetime.now()
-yesterday = today - datetime.timedelta(days=1)
 
-p = almanacData(today)
-p += "\n\n"
+set_today()
 
-myStream = io.StringIO()
-saveStdOut = sys.stdout
 
-try:
+@run_metrics.measured("almanac")
+def almanacSection(needs):
+    return almanacData(today) + "\n\n"
+
+
+@run_metrics.measured("fx")
+def exchangeSection(needs):
     exchange = ExchangeRate().getRates()
-    sys.stdout = myStream
-    # capture this print for the note
+    out = ""
     for x in ("GBPEUR", "GBPUSD"):
-        print(
-            "{:}: {:.2f} sell?: {:.0f}%".format(
-                x,
-                exchange.rates[x]["today"],
-                exchange.rates[x]["sellRecommend"],
-            )
+        out += "{:}: {:.2f} sell?: {:.0f}%\n".format(
+            x,
+            exchange.rates[x]["today"],
+            exchange.rates[x]["sellRecommend"],
         )
-except:
-    sys.stdout = myStream
-    print("Failure getting exchange rates")
-finally:
-    sys.stdout = saveStdOut
-
-p += myStream.getvalue()
-myStream.close()
-p += "\n\n"
-
+    return out + "\n\n"
 
-# I run this early in the morning to web data for today, eg tide, moon
-# but, the week I'm interested in for cycle and run distance is the one
-# which contains yesterday
-(text, mon, sun) = usefulDate(yesterday)
 
-try:
+@run_metrics.measured("bike")
+def bikeSection(needs):
     # Do the bike stuff
     miles = bikeMileage((mon, sun))
     totalYear = 0
     totalWeek = 0
 
-    p += "{} Bike Mileage:\n".format(today.year)
+    out = "{} Bike Mileage:\n".format(today.year)
     for k in miles:
-        p += " {}: {}\n".format(k, miles[k])
+        out += " {}: {}\n".format(k, miles[k])
         if k.startswith("week"):
             totalWeek += miles[k]
-        else:
+        elif k.startswith("Miles"):
             totalYear += miles[k]
-    p += "Total for week: {} year: {}\n".format(totalWeek, totalYear)
-except:
-    p += "Failure processing bike mileage"
+    out += "Total for week: {} year: {}\n".format(totalWeek, totalYear)
+    return out
+
 
-try:
+@run_metrics.measured("run")
+def runSection(needs):
     # Do the running stuff
     miles = runMileage((mon, sun))
-    totalYear = 0
-    totalWeek = 0
 
-    p += "\n{} Running Mileage:\n".format(today.year)
+    out = "\n{} Running Mileage:\n".format(today.year)
     for k in miles:
         print(miles[k])
         if type(miles[k]) == str:
-            p += " {}: {}\n".format(k, miles[k])
+            out += " {}: {}\n".format(k, miles[k])
         else:
-            p += " {}: {:.1f}\n".format(k, miles[k])
-except Exception as e:
-    print(e)
-    print(sys.exc_info())
-    print(traceback.print_tb(sys.exc_info()[2]))
-    p += "Failure processing running mileage"
+            out += " {}: {:.1f}\n".format(k, miles[k])
+    return out
+
+
+@run_metrics.measured("load")
+def loadSection(needs):
+    import training_load
+
+    # a sport whose section used its cached result has no index, but then
+    # its load was brought up to date by the run which cached it
+    load = training_load.TrainingLoad(
+        os.path.join(sheetCache.directory, "training-load.json")
+    )
+    for sport, index in activity.items():
+        load.update(sport, index, yesterday)
+    load.save()
+    return "\n" + load.report(("run", "bike"), yesterday)
+
+
+@run_metrics.measured("week")
+def weekSection(needs):
+    (text, mon, sun) = usefulDate(today)
+    return text
 
-(text, mon, sun) = usefulDate(today)
-p += text
 
 # getImage(r_s) can't yet work out how to put in a note :-(
 
 
-def cleanOldEntry(doc):
-    (dateStr, index) = doc.outline.findFirstDate()
-    # print(f"cleanOld: found {dateStr} at index {index} of {len(doc.outline.headings)}")
-    older = datetime.datetime.now() - datetime.timedelta(hours=72)
-    while index < len(doc.outline.headings):
-        # going to loop over the dated titles
-        date = datetime.datetime.strptime(dateStr, "%a %d %b %Y")
-        if date < older:  # want to delete it
-            startPos = doc.outline.headings[index].startPos
-            if index >= len(doc.outline.headings) - 1:
-                endPos = doc.docExtent
-            else:
-                endPos = doc.outline.headings[index + 1].startPos
-            # 'Invalid requests[0].deleteContentRange: The range cannot include
-            # the newline character at the end of the segment.
-            # So, we go to endPos - 1
-            # print(f"cleanOld: delete [{startPos}, {endPos - 1}]")
-            doc.deleteText(startPos, endPos - 1)
-            index -= 1  # backup an index, because we just deleted it
+@run_metrics.measured("keep")
+def keepSection(needs):
+    run_metrics.add("api_calls")
+    # only what changed since the last run's sync
+    return keepAccess.notes("AppUniq")
+
+
+def entryRequests(title, text, startPos):
+    """
+    the Docs requests inserting a titled section at startPos, just before
+    the newline ending the paragraph there, and the length inserted
+    """
+    import doc_outline
+
+    body = text.rstrip("\n")
+    titleStart = startPos + 1
+    bodyStart = titleStart + doc_outline.length(title) + 1
+    bodyEnd = bodyStart + doc_outline.length(body) + 1
+    return ([
+        {"insertText": {"location": {"index": startPos}, "text": f"\n{title}\n{body}"}},
+        {
+            "updateParagraphStyle": {
+                "range": {"startIndex": titleStart, "endIndex": bodyStart},
+                "paragraphStyle": {"namedStyleType": ENTRY_HEADING},
+                "fields": "namedStyleType",
+            }
+        },
+        {
+            "updateParagraphStyle": {
+                "range": {"startIndex": bodyStart, "endIndex": bodyEnd},
+                "paragraphStyle": {"namedStyleType": "NORMAL_TEXT"},
+                "fields": "namedStyleType",
+            }
+        },
+    ], bodyEnd - 1 - startPos)
+
+
+def reportText(needs):
+    """
+    the report, from the text of each section in needs
+    """
+    return "".join(needs.get(name, "") for name in REPORT)
+
+
+@run_metrics.measured("publish")
+def publishSection(needs):
+    p = reportText(needs)
+    if sink == "print":
+        print(p)
+    elif sink == "doc":
+        print(p)
+        publishDoc(p)
+    else:
+        for i, n in enumerate(needs["keep"]):
+            if i == 0:
+                update(n, p)
+                # for c in n.collaborators.all():
+                #    print(c)
+    return p
+
+
+def publishDoc(p):
+    """
+    put today's entry at the top of the daily doc, deleting the old ones
+    (and an earlier one for today), in one call worked out from outOutline.
+    If the doc has been edited since the outline was taken the call is
+    refused, so the doc is read again and the call worked out again, once
+    """
+    global outGdoc, outOutline, outRevision
+    import doc_outline
+
+    midnight = datetime.datetime(today.year, today.month, today.day)
+    title = today.strftime("Update for " + doc_outline.DATE_FORMAT)
+    for attempt in (1, 2):
+        first = outOutline.first()
+        if first is None:
+            startPos = outOutline.extent - 1  # no dated sections, append
         else:
-            # skip over the recent one we found and try again
-            # print(f"cleanOld: skipping...")
-            pass
+            # first is the start of the section title line,
+            # I want to backup before the preceding newline
+            startPos = first - 1
+        # the old sections all come after startPos, deleting them (last
+        # first) before inserting leaves every position valid, so the
+        # whole edit is one atomic call however many days have built up.
+        # An earlier update for today is replaced, rather than added to
+        stale = sorted(
+            set(outOutline.older(datetime.datetime.now() - datetime.timedelta(hours=72)))
+            | set(outOutline.between(midnight, midnight + datetime.timedelta(days=1))),
+            reverse=True,
+        )
+        requests = [
+            {"deleteContentRange": {"range": {"startIndex": start, "endIndex": end}}}
+            for (start, end) in stale
+        ]
+        (entry, size) = entryRequests(title, p, startPos)
+        requests += entry
         try:
-            (dateStr, index) = doc.outline.findFirstDate(after=index)
-            # print(f"cleanOld: found {dateStr} at index {index} of {len(doc.outline.headings)}")
-        except Exception as e:
-            return  # couldn't parse out a date so leave deletion
-
-
-if printOnly:
-    print(p)
-    #                      %a = Wed, %d = 27, %b = May, %Y = 2020
-    (dateStr, index)  = outGdoc.outline.findFirstDate()
-    # findFirstDate returns the start of the section title line,
-    # I want to backup before the preceding newline
-    startPos = outGdoc.outline.headings[index].startPos - 1
-    outGdoc.insertTextWithHeader(today.strftime("Update for %a %d %b %Y"), p, startPos)
-
-    cleanOldEntry(outGdoc)
+            with transport.google():
+                outRevision = transport.docs_batch_update(outGdoc, requests, outRevision)
+            break
+        except transport.RevisionMismatch:
+            if attempt == 2:
+                raise
+            print("the daily doc has been edited, reading it again")
+            with transport.google():
+                (outGdoc, outOutline, outRevision) = open_daily_doc(outGdoc.id, reload=True)
+    # and the outline follows the edits, rather than parsing the doc again
+    for (start, end) in stale:
+        outOutline.deleted(start, end)
+    outOutline.inserted(startPos, size, title=startPos + 1, date=midnight)
     # outGdoc.appendToDoc(today.strftime("Update for %a %d %b %Y"))
     # outGdoc.appendToDoc(p)
-else:
-    for i, n in enumerate(gnotes):
-        if i == 0:
-            update(n, p)
-            # for c in n.collaborators.all():
-            #    print(c)
-
-    keepAccess.sync()
+
+
+# the training load waits for bike and run, publishing for everything, the
+# rest all run at once, each with a deadline so one slow web site can't hold
+# up the mileage
+SECTIONS = {
+    "almanac": Section("almanac", almanacSection, timeout=WEB_TIMEOUT * 2,
+                       failure="Failure extracting almanac info from web page\n\n"),
+    "fx": Section("fx", exchangeSection, timeout=WEB_TIMEOUT * 2,
+                  failure="Failure getting exchange rates\n\n\n"),
+    "bike": Section("bike", bikeSection, timeout=300,
+                    failure="Failure processing bike mileage"),
+    "run": Section("run", runSection, timeout=300,
+                   failure="Failure processing running mileage"),
+    "load": Section("load", loadSection, after=("bike", "run"), timeout=60,
+                    failure="\nFailure working out the training load\n"),
+    "week": Section("week", weekSection, timeout=10, failure=""),
+}
+
+
+def section_list(text):
+    """
+    argparse type for --sections: a comma separated list of report sections
+    """
+    names = [name.strip() for name in text.split(",") if name.strip()]
+    unknown = [name for name in names if name not in REPORT]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown section(s) {', '.join(unknown)}, choose from {', '.join(REPORT)}"
+        )
+    return names
+
+
+def distance_class_list(text):
+    """
+    argparse type for --distance-classes, as mileage.distance_class_list;
+    mileage (and pandas) are only imported when the option is given
+    """
+    import mileage
+
+    return mileage.distance_class_list(text)
+
+
+def parse_args(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Update useful info in daily gDoc")
+    # arg_parser.add_argument("filename", help="Filename to parse")
+    arg_parser.add_argument("-d", "--debug", action="store_true", help="turn on debugging")
+    arg_parser.add_argument(
+        "--sections",
+        type=section_list,
+        default=list(REPORT),
+        metavar="LIST",
+        help=f"comma separated sections of the report to build (default {','.join(REPORT)})",
+    )
+    arg_parser.add_argument(
+        "--sink",
+        choices=SINKS,
+        default="keep",
+        help="where the report goes: the Keep note (falling back to the doc if "
+        "the Keep login fails), the daily doc, or just printed",
+    )
+    arg_parser.add_argument(
+        "--lean",
+        action="store_true",
+        help="once loaded, hold the sheets as float32 and categoricals to save memory "
+        "(eg on the Pi); loading itself takes as much as ever",
+    )
+    arg_parser.add_argument(
+        "--distance-classes",
+        type=distance_class_list,
+        default=None,
+        metavar="LIST",
+        help="the runs to rank, as name=km,... a run of at least km counts "
+        "(default 5k=5,10k=10,Half Marathon=21.1,Marathon=42.2)",
+    )
+    arg_parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running, refreshing each section when it's due and publishing "
+        "in place; SIGUSR1 or --refresh asks for a refresh now",
+    )
+    arg_parser.add_argument(
+        "--refresh",
+        nargs="?",
+        type=section_list,
+        const=[],
+        metavar="LIST",
+        help="ask the running daemon to refresh these sections (default all) and exit",
+    )
+    cassette_args = arg_parser.add_mutually_exclusive_group()
+    cassette_args.add_argument(
+        "--record", metavar="DIR", help="save every web response and sheet in DIR"
+    )
+    cassette_args.add_argument(
+        "--replay", metavar="DIR", help="build the report from DIR, no network, print only"
+    )
+    return arg_parser.parse_args(argv)
+
+
+def keep_login():
+    """
+    the logged in Keep client, as a KeepSession resuming the last run's,
+    or None if the login fails
+    """
+    import gkeepapi
+    import gkeepSecrets
+    import keep_session
+
+    session = keep_session.KeepSession(gkeepapi.Keep())
+    try:
+        session.login(gkeepSecrets.mySecrets.app_user, gkeepSecrets.mySecrets.app_pw)
+    except Exception as err:
+        print(err)
+        return None
+    return session
+
+
+def daily_doc(debug):
+    """
+    the daily google doc, with its outline parsed, its DateOutline and the
+    revision they are of
+    """
+    import gkeepSecrets
+
+    # keepAccess.load(access.credentials)
+    # outGdoc = gf.gdriveFile.gdfFromId(gkeepSecrets.mySecrets.TESTDOCID, access, docType='document')
+    if debug:
+        return open_daily_doc(gkeepSecrets.mySecrets.TESTDOCID)
+    return open_daily_doc(gkeepSecrets.mySecrets.TODAYDOCID)
+
+
+def open_daily_doc(doc_id, reload=False):
+    """
+    (doc, DateOutline, revision) of a google doc; the revision is taken
+    first, so an edit made while the doc is read makes it older than the
+    outline, and the first update is refused rather than misplaced
+    """
+    import gdocHelper as gh
+    import doc_outline
+
+    revision = transport.doc_revision(doc_id)
+    doc = transport.document(doc_id, reload=reload)
+    gh.GdocHelper.assertIsDoc(doc)  # upgrade to a gdocHelper object
+                                    # also has the side-effect of parsing the
+                                    # document to create an 'outline' index
+    return (doc, doc_outline.DateOutline.from_doc(doc), revision)
+
+
+def main(argv=None):
+    global sheetCache, lean, distanceClasses, keepAccess, outGdoc, outOutline, sink
+    global outRevision, webCache
+    global LOGGER_LEVEL
+
+    args = parse_args(argv)
+    if args.refresh is not None:
+        import refresh_scheduler
+
+        try:
+            print(refresh_scheduler.send(SOCKET, args.refresh))
+        except (FileNotFoundError, ConnectionRefusedError):
+            print(f"no daemon listening on {SOCKET}")
+        return None
+    if args.debug:
+        LOGGER_LEVEL = logging.DEBUG
+    logging.basicConfig(level=LOGGER_LEVEL)
+    lean = args.lean
+    run = run_metrics.start()
+
+    # when replaying nothing is published, the report is just printed
+    sink = "print" if args.replay else args.sink
+    cassetteDir = args.record or args.replay
+    if cassetteDir:
+        import cassette
+
+        transport.use_cassette(
+            cassette.RECORD if args.record else cassette.REPLAY, cassetteDir
+        )
+    if {"bike", "run", "load"} & set(args.sections):
+        import sheet_cache
+
+        if cassetteDir:
+            sheetCache = sheet_cache.SheetCache(os.path.join(cassetteDir, "sheets"))
+        else:
+            sheetCache = sheet_cache.SheetCache()
+    if {"almanac", "fx"} & set(args.sections):
+        import web_cache
+
+        # a cassette holds the pages themselves, so nothing is cached beside it
+        webCache = web_cache.WebCache(None if cassetteDir else web_cache.WEB_DIR)
+    if "run" in args.sections:
+        import mileage
+
+        distanceClasses = args.distance_classes or mileage.DISTANCE_CLASSES
+
+    if sink == "keep":
+        keepAccess = keep_login()
+        if keepAccess is None:
+            print("gKeep login failure, using print only")
+            sink = "doc"
+    if sink == "doc":
+        (outGdoc, outOutline, outRevision) = daily_doc(args.debug)
+
+    if args.daemon:
+        return serve(args.sections)
+    results = run_sections(section_plan(args.sections), max_workers=len(args.sections) + 2)
+    # a replay is for profiling, keep its metrics apart from the real runs'
+    if args.replay:
+        run.save(os.path.join(args.replay, "metrics.jsonl"))
+    else:
+        run.save()
+    return results
+
+
+def section_plan(names, publish=publishSection):
+    """
+    the Sections building the named report sections, then publishing them
+    """
+    sections = []
+    for name in REPORT:
+        if name in names:
+            s = SECTIONS[name]
+            # only wait for the sections which are running
+            after = [a for a in s.after if a in names]
+            sections.append(Section(s.name, s.func, after, s.timeout, s.failure))
+    if sink == "keep":
+        sections.append(Section("keep", keepSection, timeout=300, failure=[]))
+    sections.append(
+        Section("publish", publish,
+                after=[s.name for s in sections], timeout=300)
+    )
+    return sections
+
+
+def serve(names):
+    """
+    the daemon: keep the logins, clients, caches and doc outline of this
+    process, refreshing each section when it's due (or asked for) and
+    publishing the report in place after each refresh. Runs until killed
+    """
+    global webRevalidate
+    import signal
+    import refresh_scheduler
+
+    # a page is refetched whenever its section is refreshed, scheduled or
+    # asked for, rather than served from a cached copy still within its TTL
+    webRevalidate = True
+    scheduler = refresh_scheduler.Scheduler(
+        {n: every for n, every in refresh_scheduler.REFRESH.items() if n in names}
+    )
+    trigger = refresh_scheduler.Trigger()
+    trigger.listen_signal()
+    # stopped by SIGTERM as by ^C, so the socket is removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    trigger.serve(SOCKET)
+    print(f"serving on {SOCKET}, pid {os.getpid()}")
+    report = {}  # the latest text of every section
+    published = [None]  # (day, report) last published
+
+    def publish(needs):
+        """
+        publish the report unless it's what was last published today; the
+        mileage is checked every few minutes and mostly hasn't changed
+        """
+        merged = {**report, **needs}
+        latest = (today.date(), reportText(merged))
+        if latest == published[0]:
+            print("report unchanged, not published")
+            return latest[1]
+        p = publishSection(merged)
+        published[0] = latest
+        return p
+
+    try:
+        requested = set()
+        while True:
+            now = time.time()
+            due = scheduler.due(now)
+            due |= set(names) if "all" in requested else requested & set(names)
+            if {"bike", "run"} & due and "load" in names:
+                due.add("load")  # the load follows the mileage
+            if due:
+                set_today()
+                run = run_metrics.start()
+                results = run_sections(section_plan(due, publish), max_workers=len(due) + 2)
+                report.update({n: results[n] for n in due})
+                scheduler.done(due, now)
+                run.save()
+            requested = trigger.wait(scheduler.wait(time.time()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        trigger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+the parsed results of the web pages the report scrapes, kept on disk so an
+unchanged page is neither downloaded nor parsed again
+
+each source has a time to live, after which its entry is revalidated with
+the ETag / Last-Modified the page was served with (a 304 costs no body and
+no parse), and a further time for which a stale entry is still served
+straight away while it is revalidated in the background:
+    cache = WebCache()
+    rates = cache.get("fx", url, parse_rates)
+parse is given the response body as chunks, as web_sources' parsers take
+it, and must return something json can store; if it raises nothing is
+stored. Entries are cache/web/<source>.json
+
+revalidate=True skips the time to live: the entry is revalidated now (still
+only a 304 if the page hasn't changed), as when the daemon refreshes a
+source on its own schedule or is asked to
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import refresh_scheduler
+import transport
+import web_sources
+
+logger = logging.getLogger(__name__)
+
+WEB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "web")
+DAILY = refresh_scheduler.DAILY
+# (seconds fresh, seconds served stale while revalidating, or DAILY for up
+# to the midnight after the fetch) of each source. The BoE table changes
+# once a business day, so a weekend's rates are still worth showing at
+# once; the almanac is for the day, so it is neither fresh nor served
+# stale after midnight, and yesterday's is fetched again first
+SOURCES = {
+    "fx": (6 * 3600, 4 * 86400),
+    "almanac": (3 * 3600, DAILY),
+}
+
+
+def _until(fetched, seconds):
+    if seconds == DAILY:
+        return refresh_scheduler.next_midnight(fetched)
+    return fetched + seconds
+
+
+def expiry(fetched, fresh, stale):
+    """
+    (until when an entry fetched then is fresh, until when it may be served
+    stale); a source kept for the day (stale DAILY) is fresh no later than
+    midnight either
+    """
+    fresh_until = _until(fetched, fresh)
+    if stale == DAILY:
+        fresh_until = min(fresh_until, refresh_scheduler.next_midnight(fetched))
+    return (fresh_until, _until(fetched, stale))
+
+
+class WebCache:
+    """
+    :param directory - where the entries are kept, None to keep nothing
+    (every get fetches), as when recording or replaying a cassette
+    :param sources - {source: (fresh, stale)} as SOURCES
+    """
+
+    def __init__(self, directory=WEB_DIR, sources=SOURCES):
+        self.directory = directory
+        self.sources = dict(sources)
+        self.lock = threading.Lock()
+        self.revalidating = {}  # source -> its background Thread
+
+    def _path(self, source):
+        return os.path.join(self.directory, source + ".json")
+
+    def _read(self, source, url):
+        try:
+            with open(self._path(source)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # a different page (eg a changed url) starts again
+        return entry if entry.get("url") == url else None
+
+    def _write(self, source, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self._path(source)}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._path(source))
+
+    def get(self, source, url, parse, headers=None, timeout=30, now=None, revalidate=False):
+        """
+        the parsed page: from the entry while it is fresh, or stale and
+        within its time to be served stale (revalidated in the background),
+        else (or if revalidate) fetched now. A fetch which fails raises,
+        unless there is an entry to fall back on
+        """
+        if self.directory is None:
+            return self._fetch(source, url, parse, headers, timeout, None)["value"]
+        now = time.time() if now is None else now
+        (fresh, stale) = self.sources.get(source, (0, 0))
+        entry = self._read(source, url)
+        if entry is not None and not revalidate:
+            (fresh_until, stale_until) = expiry(entry["fetched"], fresh, stale)
+            if now < fresh_until:
+                logger.info(f"{source} from the web cache")
+                return entry["value"]
+            if now < stale_until:
+                logger.info(f"{source} from the web cache, revalidating")
+                self._revalidate(source, url, parse, headers, timeout, entry)
+                return entry["value"]
+        try:
+            return self._fetch(source, url, parse, headers, timeout, entry)["value"]
+        except Exception as err:
+            if entry is None:
+                raise
+            logger.warning(f"{source} refetch failed ({err}), using the cached copy")
+            return entry["value"]
+
+    def _revalidate(self, source, url, parse, headers, timeout, entry):
+        """
+        refetch in a thread, unless one is already at it. The thread isn't a
+        daemon, so a one-off run waits for it to store the entry before exiting
+        """
+
+        def run():
+            try:
+                self._fetch(source, url, parse, headers, timeout, entry)
+            except Exception as err:
+                logger.warning(f"{source} revalidation failed: {err}")
+            finally:
+                with self.lock:
+                    del self.revalidating[source]
+
+        with self.lock:
+            if source in self.revalidating:
+                return
+            thread = threading.Thread(target=run, name=f"revalidate-{source}")
+            self.revalidating[source] = thread
+        thread.start()
+
+    def _fetch(self, source, url, parse, headers, timeout, entry):
+        """
+        the page, conditionally on the entry's validators if there is one;
+        the new entry is stored (unless nothing is kept) and returned
+        """
+        send_headers = dict(headers or {})
+        if entry is not None:
+            if entry.get("etag"):
+                send_headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                send_headers["If-Modified-Since"] = entry["last_modified"]
+        fetched = time.time()
+        r = transport.http_session().get(
+            url, headers=send_headers, timeout=timeout, stream=True
+        )
+        print(f"<-Get({source}):", r.status_code)
+        with r:
+            if r.status_code == 304 and entry is not None:
+                entry = dict(entry, fetched=fetched)
+            else:
+                r.raise_for_status()
+                entry = {
+                    "url": url,
+                    "fetched": fetched,
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                    "value": parse(r.iter_content(web_sources.CHUNK)),
+                }
+        if self.directory is not None:
+            self._write(source, entry)
+        return entry
@@ -0,0 +1,155 @@
+"""
+targeted extraction from the web pages the daily update scrapes
+
+rather than building a whole BeautifulSoup tree and then searching it, the
+page is fed to lxml's incremental parser as it downloads, each element is
+tested as it closes, and reading stops as soon as everything wanted has
+been seen
+"""
+import re
+
+from lxml import etree
+
+CHUNK = 16 * 1024  # bytes read from the response at a time
+
+MOONRISE = re.compile("Moonrise")  # a unique word in the almanac table
+MOON = re.compile("moon", flags=re.IGNORECASE)
+
+
+def scan(chunks, wanted):
+    """
+    feed the chunks of a page to the parser until every test in wanted has
+    matched an element. A test is called with each element as it closes and
+    returns None to let it pass; a test with a start method is also given
+    each element as it opens (when only its tag and attributes are known).
+    returns {name: first value each test returned}
+    """
+    found = {}
+
+    def test(events):
+        for event, element in events:
+            for name, match in wanted.items():
+                if name in found:
+                    continue
+                if event == "start":
+                    if hasattr(match, "start"):
+                        match.start(element)
+                    continue
+                value = match(element)
+                if value is not None:
+                    found[name] = value
+        return len(found) == len(wanted)
+
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    for chunk in chunks:
+        parser.feed(chunk)
+        if test(parser.read_events()):
+            return found
+    parser.close()
+    test(parser.read_events())
+    return found
+
+
+def text(element):
+    """
+    all the text in an element, like bs4's .text
+    """
+    return "".join(element.itertext())
+
+
+def cells(row):
+    """
+    the child elements of a table row, ie the cells
+    """
+    return [c for c in row if isinstance(c.tag, str)]
+
+
+def almanac_table(element):
+    """
+    the table holding a td.data1 starting "Moonrise", whether or not its rows
+    are in a tbody; the innermost such table closes, so matches, first
+    """
+    if element.tag != "table":
+        return None
+    for td in element.iter("td"):
+        if "data1" in (td.get("class") or "").split() and MOONRISE.match(text(td)):
+            return element
+    return None
+
+
+def moon_phase(element):
+    """
+    the alt text of the moon phase image
+    """
+    if element.tag == "img" and MOON.search(element.get("src") or ""):
+        return element.get("alt")
+    return None
+
+
+def extract_almanac(table):
+    """
+    iterate through the rows of the almanac table finding sunrise, sunset,
+    then the embedded table with tides
+    returns (text, moonrise)
+    """
+    outS = ""
+    moonrise = None
+    for i, row in enumerate(table.iter("tr")):
+        c = cells(row)
+        if i in (0, 1):
+            print(text(c[0]), text(c[1]))
+            outS += text(c[0]) + " "
+            outS += text(c[1])
+            outS += "\n"
+        if i == 2:
+            moonrise = text(c[0]) + " " + text(c[1])
+        if i == 5:
+            for s in (s.strip() for s in row.itertext()):
+                if s:
+                    print(s)
+                    outS += "\n" + s
+    return (outS, moonrise)
+
+
+def parse_almanac(chunks):
+    """
+    (sun and tide text, moonrise), (moon phase) from the southamptonweather
+    page; either may be None if it wasn't found
+    """
+    found = scan(chunks, {"table": almanac_table, "moon": moon_phase})
+    if "table" in found:
+        (sun, moonrise) = extract_almanac(found["table"])
+    else:
+        (sun, moonrise) = (None, None)
+    return (sun, moonrise, found.get("moon"))
+
+
+class FirstTable:
+    """
+    the first table to open on the page, once it has closed; a table nested
+    in it closes first, so this can't go by the first table to close
+    """
+
+    def __init__(self):
+        self.table = None
+
+    def start(self, element):
+        if self.table is None and element.tag == "table":
+            self.table = element
+
+    def __call__(self, element):
+        return element if element is self.table else None
+
+
+def rate_rows(chunks):
+    """
+    the rows of the first table on the BoE rates page, as a list of
+    (cell texts, row text); header rows have no cells
+    """
+    found = scan(chunks, {"table": FirstTable()})
+    if "table" not in found:
+        return []
+    return [
+        ([text(td) for td in row.iter("td")], text(row))
+        for row in found["table"].iter("tr")
+    ]
@@ -0,0 +1,152 @@
+"""
+write-behind buffering of spreadsheet writes
+
+instead of a sheets API call per addData, the writes for a workbook are
+queued during the run and flush() sends the cells whose value actually
+changed in a single values batchUpdate. Writes which may fall beyond a
+sheet's grid (growSheet=True) first have the grids that are too small
+extended, all in one batchUpdate
+"""
+import logging
+import re
+
+import transport
+
+logger = logging.getLogger(__name__)
+
+
+def column_letters(col) -> str:
+    """
+    1 -> A, 27 -> AA; letters are passed through
+    """
+    if isinstance(col, str):
+        return col.upper()
+    letters = ""
+    while col > 0:
+        (col, rem) = divmod(col - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+def column_number(col) -> int:
+    """
+    A -> 1, AA -> 27; numbers are passed through
+    """
+    if not isinstance(col, str):
+        return int(col)
+    number = 0
+    for c in col.upper():
+        number = number * 26 + ord(c) - ord("A") + 1
+    return number
+
+
+class WriteBuffer:
+    """
+    the pending writes for one workbook
+    :param gdoc - the gdriveFile of the workbook
+    """
+
+    def __init__(self, gdoc):
+        self.gdoc = gdoc
+        self.cells = {}  # (sheet, row, col) -> value to write
+        self.known = {}  # (sheet, row, col) -> value the sheet already holds
+        self.grow = set()  # cells which may be beyond the sheet's grid
+
+    def know(self, sheet, frame, first_row=2):
+        """
+        record what the sheet holds, from the DataFrame it was loaded into,
+        so that writing the same value again costs nothing.
+        first_row is the sheet row of the frame's first row (2 after a title)
+        """
+        for c, values in enumerate(frame.astype(str).T.values, start=1):
+            for r, value in enumerate(values, start=first_row):
+                self.known[(sheet, r, c)] = value.strip()
+
+    def addData(self, col, row, data, sheet, arrayRepresents="ROWS", growSheet=False):
+        """
+        queue a write, taking the same arguments as gdriveFile.addData:
+        data is a list of rows, or a single column of values if
+        arrayRepresents="COLUMN"
+        """
+        if arrayRepresents == "COLUMN":
+            data = [[value] for value in data]
+        c0 = column_number(col)
+        for r, values in enumerate(data, start=row):
+            for c, value in enumerate(values, start=c0):
+                self.cells[(sheet, r, c)] = value
+                if growSheet:
+                    self.grow.add((sheet, r, c))
+
+    def dirty(self):
+        """
+        the queued cells whose value differs from what the sheet holds
+        (leading and trailing whitespace doesn't count, the sheet drops it)
+        """
+        return {
+            k: v
+            for k, v in self.cells.items()
+            if self.known.get(k) != str(v).strip()
+        }
+
+    def grow_requests(self, cells, grids):
+        """
+        the appendDimension requests extending each sheet's grid to take
+        the cells, none for a sheet already big enough
+        :param grids - {sheet: (sheetId, rowCount, columnCount)}
+        """
+        wanted = {}
+        for (sheet, r, c) in cells:
+            (rows, cols) = wanted.get(sheet, (0, 0))
+            wanted[sheet] = (max(rows, r), max(cols, c))
+        requests = []
+        for sheet, (rows, cols) in sorted(wanted.items()):
+            if sheet not in grids:
+                continue
+            (sheet_id, row_count, column_count) = grids[sheet]
+            short = (("ROWS", rows, row_count), ("COLUMNS", cols, column_count))
+            for (dimension, need, have) in short:
+                if need > have:
+                    requests.append(
+                        {
+                            "appendDimension": {
+                                "sheetId": sheet_id,
+                                "dimension": dimension,
+                                "length": need - have,
+                            }
+                        }
+                    )
+        return requests
+
+    def flush(self):
+        """
+        send the changed cells, all in one batchUpdate, after growing (in
+        one more) any sheet too small for them. Call with
+        transport.google() held
+        """
+        dirty = self.dirty()
+        logger.info(f"{len(dirty)} of {len(self.cells)} queued cells changed")
+        grow = [k for k in dirty if k in self.grow]
+        if grow:
+            requests = self.grow_requests(grow, transport.sheet_grids(self.gdoc))
+            if requests:
+                transport.sheets_batch_update(self.gdoc, requests)
+        if dirty:
+            transport.values_batch_update(
+                self.gdoc,
+                [
+                    {"range": self.a1(*k), "values": [[v]]}
+                    for k, v in sorted(dirty.items())
+                ],
+            )
+        for k, v in self.cells.items():
+            self.known[k] = str(v).strip()
+        self.cells = {}
+        self.grow = set()
+
+    @staticmethod
+    def a1(sheet, row, col):
+        """
+        'sheet name'!B7
+        """
+        quoted = re.sub("'", "''", sheet)
+        return f"'{quoted}'!{column_letters(col)}{row}"